@@ -0,0 +1,95 @@
+"""
+Benchmark of request scheduling during a raid: one channel sends 100x the requests of 200 other channels.
+Compares a single FIFO queue with per-channel deficit round-robin, reporting the queue wait of the small channels.
+
+Usage: python -m benchmarks.fair_scheduling [--duration 10] [--small-rate 0.5] [--workers 6] [--service-ms 50]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from ronnia.utils.metrics import Histogram
+from ronnia.utils.scheduler import FairScheduler
+
+RAID_CHANNEL = "raid"
+
+
+def generate_arrivals(duration: float, small_channels: int, small_rate: float, raid_multiplier: float,
+                      seed: int) -> list[tuple[float, str]]:
+    """Poisson arrival times of every channel, sorted by time."""
+    rng = random.Random(seed)
+    rates = {f"small_{i}": small_rate for i in range(small_channels)}
+    rates[RAID_CHANNEL] = small_rate * raid_multiplier
+    arrivals = []
+    for channel, rate in rates.items():
+        arrival_time = rng.expovariate(rate)
+        while arrival_time < duration:
+            arrivals.append((arrival_time, channel))
+            arrival_time += rng.expovariate(rate)
+    return sorted(arrivals)
+
+
+async def run_scenario(arrivals: list[tuple[float, str]], fair: bool, workers: int, service_ms: float,
+                       max_queue_size: int) -> dict:
+    latencies = {"raid": Histogram(), "small": Histogram()}
+
+    async def handler(item: tuple[str, float]):
+        channel, submitted_at = item
+        await asyncio.sleep(service_ms / 1000)
+        group = "raid" if channel == RAID_CHANNEL else "small"
+        latencies[group].observe((time.monotonic() - submitted_at) * 1000)
+
+    # With a single key, the scheduler is a plain FIFO queue shared by every channel
+    scheduler = FairScheduler(handler, workers=workers,
+                              max_queue_size=max_queue_size if fair else len(arrivals))
+    runner = asyncio.create_task(scheduler.run())
+
+    start = time.monotonic()
+    for arrival_time, channel in arrivals:
+        delay = start + arrival_time - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        scheduler.submit(channel if fair else "fifo", (channel, time.monotonic()))
+
+    while len(scheduler) or latencies["raid"].count + latencies["small"].count + scheduler.dropped < len(arrivals):
+        await asyncio.sleep(0.01)
+    runner.cancel()
+
+    return {group: histogram.snapshot() for group, histogram in latencies.items()} | {"dropped": scheduler.dropped}
+
+
+def print_result(name: str, result: dict):
+    print(f"{name}:")
+    for group in ("small", "raid"):
+        snapshot = result[group]
+        print(f"  {group:>5} channels: {snapshot['count']:6d} requests, "
+              f"p50 {snapshot['p50']:8.1f} ms, p99 {snapshot['p99']:8.1f} ms, max {snapshot['max']:8.1f} ms")
+    print(f"  dropped: {result['dropped']}")
+
+
+async def main(args: argparse.Namespace):
+    arrivals = generate_arrivals(args.duration, args.small_channels, args.small_rate, args.raid_multiplier,
+                                 args.seed)
+    print(f"{len(arrivals)} requests in {args.duration}s, "
+          f"capacity {args.workers / args.service_ms * 1000:.0f} requests/s")
+    print_result("FIFO", await run_scenario(arrivals, False, args.workers, args.service_ms, args.max_queue_size))
+    print_result("Deficit round-robin", await run_scenario(arrivals, True, args.workers, args.service_ms,
+                                                          args.max_queue_size))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark fair scheduling of requests during a raid.")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds of generated traffic")
+    parser.add_argument("--small-channels", type=int, default=200, help="Number of small channels")
+    parser.add_argument("--small-rate", type=float, default=0.5, help="Requests per second of a small channel")
+    parser.add_argument("--raid-multiplier", type=float, default=100, help="Traffic of the raid channel")
+    parser.add_argument("--workers", type=int, default=6, help="Concurrent request workers")
+    parser.add_argument("--service-ms", type=float, default=50, help="Processing time of a request")
+    parser.add_argument("--max-queue-size", type=int, default=50, help="Queue size per channel")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
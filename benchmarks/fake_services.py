@@ -0,0 +1,364 @@
+"""
+Local stand-ins for the services the bot talks to, for soak and capacity tests of the whole bot.
+
+FakeTwitch: Twitch IRC over websocket, sending PRIVMSG traffic to every joined channel, the OAuth token endpoint,
+            and Helix /streams and /users, with live streams churning between polls.
+FakeOsu:    osu! api OAuth token, beatmaps, beatmapsets, beatmap attributes and chat/new endpoints,
+            with configurable latency and 429 responses.
+
+Point the bot at them with the environment variables printed by `python -m benchmarks.fake_services`.
+twitchio has no setting for its IRC host and token validation, see benchmarks/soak.py for how those are redirected.
+
+Usage: python -m benchmarks.fake_services [--channels 2000] [--messages-per-second 200]
+"""
+import argparse
+import asyncio
+import random
+import socket
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+from aiohttp import WSMsgType, web
+
+FIRST_TWITCH_ID = 100_000_000
+FIRST_BEATMAP_ID = 1_000_000
+OSU_GAME_ID = "21465"
+
+
+def bind_socket(host: str = "127.0.0.1") -> socket.socket:
+    """Binds a socket to a free port, so the URL of a fake service is known before it starts."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, 0))
+    return sock
+
+
+async def start_app(app: web.Application, sock: socket.socket) -> web.AppRunner:
+    runner = web.AppRunner(app, handle_signals=False, access_log=None)
+    await runner.setup()
+    await web.SockSite(runner, sock).start()
+    return runner
+
+
+def get_url(sock: socket.socket, scheme: str = "http") -> str:
+    host, port = sock.getsockname()[:2]
+    return f"{scheme}://{host}:{port}"
+
+
+class FakeTwitch:
+    """
+    Twitch IRC, OAuth and Helix for `channels` channels named soak_channel_<i>, or for channel_names.
+    live_ratio of the channels are live, and every churn_seconds churn_ratio of the channels flip their status.
+    Joined channels receive messages_per_second PRIVMSGs in total, link_ratio of them with a beatmap link.
+    """
+
+    def __init__(self, channels: int = 2000, live_ratio: float = 0.5, churn_ratio: float = 0.05,
+                 churn_seconds: float = 60, messages_per_second: float = 200, link_ratio: float = 0.3,
+                 chatters: int = 20_000, beatmaps: int = 5000, seed: Optional[int] = None,
+                 channel_names: Optional[list[str]] = None):
+        self.random = random.Random(seed)
+        if channel_names is None:
+            channel_names = [f"soak_channel_{i}" for i in range(channels)]
+        self.channels = {FIRST_TWITCH_ID + i: name for i, name in enumerate(channel_names)}
+        self.channel_ids = {name: twitch_id for twitch_id, name in self.channels.items()}
+        self.live = set(self.random.sample(sorted(self.channels), int(len(self.channels) * live_ratio)))
+        self.churn_ratio = churn_ratio
+        self.churn_seconds = churn_seconds
+        self.messages_per_second = messages_per_second
+        self.link_ratio = link_ratio
+        self.chatters = chatters
+        self.beatmaps = beatmaps
+
+        # Joined channel -> websocket of the IRC connection that joined it
+        self.joined: dict[str, web.WebSocketResponse] = {}
+        self.counters = Counter()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/irc", self.irc)
+        app.router.add_post("/oauth2/token", self.token)
+        app.router.add_get("/helix/streams", self.streams)
+        app.router.add_get("/helix/users", self.users)
+        return app
+
+    async def token(self, request: web.Request) -> web.Response:
+        self.counters["oauth"] += 1
+        return web.json_response({"access_token": uuid.uuid4().hex, "expires_in": 3600, "token_type": "bearer"})
+
+    async def streams(self, request: web.Request) -> web.Response:
+        self.counters["helix.streams"] += 1
+        user_ids = [int(user_id) for user_id in request.query.getall("user_id", [])]
+        data = [{"id": str(user_id), "user_id": str(user_id), "user_login": self.channels[user_id],
+                 "user_name": self.channels[user_id], "game_id": OSU_GAME_ID, "game_name": "osu!", "type": "live",
+                 "title": "soak test", "viewer_count": self.random.randint(1, 5000)}
+                for user_id in user_ids if user_id in self.live]
+        return web.json_response({"data": data, "pagination": {}})
+
+    async def users(self, request: web.Request) -> web.Response:
+        self.counters["helix.users"] += 1
+        data = [{"id": str(self.channel_ids[login]), "login": login, "display_name": login}
+                for login in request.query.getall("login", []) if login in self.channel_ids]
+        return web.json_response({"data": data})
+
+    def churn(self):
+        """Flips the live status of churn_ratio of the channels."""
+        for twitch_id in self.random.sample(sorted(self.channels), int(len(self.channels) * self.churn_ratio)):
+            self.live.symmetric_difference_update({twitch_id})
+
+    async def irc(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.counters["irc.connections"] += 1
+        nick = "justinfan"
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                for line in filter(None, (line.strip() for line in msg.data.split("\r\n"))):
+                    command, _, argument = line.partition(" ")
+                    if command == "NICK":
+                        nick = argument.strip().lower()
+                        await ws.send_str("\r\n".join(
+                            f":tmi.twitch.tv {code} {nick} :{text}" for code, text in
+                            (("001", "Welcome, GLHF!"), ("002", "Your host is tmi.twitch.tv"),
+                             ("003", "This server is rather new"), ("004", "-"), ("375", "-"),
+                             ("372", "You are in a maze of twisty passages, all alike."), ("376", ">"))))
+                    elif command == "CAP":
+                        await ws.send_str(f":tmi.twitch.tv CAP * ACK {argument.removeprefix('REQ ')}")
+                    elif command == "JOIN":
+                        await self._join(ws, nick, argument)
+                    elif command == "PART":
+                        for channel in argument.split(","):
+                            channel = channel.strip().lstrip("#")
+                            self.joined.pop(channel, None)
+                            self.counters["irc.parts"] += 1
+                            await ws.send_str(f":{nick}!{nick}@{nick}.tmi.twitch.tv PART #{channel}")
+                    elif command == "PRIVMSG" or line.startswith("@"):
+                        self.counters["irc.sent"] += 1
+                    elif command == "PING":
+                        await ws.send_str(f"PONG {argument}")
+        finally:
+            for channel in [channel for channel, joined_ws in self.joined.items() if joined_ws is ws]:
+                del self.joined[channel]
+        return ws
+
+    async def _join(self, ws: web.WebSocketResponse, nick: str, argument: str):
+        lines = []
+        for channel in argument.split(","):
+            channel = channel.strip().lstrip("#")
+            # The bot's own channel is joined too, but only the soak channels have chat traffic
+            if channel in self.channel_ids:
+                self.joined[channel] = ws
+            self.counters["irc.joins"] += 1
+            lines += [f":{nick}!{nick}@{nick}.tmi.twitch.tv JOIN #{channel}",
+                      f":{nick}.tmi.twitch.tv 353 {nick} = #{channel} :{nick}",
+                      f":{nick}.tmi.twitch.tv 366 {nick} #{channel} :End of /NAMES list"]
+        await ws.send_str("\r\n".join(lines))
+
+    def format_privmsg(self, channel: str, chatter: str, content: str, tags: Optional[dict] = None) -> str:
+        """PRIVMSG as Twitch sends it, tmi-sent-ts is the time it is sent by the fake."""
+        tags = {"badge-info": "", "badges": "", "color": "", "display-name": chatter, "emotes": "", "first-msg": "0",
+                "flags": "", "id": str(uuid.uuid4()), "mod": "0", "returning-chatter": "0", "subscriber": "0",
+                "turbo": "0", "user-id": "0", "user-type": ""} | (tags or {})
+        tags |= {"room-id": str(self.channel_ids.get(channel, 0)), "tmi-sent-ts": str(int(time.time() * 1000))}
+        return (f"@{';'.join(f'{key}={value}' for key, value in tags.items())} "
+                f":{chatter}!{chatter}@{chatter}.tmi.twitch.tv PRIVMSG #{channel} :{content}")
+
+    def make_privmsg(self, channel: str) -> str:
+        chatter_id = self.random.randrange(self.chatters)
+        if self.random.random() < self.link_ratio:
+            beatmap_id = FIRST_BEATMAP_ID + self.random.randrange(self.beatmaps)
+            content = f"https://osu.ppy.sh/b/{beatmap_id} {self.random.choice(['', '+HD', '+HDDT', '+HR'])}".strip()
+        else:
+            content = self.random.choice(["hi", "nice pass", "LUL", "what skin is this?", "gg"])
+        subscriber = int(self.random.random() < 0.2)
+        return self.format_privmsg(channel, f"soak_chatter_{chatter_id}", content,
+                                   {"badges": "subscriber/1" if subscriber else "", "subscriber": str(subscriber),
+                                    "user-id": str(chatter_id + 1)})
+
+    async def send_privmsgs(self, privmsgs: list[tuple[str, str]]):
+        """Sends the (channel, PRIVMSG) pairs of joined channels, batched per connection."""
+        batches: dict[web.WebSocketResponse, list[str]] = {}
+        for channel, privmsg in privmsgs:
+            if channel in self.joined:
+                batches.setdefault(self.joined[channel], []).append(privmsg)
+        for ws, lines in batches.items():
+            if not ws.closed:
+                await ws.send_str("\r\n".join(lines))
+                self.counters["irc.messages"] += len(lines)
+
+    async def send_messages(self, tick_seconds: float = 0.05):
+        """Sends messages_per_second messages to random joined channels every tick."""
+        budget = 0.0
+        while True:
+            await asyncio.sleep(tick_seconds)
+            budget += self.messages_per_second * tick_seconds
+            if not self.joined:
+                continue
+            channels = self.random.choices(list(self.joined), k=int(budget))
+            budget -= int(budget)
+            await self.send_privmsgs([(channel, self.make_privmsg(channel)) for channel in channels])
+
+    async def churn_periodically(self):
+        while True:
+            await asyncio.sleep(self.churn_seconds)
+            self.churn()
+
+    async def run(self):
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self.send_messages())
+            tg.create_task(self.churn_periodically())
+
+
+class FakeOsu:
+    """
+    osu! api where every beatmap exists, in beatmapsets of 5.
+    Every api response is delayed by latency_ms on average, and rate_limit_ratio of them are 429s.
+    """
+
+    def __init__(self, latency_ms: float = 50, rate_limit_ratio: float = 0.02, seed: Optional[int] = None):
+        self.random = random.Random(seed)
+        self.latency_ms = latency_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self.counters = Counter()
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self.api_conditions])
+        app.router.add_post("/oauth/token", self.token)
+        app.router.add_get("/api/v2/beatmaps", self.beatmaps)
+        app.router.add_get("/api/v2/beatmaps/{beatmap_id}", self.beatmap)
+        app.router.add_get("/api/v2/beatmapsets/{beatmapset_id}", self.beatmapset)
+        app.router.add_post("/api/v2/beatmaps/{beatmap_id}/attributes", self.attributes)
+        app.router.add_post("/api/v2/chat/new", self.chat_new)
+        return app
+
+    @web.middleware
+    async def api_conditions(self, request: web.Request, handler) -> web.StreamResponse:
+        if not request.path.startswith("/api/"):
+            return await handler(request)
+        if self.latency_ms:
+            await asyncio.sleep(self.random.expovariate(1 / self.latency_ms) / 1000)
+        if self.random.random() < self.rate_limit_ratio:
+            self.counters["rate_limited"] += 1
+            return web.json_response({"error": "Too Many Attempts."}, status=429, headers={"Retry-After": "1"})
+        return await handler(request)
+
+    async def token(self, request: web.Request) -> web.Response:
+        self.counters["oauth"] += 1
+        return web.json_response({"access_token": uuid.uuid4().hex, "expires_in": 86400, "token_type": "Bearer"})
+
+    def make_beatmapset(self, beatmapset_id: int) -> dict:
+        return {"id": beatmapset_id, "artist": f"Artist {beatmapset_id}", "title": f"Title {beatmapset_id}",
+                "creator": "soak", "status": "ranked",
+                "beatmaps": [self.make_beatmap(beatmapset_id * 5 + i, with_beatmapset=False) for i in range(5)]}
+
+    def make_beatmap(self, beatmap_id: int, with_beatmapset: bool = True) -> dict:
+        beatmap = {"id": beatmap_id, "beatmapset_id": beatmap_id // 5, "version": f"Difficulty {beatmap_id % 5}",
+                   "bpm": 120 + beatmap_id % 120, "status": "ranked", "mode": "osu",
+                   "difficulty_rating": 1 + beatmap_id % 70 / 10, "hit_length": 60 + beatmap_id % 240}
+        if with_beatmapset:
+            beatmap["beatmapset"] = self.make_beatmapset(beatmap_id // 5)
+        return beatmap
+
+    async def beatmap(self, request: web.Request) -> web.Response:
+        self.counters["beatmaps"] += 1
+        return web.json_response(self.make_beatmap(int(request.match_info["beatmap_id"])))
+
+    async def beatmaps(self, request: web.Request) -> web.Response:
+        self.counters["beatmaps.lookup"] += 1
+        beatmap_ids = [int(beatmap_id) for beatmap_id in request.query.getall("ids[]", [])][:50]
+        return web.json_response({"beatmaps": [self.make_beatmap(beatmap_id) for beatmap_id in beatmap_ids]})
+
+    async def beatmapset(self, request: web.Request) -> web.Response:
+        self.counters["beatmapsets"] += 1
+        return web.json_response(self.make_beatmapset(int(request.match_info["beatmapset_id"])))
+
+    async def attributes(self, request: web.Request) -> web.Response:
+        self.counters["attributes"] += 1
+        beatmap_id = int(request.match_info["beatmap_id"])
+        return web.json_response({"attributes": {"star_rating": 1.4 + beatmap_id % 70 / 10, "max_combo": 1000}})
+
+    async def chat_new(self, request: web.Request) -> web.Response:
+        self.counters["chat.new"] += 1
+        data = await request.json()
+        return web.json_response({"channel": {"channel_id": data["target_id"], "type": "PM"},
+                                  "message": {"content": data["message"], "is_action": data["is_action"]}})
+
+
+class FakeServices:
+    """Runs FakeTwitch and FakeOsu on free local ports."""
+
+    def __init__(self, twitch: FakeTwitch, osu: FakeOsu):
+        self.twitch = twitch
+        self.osu = osu
+        self._twitch_sock = bind_socket()
+        self._osu_sock = bind_socket()
+        self._runners: list[web.AppRunner] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def irc_url(self) -> str:
+        return f"{get_url(self._twitch_sock, 'ws')}/irc"
+
+    def get_env(self) -> dict[str, str]:
+        """Environment variables pointing the bot's own clients at the fakes."""
+        twitch_url, osu_url = get_url(self._twitch_sock), get_url(self._osu_sock)
+        return {"TWITCH_API_URL": f"{twitch_url}/helix", "TWITCH_AUTH_URL": f"{twitch_url}/oauth2/token",
+                "OSU_API_URL": f"{osu_url}/api/v2/", "OSU_OAUTH_URL": f"{osu_url}/oauth/token"}
+
+    async def start(self):
+        self._runners = [await start_app(self.twitch.app(), self._twitch_sock),
+                         await start_app(self.osu.app(), self._osu_sock)]
+        self._task = asyncio.create_task(self.twitch.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        for runner in self._runners:
+            await runner.cleanup()
+
+    def counters(self) -> dict:
+        return {"twitch": dict(self.twitch.counters), "osu": dict(self.osu.counters)}
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--channels", type=int, default=2000)
+    parser.add_argument("--live-ratio", type=float, default=0.5)
+    parser.add_argument("--churn-ratio", type=float, default=0.05)
+    parser.add_argument("--churn-seconds", type=float, default=60)
+    parser.add_argument("--messages-per-second", type=float, default=200)
+    parser.add_argument("--link-ratio", type=float, default=0.3)
+    parser.add_argument("--beatmaps", type=int, default=5000)
+    parser.add_argument("--osu-latency-ms", type=float, default=50)
+    parser.add_argument("--osu-rate-limit-ratio", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def create_services(args: argparse.Namespace) -> FakeServices:
+    twitch = FakeTwitch(channels=args.channels, live_ratio=args.live_ratio, churn_ratio=args.churn_ratio,
+                        churn_seconds=args.churn_seconds, messages_per_second=args.messages_per_second,
+                        link_ratio=args.link_ratio, beatmaps=args.beatmaps, seed=args.seed)
+    osu = FakeOsu(latency_ms=args.osu_latency_ms, rate_limit_ratio=args.osu_rate_limit_ratio, seed=args.seed)
+    return FakeServices(twitch, osu)
+
+
+async def serve(args: argparse.Namespace):
+    services = create_services(args)
+    await services.start()
+    for key, value in services.get_env().items():
+        print(f"{key}={value}")
+    print(f"# Twitch IRC: {services.irc_url}")
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(services.counters())
+    finally:
+        await services.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    asyncio.run(serve(parser.parse_args()))
@@ -0,0 +1,146 @@
+"""
+Replays a chat capture through the whole bot against the local fake services, see ronnia/utils/capture.py.
+
+The captured channels are live streams of the fake Twitch, and once the bot joined them, their messages are sent
+with the captured timing compressed --speed times. Each request is timed from the moment the fake IRC server sends
+its message until the bot finished handling it, so performance changes can be compared on real traffic shapes,
+with their link density, raids and per-channel skew.
+
+Needs a throwaway MongoDB in MONGODB_URL, like benchmarks/soak.py.
+
+Usage: python -m benchmarks.replay capture.jsonl [--speed 10] [--osu-latency-ms 50]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+from typing import Optional
+
+from benchmarks.fake_services import FakeOsu, FakeServices, FakeTwitch
+from benchmarks.soak import create_bot_manager, prepare_environment
+from ronnia.utils.beatmap import BeatmapParser
+from ronnia.utils.capture import read_capture
+
+
+class ReplayTwitch(FakeTwitch):
+    """FakeTwitch whose chat traffic is the records of a capture, sent speed times faster than captured."""
+
+    def __init__(self, records: list[dict], speed: float = 1.0):
+        assert records, "Capture is empty."
+        super().__init__(live_ratio=1.0, churn_ratio=0, messages_per_second=0,
+                         channel_names=sorted({record["c"] for record in records}))
+        self.records = records
+        self.speed = speed
+        self.start_replay = asyncio.Event()
+        self.replayed = asyncio.Event()
+
+    async def send_messages(self, tick_seconds: float = 0.01):
+        await self.start_replay.wait()
+        first_arrival = self.records[0]["t"]
+        started = time.monotonic()
+        i = 0
+        while i < len(self.records):
+            replay_time = first_arrival + (time.monotonic() - started) * self.speed
+            privmsgs = []
+            while i < len(self.records) and self.records[i]["t"] <= replay_time:
+                record = self.records[i]
+                privmsgs.append((record["c"], self.format_privmsg(record["c"], record["u"], record["x"],
+                                                                  record["tags"])))
+                i += 1
+            await self.send_privmsgs(privmsgs)
+            await asyncio.sleep(tick_seconds)
+        self.replayed.set()
+
+
+class RequestTimer:
+    """Wraps the request handler of the bot to time each request from its tmi-sent-ts tag."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.latencies_ms: list[float] = []
+        self.in_flight = 0
+
+    async def __call__(self, message):
+        self.in_flight += 1
+        try:
+            await self.handler(message)
+        finally:
+            self.in_flight -= 1
+            self.latencies_ms.append(time.time() * 1000 - int(message.tags["tmi-sent-ts"]))
+
+
+def has_beatmap_link(content: str) -> bool:
+    return any(BeatmapParser.parse_beatmap_link(token, content) for token in content.split(" "))
+
+
+async def wait_until(condition, timeout: float, interval: float = 0.5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(interval)
+    return True
+
+
+def print_report(twitch: ReplayTwitch, bot, timer: RequestTimer, services: FakeServices, wall_seconds: float):
+    captured_seconds = twitch.records[-1]["t"] - twitch.records[0]["t"]
+    links = sum(has_beatmap_link(record["x"]) for record in twitch.records)
+    print(f"Replayed {len(twitch.records)} messages ({links} with beatmap links) in {len(twitch.channels)} channels, "
+          f"captured over {captured_seconds / 60:.1f} min, at {twitch.speed}x in {wall_seconds:.1f}s")
+    print(f"Handled {len(timer.latencies_ms)} requests, dropped {bot.request_scheduler.dropped}, "
+          f"throughput {len(timer.latencies_ms) / wall_seconds:.1f} requests/s")
+    if len(timer.latencies_ms) >= 2:
+        percentiles = statistics.quantiles(timer.latencies_ms, n=100)
+        print(f"Latency: p50 {percentiles[49]:.1f} ms, p90 {percentiles[89]:.1f} ms, "
+              f"p99 {percentiles[98]:.1f} ms, max {max(timer.latencies_ms):.1f} ms")
+    print(f"Scheduler wait: {bot.request_scheduler.wait_ms.snapshot()}")
+    print(f"Fake service counters: {services.counters()}")
+
+
+async def replay(args: argparse.Namespace, records: list[dict]):
+    twitch = ReplayTwitch(records, speed=args.speed)
+    services = FakeServices(twitch, FakeOsu(latency_ms=args.osu_latency_ms,
+                                            rate_limit_ratio=args.osu_rate_limit_ratio))
+    prepare_environment(services)
+    await services.start()
+    bot_manager = None
+    bot_task: Optional[asyncio.Task] = None
+    try:
+        bot_manager = await create_bot_manager(services)
+        bot_task = asyncio.create_task(bot_manager.start())
+        assert await wait_until(lambda: bot_manager.twitch_bot is not None, timeout=60), "Bot did not start."
+        bot = bot_manager.twitch_bot
+        timer = RequestTimer(bot.request_scheduler.handler)
+        bot.request_scheduler.handler = timer
+
+        print(f"Waiting for the bot to join {len(twitch.channels)} channels")
+        if not await wait_until(lambda: len(twitch.joined) >= len(twitch.channels), timeout=args.join_timeout):
+            print(f"Joined only {len(twitch.joined)} channels, replaying anyway")
+
+        started = time.monotonic()
+        twitch.start_replay.set()
+        await twitch.replayed.wait()
+        await wait_until(lambda: len(bot.request_scheduler) == 0 and timer.in_flight == 0, timeout=args.drain_timeout)
+        print_report(twitch, bot, timer, services, time.monotonic() - started)
+    finally:
+        if bot_task is not None:
+            bot_task.cancel()
+        if bot_manager is not None and bot_manager.twitch_bot is not None:
+            await bot_manager.twitch_bot.close()
+        await services.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="Path of the capture, its rotated files are replayed too")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed, 1 to 100 times the captured rate")
+    parser.add_argument("--osu-latency-ms", type=float, default=50)
+    parser.add_argument("--osu-rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--join-timeout", type=float, default=600)
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    arguments = parser.parse_args()
+    assert 1 <= arguments.speed <= 100, "Speed must be between 1 and 100."
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", logging.WARNING))
+    asyncio.run(replay(arguments, list(read_capture(arguments.capture))))
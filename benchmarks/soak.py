@@ -0,0 +1,211 @@
+"""
+Soak test of the whole bot against the local fake services of benchmarks/fake_services.py.
+
+Runs BotManager, TwitchBot, TwitchAPI and the osu! clients in this process for --hours, and samples the RSS,
+the memory traced by tracemalloc and the sizes of the bot's long-lived structures every --sample-seconds.
+After --warmup-minutes, the growth of each is compared to its first sample. The run fails if the RSS or the traced
+memory grew more than allowed, or if a structure grew in every sample, which is how unbounded structures show up.
+
+Needs a throwaway MongoDB in MONGODB_URL, the soak users soak_channel_<i> are written to its Users collection.
+
+Usage: python -m benchmarks.soak --hours 4 [--channels 2000] [--messages-per-second 200] [--sample-seconds 60]
+"""
+import argparse
+import asyncio
+import importlib
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+from benchmarks.fake_services import FakeServices, add_arguments, create_services
+
+logger = logging.getLogger("benchmarks.soak")
+
+TRACEMALLOC_FRAMES = 10
+
+
+def get_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Peak RSS is the best estimate without procfs
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def get_structure_sizes(bot_manager) -> dict[str, int]:
+    """Sizes of the structures that live as long as the bot, they should stop growing once traffic is steady."""
+    sizes: dict[str, Callable[[], int]] = {
+        "channel_presence": lambda: len(bot_manager.channel_presence.missed_polls),
+    }
+    bot = bot_manager.twitch_bot
+    if bot is not None:
+        sizes |= {
+            "user_last_request": lambda: len(bot.user_last_request),
+            "join_fail_channels": lambda: len(bot.join_fail_channels),
+            "beatmap_refresh_tasks": lambda: len(bot._beatmap_refresh_tasks),
+            "beatmap_attributes_cache": lambda: len(bot.beatmap_attributes_cache.items()),
+            "request_scheduler": lambda: len(bot.request_scheduler),
+            "request_digest": lambda: bot.request_digest.metrics()["tracked_keys"],
+            "irc_assignments": lambda: len(bot.irc_pool.assignments),
+            "background_tasks": lambda: len(bot.background_tasks),
+            "asyncio_tasks": lambda: len(asyncio.all_tasks()),
+        }
+    return {name: size() for name, size in sizes.items()}
+
+
+def redirect_twitchio(services: FakeServices):
+    """twitchio connects to a hardcoded IRC host and validates the token with Twitch, both go to the fakes instead."""
+    import aiohttp
+    import twitchio.http
+    import twitchio.websocket
+
+    twitchio.websocket.HOST = services.irc_url
+
+    async def validate(self, *, token: str = None) -> dict:
+        if not self.session:
+            self.session = aiohttp.ClientSession()
+        nick = os.environ["BOT_NICK"].lower()
+        data = {"login": nick, "user_id": "1", "client_id": os.environ["TWITCH_CLIENT_ID"]}
+        if not self.nick:
+            self.nick, self.user_id, self.client_id = nick, 1, data["client_id"]
+        return data
+
+    twitchio.http.TwitchHTTP.validate = validate
+
+
+async def seed_users(db, services: FakeServices):
+    from pymongo import ReplaceOne
+
+    operations = [
+        ReplaceOne({"twitchId": twitch_id},
+                   {"osuUsername": name, "twitchUsername": name, "twitchId": twitch_id, "osuId": twitch_id,
+                    "osuAvatarUrl": "", "twitchAvatarUrl": "", "excludedUsers": [], "isLive": False,
+                    "settings": {"echo": True, "enable": True, "sub-only": False, "points-only": False,
+                                 "test": False, "cooldown": 30, "sr": [0, -1]}},
+                   upsert=True)
+        for twitch_id, name in services.twitch.channels.items()
+    ]
+    await db.users_col.bulk_write(operations, ordered=False)
+
+
+class Soak:
+    def __init__(self, args: argparse.Namespace, bot_manager, services: FakeServices):
+        self.args = args
+        self.bot_manager = bot_manager
+        self.services = services
+        self.samples: list[dict] = []
+        self.baseline = None
+
+    def sample(self, elapsed: float) -> dict:
+        traced_mb = tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+        sample = {"elapsed_minutes": elapsed / 60, "rss_mb": get_rss_mb(), "traced_mb": traced_mb,
+                  "structures": get_structure_sizes(self.bot_manager)}
+        print(f"{sample['elapsed_minutes']:7.1f} min  rss {sample['rss_mb']:8.1f} MB  "
+              f"traced {traced_mb:8.1f} MB  {sample['structures']}", flush=True)
+        return sample
+
+    def print_top_growth(self, limit: int = 10):
+        if self.baseline is None:
+            return
+        snapshot = tracemalloc.take_snapshot()
+        print(f"Top {limit} allocation sites by growth since the warmup:")
+        for stat in snapshot.compare_to(self.baseline, "traceback")[:limit]:
+            print(f"  {stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} blocks")
+            for line in stat.traceback.format(limit=3):
+                print(f"    {line}")
+
+    def report(self) -> bool:
+        """Prints the growth since the warmup, :return: Whether the run passed"""
+        measured = [sample for sample in self.samples if sample["elapsed_minutes"] >= self.args.warmup_minutes]
+        if len(measured) < 3:
+            print("Not enough samples after the warmup to judge growth")
+            return True
+
+        first, last = measured[0], measured[-1]
+        rss_growth = last["rss_mb"] - first["rss_mb"]
+        traced_growth = last["traced_mb"] - first["traced_mb"]
+        print(f"RSS grew {rss_growth:+.1f} MB, traced memory grew {traced_growth:+.1f} MB")
+        passed = rss_growth <= self.args.max_rss_growth_mb and traced_growth <= self.args.max_traced_growth_mb
+
+        for name in last["structures"]:
+            sizes = [sample["structures"].get(name, 0) for sample in measured]
+            if all(later > earlier for earlier, later in zip(sizes, sizes[1:])):
+                print(f"{name} grew in every sample: {sizes[0]} -> {sizes[-1]}")
+                passed = False
+
+        self.print_top_growth()
+        print(f"Fake service counters: {self.services.counters()}")
+        print("PASSED" if passed else "FAILED")
+        return passed
+
+    async def run(self) -> bool:
+        started = time.monotonic()
+        duration = self.args.hours * 3600
+        bot_task = asyncio.create_task(self.bot_manager.start())
+        try:
+            while time.monotonic() - started < duration:
+                await asyncio.wait({bot_task}, timeout=self.args.sample_seconds)
+                if bot_task.done():
+                    bot_task.result()
+                    raise RuntimeError("Bot stopped during the soak")
+                elapsed = time.monotonic() - started
+                self.samples.append(self.sample(elapsed))
+                if self.baseline is None and elapsed >= self.args.warmup_minutes * 60:
+                    self.baseline = tracemalloc.take_snapshot()
+        finally:
+            bot_task.cancel()
+            if self.bot_manager.twitch_bot is not None:
+                await self.bot_manager.twitch_bot.close()
+        return self.report()
+
+
+def prepare_environment(services: FakeServices):
+    """Points the bot at the fake services, the clients read their URLs on import so this runs before importing it."""
+    os.environ.update(services.get_env())
+    for key, value in {"TMI_TOKEN": "oauth:soak", "BOT_NICK": "soak_bot", "TWITCH_CLIENT_ID": "soak",
+                       "TWITCH_CLIENT_SECRET": "soak", "OSU_CLIENT_ID": "1", "OSU_CLIENT_SECRET": "soak",
+                       "ENVIRONMENT": "soak", "WARM_START_SNAPSHOT_PATH": ""}.items():
+        os.environ.setdefault(key, value)
+    redirect_twitchio(services)
+
+
+async def create_bot_manager(services: FakeServices):
+    """BotManager with the channels of the fake services as its users."""
+    assert os.getenv("MONGODB_URL"), "Set MONGODB_URL to a throwaway MongoDB for the soak users."
+    bot_manager_module = importlib.import_module("ronnia.bots.bot_manager")
+    bot_manager = bot_manager_module.BotManager()
+    await seed_users(bot_manager.db_client, services)
+    return bot_manager
+
+
+async def main(args: argparse.Namespace) -> bool:
+    services = create_services(args)
+    prepare_environment(services)
+    await services.start()
+    try:
+        bot_manager = await create_bot_manager(services)
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        return await Soak(args, bot_manager, services).run()
+    finally:
+        await services.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, default=4)
+    parser.add_argument("--sample-seconds", type=float, default=60)
+    parser.add_argument("--warmup-minutes", type=float, default=10)
+    parser.add_argument("--max-rss-growth-mb", type=float, default=50)
+    parser.add_argument("--max-traced-growth-mb", type=float, default=20)
+    add_arguments(parser)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", logging.WARNING))
+    sys.exit(0 if asyncio.run(main(parser.parse_args())) else 1)
@@ -0,0 +1,102 @@
+"""
+Startup time benchmark of the bot.
+
+imports: Time to import the modules on the startup path, each in a fresh interpreter.
+e2e: Starts `python -m ronnia.main` and reports the time from process start to each startup milestone in its logs,
+     ending with the first handled chat message. Needs the usual bot environment (MongoDB, Twitch and osu! credentials)
+     and a chat message in one of the joined channels.
+
+Usage: python -m benchmarks.startup imports [--repeat 5]
+       python -m benchmarks.startup e2e [--timeout 120]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+IMPORT_MODULES = ("ronnia.bots.bot_manager", "ronnia.bots.twitch_bot", "ronnia.main")
+
+# Log message prefix -> milestone name
+MILESTONES = {
+    "Successfully initialized RonniaDatabase": "schema initialized",
+    "Schema of RonniaDatabase is up to date": "schema initialized",
+    "Started Twitch bot instance": "bot created",
+    "Ready |": "irc ready",
+    "Sending streaming users to the Twitch Bot": "channels sent",
+    "Handled first message since startup": "first message",
+}
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_env() -> dict:
+    env = dict(os.environ)
+    # The bot imports its packages both as ronnia.* and from inside the ronnia directory
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [REPO_ROOT, os.path.join(REPO_ROOT, "ronnia"),
+                                                      env.get("PYTHONPATH")]))
+    return env
+
+
+def measure_import(module: str) -> float:
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], env=get_env(), cwd=REPO_ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def run_imports(args: argparse.Namespace):
+    for module in IMPORT_MODULES:
+        timings = [measure_import(module) for _ in range(args.repeat)]
+        print(f"{module:<28} median {statistics.median(timings) * 1000:7.1f} ms, "
+              f"min {min(timings) * 1000:7.1f} ms")
+
+
+def run_e2e(args: argparse.Namespace):
+    start = time.monotonic()
+    process = subprocess.Popen([sys.executable, "-m", "ronnia.main"], env=get_env(), cwd=REPO_ROOT,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    reached = {}
+    timeout = threading.Timer(args.timeout, process.terminate)
+    timeout.start()
+    try:
+        for line in process.stdout:
+            elapsed = time.monotonic() - start
+            try:
+                message = json.loads(line).get("message", "")
+            except json.JSONDecodeError:
+                message = line
+            for prefix, milestone in MILESTONES.items():
+                if message.startswith(prefix) and milestone not in reached:
+                    reached[milestone] = elapsed
+                    print(f"{elapsed * 1000:9.1f} ms  {milestone}")
+            if "first message" in reached:
+                break
+    finally:
+        timeout.cancel()
+        process.terminate()
+        process.wait()
+
+    if "first message" not in reached:
+        print(f"No message was handled in {args.timeout}s")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of the bot.")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    imports_parser = subparsers.add_parser("imports", help="Import time of the startup path")
+    imports_parser.add_argument("--repeat", type=int, default=5)
+    e2e_parser = subparsers.add_parser("e2e", help="Time from process start to the first handled message")
+    e2e_parser.add_argument("--timeout", type=float, default=120)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.mode == "imports":
+        run_imports(arguments)
+    else:
+        run_e2e(arguments)
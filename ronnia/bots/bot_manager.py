@@ -1,64 +1,197 @@
 import asyncio
+import importlib
 import logging
 import os
 import socket
-from typing import AsyncIterable
+import time
+from typing import TYPE_CHECKING, AsyncIterable, Optional
 
 from pymongo import UpdateOne
 
-from ronnia.bots.twitch_bot import TwitchBot
-from ronnia.clients.mongo import RonniaDatabase
+from ronnia.clients.cluster import CLUSTER_PARTITIONS, ClusterCoordinator
+from ronnia.clients.mongo import get_ronnia_database
 from ronnia.clients.twitch import TwitchAPI
 from ronnia.models.database import DBUser
+from ronnia.utils.loop_monitor import EventLoopMonitor
+from ronnia.utils.metrics import registry as metrics_registry
+from ronnia.utils.snapshot import SnapshotEntry, read_snapshot, write_snapshot
+
+if TYPE_CHECKING:
+    from ronnia.bots.twitch_bot import TwitchBot
 
 STREAMING_USERS_UPDATE_SLEEP = 60
+# A channel is parted after it is missing from this many consecutive polls and for at least the grace period
+PART_AFTER_MISSED_POLLS = int(os.getenv("PART_AFTER_MISSED_POLLS", 3))
+PART_GRACE_SECONDS = float(os.getenv("PART_GRACE_SECONDS", 0))
+# Hot state is saved here periodically and loaded on startup, an empty path disables warm starts
+WARM_START_SNAPSHOT_PATH = os.getenv("WARM_START_SNAPSHOT_PATH", "ronnia.snapshot")
+WARM_START_SNAPSHOT_SECONDS = float(os.getenv("WARM_START_SNAPSHOT_SECONDS", 30))
+WARM_START_MAX_AGE_SECONDS = float(os.getenv("WARM_START_MAX_AGE_SECONDS", 10 * 60))
 
 logger = logging.getLogger(__name__)
 
 
+class ChannelPresence:
+    """
+    Hysteresis between the stream polls and the joined channels.
+    Streams that go offline or switch category for a poll or two stay joined, and streams whose status
+    could not be fetched are treated as unknown, so a flapping stream doesn't cost a PART and a JOIN every minute.
+    """
+
+    def __init__(self, part_after_missed_polls: int = PART_AFTER_MISSED_POLLS,
+                 grace_seconds: float = PART_GRACE_SECONDS):
+        self.part_after_missed_polls = part_after_missed_polls
+        self.grace_seconds = grace_seconds
+        self.missed_polls: dict[str, int] = {}
+        self.last_seen: dict[str, float] = {}
+
+    def update(self, live: set[str], unknown: set[str], now: Optional[float] = None) -> set[str]:
+        """
+        Records a stream poll.
+        :param live: Channels that are streaming osu!
+        :param unknown: Channels whose status could not be fetched
+        :param now: Time of the poll, defaults to the current time
+        :return: Channels that should be joined
+        """
+        now = time.time() if now is None else now
+        for channel in live:
+            self.missed_polls[channel] = 0
+            self.last_seen[channel] = now
+
+        for channel in list(self.missed_polls):
+            if channel in live or channel in unknown:
+                continue
+            self.missed_polls[channel] += 1
+            if (self.missed_polls[channel] >= self.part_after_missed_polls
+                    and now - self.last_seen[channel] >= self.grace_seconds):
+                del self.missed_polls[channel]
+                del self.last_seen[channel]
+
+        return set(self.missed_polls)
+
+    def snapshot_state(self) -> dict[str, list[SnapshotEntry]]:
+        return {"presence": [SnapshotEntry(channel, self.last_seen[channel], str(missed_polls).encode())
+                             for channel, missed_polls in self.missed_polls.items()]}
+
+    def restore_state(self, snapshot: dict[str, list[SnapshotEntry]]):
+        for entry in snapshot.get("presence", []):
+            self.missed_polls[entry.key] = int(entry.value)
+            self.last_seen[entry.key] = entry.timestamp
+
+
 class BotManager:
     def __init__(
             self,
     ):
-        self.db_client = RonniaDatabase(os.getenv("MONGODB_URL"))
+        self.db_client = get_ronnia_database()
 
         self.twitch_client_id = os.getenv("TWITCH_CLIENT_ID")
         self.twitch_client_secret = os.getenv("TWITCH_CLIENT_SECRET")
 
-        self.twitch_bot: TwitchBot | None = None
+        self.twitch_bot: "TwitchBot | None" = None
+        self.channel_presence = ChannelPresence()
+        # With several nodes, each node joins only the channels of the cluster partitions it owns
+        self.cluster: ClusterCoordinator | None = None
+        if CLUSTER_PARTITIONS > 0:
+            self.cluster = ClusterCoordinator(self.db_client.cluster_leases_col, self.db_client.cluster_nodes_col)
+
+        self.loop_monitor = EventLoopMonitor()
+        metrics_registry.register("event_loop", self.loop_monitor.metrics)
 
         self._loop = asyncio.get_event_loop()
 
     async def start(self):
         """
         Starts the TwitchBot, and starts a task for continuously sending currently streaming users to it.
+        Schema initialization and the first streaming users poll run while the bot connects to Twitch.
         """
-        await self.db_client.initialize()
-        streaming_user_names = await self.get_streaming_users()
+        loop_monitor_task = self.loop_monitor.start()
+        snapshot = self.load_snapshot()
+        self.channel_presence.restore_state(snapshot)
+        # Cancelled when starting fails too, so a failed start doesn't leave them running
+        tasks: list[asyncio.Task] = [loop_monitor_task]
+        try:
+            initialize_task = asyncio.create_task(self.db_client.initialize())
+            tasks.append(initialize_task)
+            if self.cluster is not None:
+                tasks.append(asyncio.create_task(self.cluster.run()))
+            first_poll_task = asyncio.create_task(self.get_channels_to_join())
+            tasks.append(first_poll_task)
+            # Channels of a recent snapshot are joined right away, the others after the first poll.
+            # In a cluster the partitions may have moved to other nodes since the snapshot, so they are not used.
+            initial_channel_names = set()
+            if self.cluster is None:
+                initial_channel_names = {entry.key for entry in snapshot.get("channels", [])}
 
-        self.twitch_bot = TwitchBot(
-            initial_channel_names=streaming_user_names,
-            listener_update_sleep=STREAMING_USERS_UPDATE_SLEEP
-        )
-        logger.info(
-            f"Started Twitch bot instance for {len(streaming_user_names)} users"
-        )
-        twitch_bot_task = asyncio.create_task(self.twitch_bot.start())
-        await self.twitch_bot.wait_for_ready()
-        await asyncio.sleep(1)  # wait for twitch_bot to initialize the server
-        await self.listener(self.twitch_bot.server_socket)
+            # twitchio is the heaviest import of the bot, load it while the tasks above wait for their responses
+            twitch_bot_module = await asyncio.to_thread(importlib.import_module, "ronnia.bots.twitch_bot")
+            self.twitch_bot = twitch_bot_module.TwitchBot(
+                initial_channel_names=initial_channel_names,
+                listener_update_sleep=STREAMING_USERS_UPDATE_SLEEP
+            )
+            self.twitch_bot.restore_state(snapshot)
+            logger.info(
+                f"Started Twitch bot instance for {len(initial_channel_names)} users"
+            )
+            twitch_bot_task = asyncio.create_task(self.twitch_bot.start())
+            tasks.append(twitch_bot_task)
+            await self.wait_for_receiver(twitch_bot_task)
+            await initialize_task
 
-    async def listener(self, server_sock: socket.socket):
+            tasks.append(asyncio.create_task(self.snapshot_periodically()))
+            await self.listener(self.twitch_bot.server_socket, first_poll_task)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.save_snapshot()
+
+    async def wait_for_receiver(self, twitch_bot_task: asyncio.Task):
+        """Waits until the TwitchBot is serving the streaming channel receiver, or raises if the bot stopped."""
+        receiver_ready = asyncio.create_task(self.twitch_bot.receiver_ready.wait())
+        done, _ = await asyncio.wait({receiver_ready, twitch_bot_task}, return_when=asyncio.FIRST_COMPLETED)
+        if receiver_ready not in done:
+            receiver_ready.cancel()
+            twitch_bot_task.result()
+            raise RuntimeError("TwitchBot stopped before it was ready")
+
+    @staticmethod
+    def load_snapshot() -> dict[str, list[SnapshotEntry]]:
+        if not WARM_START_SNAPSHOT_PATH:
+            return {}
+        return read_snapshot(WARM_START_SNAPSHOT_PATH, max_age_seconds=WARM_START_MAX_AGE_SECONDS)
+
+    def save_snapshot(self):
+        if not WARM_START_SNAPSHOT_PATH or self.twitch_bot is None:
+            return
+        try:
+            write_snapshot(WARM_START_SNAPSHOT_PATH,
+                           self.twitch_bot.snapshot_state(self.channel_presence.last_seen)
+                           | self.channel_presence.snapshot_state())
+        except OSError as e:
+            logger.warning(f"Could not write snapshot {WARM_START_SNAPSHOT_PATH}", exc_info=e)
+
+    async def snapshot_periodically(self):
+        """Saves the hot state every WARM_START_SNAPSHOT_SECONDS seconds."""
+        while True:
+            await asyncio.sleep(WARM_START_SNAPSHOT_SECONDS)
+            self.save_snapshot()
+
+    async def listener(self, server_sock: socket.socket, first_poll_task: Optional[asyncio.Task] = None):
         """
         Main coroutine of the bot manager. Checks streaming users and sends the updated list to bot every
         STREAMING_USERS_UPDATE_SLEEP seconds.
+        :param server_sock: Socket of the streaming channel receiver of the bot
+        :param first_poll_task: Already started get_channels_to_join task to use for the first update
         """
         address = server_sock.getsockname()
         logger.info(f"Starting Bot Manager Listener on {address=}")
         _, writer = await asyncio.open_connection(*address[:2])
         while True:
             try:
-                streaming_users = await self.get_streaming_users()
+                if first_poll_task is not None:
+                    streaming_users, first_poll_task = await first_poll_task, None
+                else:
+                    streaming_users = await self.get_channels_to_join()
                 logger.info(f'Sending streaming users to the Twitch Bot: {streaming_users}')
                 message = ",".join(streaming_users) + "\n"
                 writer.write(message.encode())
@@ -77,16 +210,49 @@ class BotManager:
                 _, writer = await asyncio.open_connection(*address[:2])
             finally:
                 # Wait for STREAMING_USERS_UPDATE_SLEEP seconds before sending connected users
-                await asyncio.sleep(STREAMING_USERS_UPDATE_SLEEP)
+                await self.wait_for_next_update()
+
+    async def wait_for_next_update(self):
+        """Sleeps until the next update, which comes early if the cluster partitions of this node changed."""
+        if self.cluster is None:
+            await asyncio.sleep(STREAMING_USERS_UPDATE_SLEEP)
+            return
+        try:
+            await asyncio.wait_for(self.cluster.changed.wait(), timeout=STREAMING_USERS_UPDATE_SLEEP)
+        except asyncio.TimeoutError:
+            pass
+
+    async def get_channels_to_join(self) -> set:
+        """
+        Gets the channels this node should join. Without a cluster, these are all the streaming users.
+        In a cluster, the leader polls the streaming users and publishes them, and every node joins
+        the ones in its partitions.
+        """
+        if self.cluster is None:
+            return await self.get_streaming_users()
+
+        await self.cluster.ready.wait()
+        self.cluster.changed.clear()
+        if self.cluster.is_leader:
+            channels = await self.get_streaming_users()
+            await self.cluster.publish_live_channels(channels)
+        else:
+            channels = await self.cluster.get_live_channels()
+        return {channel for channel in channels if self.cluster.owns(channel)}
 
     async def get_streaming_users(self) -> set:
-        """Gets the currently streaming users from TwitchAPI."""
+        """
+        Gets the channels to be joined: the currently streaming users from TwitchAPI,
+        and the recently streaming users that are within the part hysteresis.
+        """
+        usernames = {}
         users = self.db_client.get_enabled_users()
-        users = self.extract_user_id(users)
+        users = self.extract_user_id(users, usernames)
 
         streaming_usernames = set()
+        failed_user_ids = set()
         async with TwitchAPI(self.twitch_client_id, self.twitch_client_secret) as twitch_api:
-            streaming_twitch_user_data = twitch_api.get_streams(users)
+            streaming_twitch_user_data = twitch_api.get_streams(users, failed_user_ids=failed_user_ids)
             streaming_twitch_user_ids = []
             operations = []
             async for user in streaming_twitch_user_data:
@@ -106,12 +272,16 @@ class BotManager:
             operations=operations, col=self.db_client.users_col
         )
         await self.db_client.users_col.update_many(
-            {"isLive": True, "twitchId": {"$nin": streaming_twitch_user_ids}},
+            {"isLive": True, "twitchId": {"$nin": streaming_twitch_user_ids + list(failed_user_ids)}},
             {"$set": {"isLive": False}},
         )
-        return streaming_usernames
+        unknown_usernames = {usernames[twitch_id] for twitch_id in failed_user_ids}
+        return self.channel_presence.update(streaming_usernames, unknown_usernames)
 
     @staticmethod
-    async def extract_user_id(users: AsyncIterable[DBUser]) -> AsyncIterable[int]:
+    async def extract_user_id(users: AsyncIterable[DBUser],
+                              usernames: Optional[dict[int, str]] = None) -> AsyncIterable[int]:
         async for user in users:
+            if usernames is not None:
+                usernames[user.twitchId] = user.twitchUsername
             yield user.twitchId
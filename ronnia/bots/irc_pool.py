@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import os
+from typing import Iterable
+
+from twitchio import Channel, Client
+from twitchio.websocket import WSConnection
+
+logger = logging.getLogger(__name__)
+
+IRC_CHANNELS_PER_CONNECTION = int(os.getenv("IRC_CHANNELS_PER_CONNECTION", 200))
+IRC_MAX_CONNECTIONS = int(os.getenv("IRC_MAX_CONNECTIONS", 10))
+# Twitch allows 20 JOINs per 10 seconds per account, across all of its connections
+JOIN_WINDOW_SIZE = 20
+JOIN_WINDOW_SECONDS = 11
+
+
+class IrcConnectionPool:
+    """
+    Spreads the joined channels of a twitchio Client over several IRC connections.
+    Channels are joined on the least loaded connection, a new connection is opened when every connection
+    has channels_per_connection channels, and extra connections are closed when they become empty.
+    rebalance moves channels off the connections that stayed loaded after parts.
+    Each connection re-joins only its own channels when it reconnects.
+
+    twitchio has a single connection per Client, so the extra connections are twitchio WSConnections
+    that dispatch their events to the same Client.
+    """
+
+    def __init__(self, client: Client, channels_per_connection: int = IRC_CHANNELS_PER_CONNECTION,
+                 max_connections: int = IRC_MAX_CONNECTIONS):
+        self.client = client
+        self.channels_per_connection = channels_per_connection
+        self.max_connections = max_connections
+        # The connection of the Client itself is never closed, it also keeps the bot's own channel
+        self.connections: list[WSConnection] = [client._connection]
+        self.assignments: dict[str, WSConnection] = {}
+        self._lock = asyncio.Lock()
+        self._join_lock = asyncio.Lock()
+        self._last_join_window_at = None
+
+    @property
+    def channels(self) -> set[str]:
+        """Channels that are joined or being joined."""
+        return set(self.assignments)
+
+    @property
+    def connected_channels(self) -> list[Channel]:
+        return [Channel(name=name, websocket=connection)
+                for connection in self.connections for name in connection._cache]
+
+    def get_load(self, connection: WSConnection) -> int:
+        return sum(1 for assigned in self.assignments.values() if assigned is connection)
+
+    def metrics(self) -> dict:
+        return {"connections": len(self.connections),
+                "channels": [self.get_load(connection) for connection in self.connections],
+                "alive": sum(connection.is_alive for connection in self.connections)}
+
+    async def _open_connection(self) -> WSConnection:
+        primary = self.client._connection
+        connection = WSConnection(client=self.client, token=primary._token, loop=self.client.loop,
+                                  heartbeat=primary._heartbeat, initial_channels=[],
+                                  retain_cache=primary._retain_cache)
+        await connection._connect()
+        await connection.wait_until_ready()
+        self.connections.append(connection)
+        logger.info(f"Opened IRC connection {len(self.connections)}")
+        return connection
+
+    async def _pick_connection(self) -> WSConnection:
+        """The least loaded connection, opening a new one if every connection is full."""
+        connection = min(self.connections, key=self.get_load)
+        if self.get_load(connection) >= self.channels_per_connection and len(self.connections) < self.max_connections:
+            try:
+                connection = await self._open_connection()
+            except Exception as e:
+                logger.exception("Could not open a new IRC connection, using the least loaded one", exc_info=e)
+        return connection
+
+    def _update_rejoin_channels(self):
+        """Makes every connection re-join only its own channels after a reconnect."""
+        for connection in self.connections:
+            if connection._init:
+                own_channels = [name for name, assigned in self.assignments.items() if assigned is connection]
+                if connection is self.client._connection and self.client.nick:
+                    own_channels.append(self.client.nick)
+                connection._initial_channels = own_channels
+
+    async def join_channels(self, channels: Iterable[str]):
+        # Only one join waits for the JOIN rate limit at a time, parts and syncs don't wait for it
+        async with self._join_lock:
+            channels = list(dict.fromkeys(channel.lower() for channel in channels))
+            channels = [channel for channel in channels if channel not in self.assignments]
+            for i in range(0, len(channels), JOIN_WINDOW_SIZE):
+                await self._wait_for_join_window()
+                async with self._lock:
+                    await self._join_window(channels[i: i + JOIN_WINDOW_SIZE])
+                    self._update_rejoin_channels()
+
+    async def _wait_for_join_window(self):
+        """Waits until JOIN_WINDOW_SECONDS passed since the previous window of joins, across join calls."""
+        loop = asyncio.get_running_loop()
+        if self._last_join_window_at is not None:
+            delay = self._last_join_window_at + JOIN_WINDOW_SECONDS - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._last_join_window_at = loop.time()
+
+    async def _join_window(self, channels: list[str]):
+        """Joins the channels that were not joined while waiting for the rate limit."""
+        joins: dict[WSConnection, list[str]] = {}
+        for channel in channels:
+            if channel in self.assignments:
+                continue
+            connection = await self._pick_connection()
+            self.assignments[channel] = connection
+            joins.setdefault(connection, []).append(channel)
+        for connection, connection_channels in joins.items():
+            await connection.join_channels(*connection_channels)
+
+    async def part_channels(self, channels: Iterable[str]):
+        async with self._lock:
+            parts: dict[WSConnection, list[str]] = {}
+            for channel in channels:
+                connection = self.assignments.pop(channel.lower(), None)
+                if connection is not None:
+                    parts.setdefault(connection, []).append(channel.lower())
+            for connection, connection_channels in parts.items():
+                await connection.part_channels(*connection_channels)
+
+            for connection in self.connections[1:]:
+                if self.get_load(connection) == 0:
+                    self.connections.remove(connection)
+                    await self._close_connection(connection)
+            self._update_rejoin_channels()
+
+    def _is_unbalanced(self) -> bool:
+        loads = [self.get_load(connection) for connection in self.connections]
+        return max(loads) - min(loads) > 1
+
+    def _plan_moves(self, limit: int) -> list[tuple[str, WSConnection, WSConnection]]:
+        """(channel, from, to) moves from the most to the least loaded connection, until loads differ by one."""
+        owned: dict[WSConnection, list[str]] = {connection: [] for connection in self.connections}
+        for name, connection in self.assignments.items():
+            owned[connection].append(name)
+        moves = []
+        while len(moves) < limit:
+            source = max(owned, key=lambda connection: len(owned[connection]))
+            target = min(owned, key=lambda connection: len(owned[connection]))
+            if len(owned[source]) - len(owned[target]) <= 1:
+                break
+            channel = owned[source].pop()
+            owned[target].append(channel)
+            moves.append((channel, source, target))
+        return moves
+
+    async def rebalance(self):
+        """
+        Moves channels off the most loaded connections until the loads differ by at most one.
+        A moved channel is parted and joined again on the other connection, so at most JOIN_WINDOW_SIZE channels
+        are moved per call and the move waits for the JOIN rate limit like joins do.
+        """
+        async with self._join_lock:
+            if not self._is_unbalanced():
+                return
+            await self._wait_for_join_window()
+            async with self._lock:
+                moves = self._plan_moves(JOIN_WINDOW_SIZE)
+                parts: dict[WSConnection, list[str]] = {}
+                joins: dict[WSConnection, list[str]] = {}
+                for channel, source, target in moves:
+                    self.assignments[channel] = target
+                    parts.setdefault(source, []).append(channel)
+                    joins.setdefault(target, []).append(channel)
+                # Parting first drops a few messages instead of handling them twice
+                for connection, connection_channels in parts.items():
+                    await connection.part_channels(*connection_channels)
+                for connection, connection_channels in joins.items():
+                    await connection.join_channels(*connection_channels)
+                self._update_rejoin_channels()
+            if moves:
+                logger.info(f"Moved {len(moves)} channels to rebalance the IRC connections")
+
+    def forget(self, channel: str):
+        """Removes a channel that could not be joined, so it is joined again on the next update."""
+        self.assignments.pop(channel.lower(), None)
+
+    async def sync(self):
+        """Re-applies the assignments after a connection became ready, see _update_rejoin_channels."""
+        async with self._lock:
+            self._update_rejoin_channels()
+
+    @staticmethod
+    async def _close_connection(connection: WSConnection):
+        # WSConnection._close also closes the HTTP session of the Client, which is still in use
+        connection._keeper.cancel()
+        for task in connection._background_tasks:
+            if not task.done():
+                task.cancel()
+        if connection._task_cleaner is not None:
+            connection._task_cleaner.cancel()
+        if connection._websocket is not None:
+            await connection._websocket.close()
+        logger.info("Closed empty IRC connection")
+
+    async def close(self):
+        for connection in self.connections[1:]:
+            await self._close_connection(connection)
+        self.connections = self.connections[:1]
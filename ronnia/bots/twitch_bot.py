@@ -1,54 +1,162 @@
 import asyncio
 import datetime
+import json
 import logging
 import os
+import time
 from collections import Counter
+from typing import NamedTuple
 
 from twitchio import Message, Channel, Chatter, Client, IRCCooldownError
 
-from ronnia.clients.mongo import RonniaDatabase
-from ronnia.clients.osu import OsuApiV2, OsuChatApiV2
+from ronnia.bots.irc_pool import IrcConnectionPool
+from ronnia.clients.mongo import get_ronnia_database, BEATMAP_EXPIRE_SECONDS, BEATMAP_MAX_STALE_SECONDS
+from ronnia.clients.osu import OsuApiV2, OsuChatApiV2, OsuApiPool
 from ronnia.models.beatmap import Beatmap, BeatmapType
 from ronnia.utils.beatmap import BeatmapParser
+from ronnia.utils.cache import AsyncLRUCache
+from ronnia.utils.capture import CHAT_CAPTURE_PATH, ChatCapture
+from ronnia.utils.digest import DigestBuffer
+from ronnia.utils.metrics import registry as metrics_registry
+from ronnia.utils.scheduler import FairScheduler, parse_weights
+from ronnia.utils.snapshot import SnapshotEntry
 from ronnia.utils.utils import convert_seconds_to_readable
 
 logger = logging.getLogger(__name__)
 
+REQUEST_WORKERS = int(os.getenv("REQUEST_WORKERS", 8))
+REQUEST_QUEUE_SIZE = int(os.getenv("REQUEST_QUEUE_SIZE", 50))
+# Optional per-channel scheduling weights, e.g. "channel_a:2,channel_b:0.5"
+REQUEST_CHANNEL_WEIGHTS = os.getenv("REQUEST_CHANNEL_WEIGHTS")
+# Opt-in handling of every beatmap link in a message as one request, instead of only the first link
+MULTI_LINK_REQUESTS = os.getenv("MULTI_LINK_REQUESTS", "0") == "1"
+MULTI_LINK_MAX = int(os.getenv("MULTI_LINK_MAX", 5))
+# Grouped osu! chat messages longer than this are split
+OSU_CHAT_MAX_LENGTH = int(os.getenv("OSU_CHAT_MAX_LENGTH", 450))
+TWITCH_CHAT_MAX_LENGTH = 500
+# Channels with the digest setting get one summary osu! chat message per window while they are above this rate
+DIGEST_REQUESTS_PER_MINUTE = float(os.getenv("DIGEST_REQUESTS_PER_MINUTE", 6))
+DIGEST_WINDOW_SECONDS = float(os.getenv("DIGEST_WINDOW_SECONDS", 30))
+DIGEST_MAX_MAPS = int(os.getenv("DIGEST_MAX_MAPS", 5))
+
+
+class DigestedRequest(NamedTuple):
+    requester_prefix: str
+    requester_name: str
+    requester_postfix: str
+    mods: str
+    beatmap_info: dict
+    beatmapset_info: dict
+
 
 class TwitchBot(Client):
     MAX_CHANNEL_JOIN_TRIES = 5
 
     def __init__(self, initial_channel_names: set[str], listener_update_sleep: int = 60):
-        self.ronnia_db = RonniaDatabase(os.getenv("MONGODB_URL"))
-        self.osu_api = OsuApiV2(
-            os.getenv("OSU_CLIENT_ID"), os.getenv("OSU_CLIENT_SECRET")
-        )
-        self.osu_chat_api = OsuChatApiV2(
-            os.getenv("OSU_CLIENT_ID"), os.getenv("OSU_CLIENT_SECRET")
-        )
+        self.ronnia_db = get_ronnia_database()
+        self.osu_api = OsuApiPool.from_env(OsuApiV2)
+        self.osu_chat_api = OsuApiPool.from_env(OsuChatApiV2)
 
         self.environment = os.getenv("ENVIRONMENT")
 
         self._join_lock = asyncio.Lock()
 
         self.join_fail_channels = Counter()
+        # Unix time of the last failed join of the channels in join_fail_channels
+        self.join_fail_times: dict[str, float] = {}
         self.listener_update_sleep = listener_update_sleep
         self.server_socket = None
         self.receiver_task: asyncio.Task | None = None
+        # Set once the BotManager can connect to the streaming channel receiver
+        self.receiver_ready = asyncio.Event()
+        self._first_message_logged = False
+        self.background_tasks: list[asyncio.Task] = []
         self.user_last_request = {}
+        self._beatmap_refresh_tasks: dict[int, asyncio.Task] = {}
+        self.beatmap_attributes_cache = AsyncLRUCache()
+        self.request_scheduler = FairScheduler(self.process_request,
+                                               workers=REQUEST_WORKERS,
+                                               max_queue_size=REQUEST_QUEUE_SIZE,
+                                               weights=parse_weights(REQUEST_CHANNEL_WEIGHTS))
+        metrics_registry.register("request_scheduler", self.request_scheduler.metrics)
+        self.request_digest = DigestBuffer(self._send_digest_to_in_game,
+                                           rate_per_minute=DIGEST_REQUESTS_PER_MINUTE,
+                                           window_seconds=DIGEST_WINDOW_SECONDS)
+        metrics_registry.register("request_digest", self.request_digest.metrics)
+        # Opt-in recording of the received messages, see benchmarks/replay.py
+        self.chat_capture = ChatCapture(CHAT_CAPTURE_PATH) if CHAT_CAPTURE_PATH else None
+        if self.chat_capture is not None:
+            metrics_registry.register("chat_capture", self.chat_capture.metrics)
 
         token = os.getenv("TMI_TOKEN").replace("oauth:", "")
-        initial_channels = [os.getenv("BOT_NICK"), *initial_channel_names]
+        # Streaming channels are joined through the connection pool once the bot is ready
+        self.initial_channel_names = initial_channel_names
         super().__init__(token=token,
                          client_secret=os.getenv("TWITCH_CLIENT_SECRET"),
-                         initial_channels=initial_channels)
+                         initial_channels=[os.getenv("BOT_NICK")])
+        self.irc_pool = IrcConnectionPool(self)
+        metrics_registry.register("irc", self.irc_pool.metrics)
+
+    @property
+    def connected_channels(self) -> list[Channel]:
+        return self.irc_pool.connected_channels
+
+    async def join_channels(self, channels: list[str] | tuple[str]):
+        await self.irc_pool.join_channels(channels)
+
+    async def part_channels(self, channels: list[str] | tuple[str]):
+        await self.irc_pool.part_channels(channels)
 
     async def close(self):
         self.receiver_task.cancel()
+        for task in self.background_tasks:
+            task.cancel()
+        await self.ronnia_db.rollup_buffer.flush()
+        await self.ronnia_db.sketches.persist()
+        # Buffered requests are sent before the chat client is closed
+        await self.request_digest.flush_due(now=float("inf"))
         await self.osu_api.close_session()
         await self.osu_chat_api.close_session()
+        await self.irc_pool.close()
+        if self.chat_capture is not None:
+            self.chat_capture.close()
         await super().close()
 
+    def snapshot_state(self, channel_last_seen: dict[str, float]) -> dict[str, list[SnapshotEntry]]:
+        """
+        Hot in-memory state for a warm start after a restart, see restore_state.
+        Entries are stamped with the time they were last confirmed, so the snapshot reader can drop the stale ones.
+        :param channel_last_seen: Unix time the channels were last seen streaming, see ChannelPresence.last_seen
+        """
+        now = time.time()
+        return {
+            "channels": [SnapshotEntry(channel, channel_last_seen[channel])
+                         for channel in self.irc_pool.channels if channel in channel_last_seen],
+            "cooldowns": [SnapshotEntry(user_key, last_request.timestamp())
+                          for user_key, last_request in self.user_last_request.items()],
+            "join_failures": [SnapshotEntry(channel, self.join_fail_times.get(channel, now), str(count).encode())
+                              for channel, count in self.join_fail_channels.items()],
+            "beatmap_attributes": [
+                SnapshotEntry(f"{beatmap_id}:{mods}", self.beatmap_attributes_cache.get_inserted_at((beatmap_id, mods)),
+                              json.dumps(attributes).encode())
+                for (beatmap_id, mods), attributes in self.beatmap_attributes_cache.items()
+            ],
+        }
+
+    def restore_state(self, snapshot: dict[str, list[SnapshotEntry]]):
+        """Restores the state saved by snapshot_state, joined channels are restored by the BotManager."""
+        for entry in snapshot.get("cooldowns", []):
+            self.user_last_request[entry.key] = datetime.datetime.fromtimestamp(entry.timestamp)
+        for entry in snapshot.get("join_failures", []):
+            self.join_fail_channels[entry.key] = int(entry.value)
+            self.join_fail_times[entry.key] = entry.timestamp
+        for entry in snapshot.get("beatmap_attributes", []):
+            beatmap_id, mods = entry.key.split(":")
+            self.beatmap_attributes_cache.set((int(beatmap_id), int(mods)), json.loads(entry.value),
+                                              inserted_at=entry.timestamp)
+        logger.info(f"Restored {len(self.user_last_request)} cooldowns, {len(self.join_fail_channels)} join failures "
+                    f"and {len(self.beatmap_attributes_cache)} beatmap attributes from the snapshot")
+
     async def streaming_channel_receiver(self):
         """Receiver task that gets the streaming viewers from BotManager"""
         logger.info("Starting streaming channels message receiver")
@@ -56,6 +164,7 @@ class TwitchBot(Client):
         address = ("localhost", 0)
         server = await asyncio.start_server(self.handle_bot_manager_message, *address)
         self.server_socket = server.sockets[0]
+        self.receiver_ready.set()
 
         logger.info(f'TwitchBot started serving on {self.server_socket.getsockname()}')
 
@@ -100,7 +209,7 @@ class TwitchBot(Client):
     async def join_streaming_channels(self, message: list[str]):
         """Join the channels that started streaming and leave the ones that stopped streaming."""
         streaming_users_set = set(message)
-        currently_joined_channels = set(channel.name for channel in list(filter(None, self.connected_channels)))
+        currently_joined_channels = self.irc_pool.channels
         new_channels = list(streaming_users_set.difference(currently_joined_channels))
         closed_channels = list(currently_joined_channels.difference(streaming_users_set))
 
@@ -110,6 +219,7 @@ class TwitchBot(Client):
         async with self._join_lock:
             await self.join_channels(new_channels)
             await self.part_channels(closed_channels)
+            await self.irc_pool.rebalance()
 
     async def event_message(self, message: Message):
         if message.author is None:
@@ -118,34 +228,133 @@ class TwitchBot(Client):
         logger.info(
             f"{message.channel.name} - {message.author.name}: {message.content}"
         )
-
+        if not self._first_message_logged:
+            self._first_message_logged = True
+            logger.info("Handled first message since startup")
+        if self.chat_capture is not None:
+            self.chat_capture.record(message.channel.name, message.author.name, message.tags, message.content)
+
+        # Requests are processed in per-channel fair order, so a raid in one channel doesn't delay the others.
+        # The links are parsed once here and handed to the request handlers with the message.
+        beatmaps = self._parse_message_beatmap_links(message)
+        if beatmaps:
+            self.request_scheduler.submit(message.channel.name, (message, beatmaps))
+
+    async def process_request(self, request: tuple[Message, list[Beatmap]]):
+        message, beatmaps = request
         try:
-            await self.handle_request(message)
+            if len(beatmaps) > 1:
+                await self.handle_multi_request(message, beatmaps)
+            else:
+                await self.handle_request(message, beatmaps[0])
         except AssertionError as e:
             logger.info(f"Check unsuccessful: {e}")
 
     async def get_beatmap(self, beatmap: Beatmap) -> tuple[dict, dict]:
+        """
+        Gets the beatmap from the database, falls back to osu! api if it is not cached.
+        Stale beatmaps are served immediately and refreshed in the background. If the osu! api is failing,
+        beatmaps up to BEATMAP_MAX_STALE_SECONDS old are served instead.
+        """
         db_beatmap = await self.ronnia_db.get_beatmap(beatmap=beatmap)
-        if db_beatmap is None:
-            beatmap_info, beatmapset_info = await self.osu_api.get_beatmap(beatmap=beatmap)
-            if beatmap.type is BeatmapType.MAP:
-                _ = asyncio.create_task(self.ronnia_db.add_beatmap(beatmap_info))
-        else:
-            beatmap_info = db_beatmap
-            beatmapset_info = db_beatmap["beatmapset"]
-
+        if db_beatmap is None or "beatmapset" not in db_beatmap:
+            return await self._fetch_beatmap(beatmap)
+
+        beatmap_age = self.ronnia_db.get_beatmap_age(db_beatmap)
+        if beatmap_age > BEATMAP_MAX_STALE_SECONDS:
+            try:
+                return await self._fetch_beatmap(beatmap)
+            except Exception as e:
+                logger.warning(f"Could not refresh beatmap {beatmap.id}, it is too old to be served.", exc_info=e)
+                raise e
+        if beatmap_age > BEATMAP_EXPIRE_SECONDS:
+            self._refresh_beatmap_in_background(db_beatmap["id"])
+
+        return db_beatmap, db_beatmap["beatmapset"]
+
+    async def _fetch_beatmap(self, beatmap: Beatmap) -> tuple[dict, dict]:
+        """Gets the beatmap from osu! api and caches it to the database."""
+        beatmap_info, beatmapset_info = await self.osu_api.get_beatmap(beatmap=beatmap)
+        match beatmap.type:
+            case BeatmapType.MAP:
+                _ = asyncio.create_task(self.ronnia_db.add_beatmap(beatmap_info, beatmapset_info))
+            case BeatmapType.MAPSET:
+                _ = asyncio.create_task(self.ronnia_db.add_beatmapset(beatmapset_info))
         return beatmap_info, beatmapset_info
 
-    async def handle_request(self, message: Message):
-        """Parses the beatmap link and then sends it to Twitch IRC."""
-        beatmap = self._check_message_contains_beatmap_link(message)
-        if not beatmap:
+    async def get_beatmaps(self, beatmaps: list[Beatmap]) -> list[tuple[Beatmap, dict, dict]]:
+        """
+        Gets several beatmaps with one database query, the missing and too old ones with one osu! api lookup.
+        Beatmapsets have no batched osu! api lookup and are fetched one by one.
+        :return: (beatmap, beatmap info, beatmapset info) of the found beatmaps, in the given order
+        """
+        db_beatmaps = await self.ronnia_db.get_beatmaps(beatmaps)
+        by_id = {db_beatmap["id"]: db_beatmap for db_beatmap in db_beatmaps}
+        by_beatmapset_id = {db_beatmap["beatmapset_id"]: db_beatmap for db_beatmap in db_beatmaps
+                            if db_beatmap.get("beatmapset_default")}
+
+        found = {}
+        missing = []
+        for beatmap in beatmaps:
+            lookup = by_id if beatmap.type == BeatmapType.MAP else by_beatmapset_id
+            db_beatmap = lookup.get(beatmap.id)
+            if db_beatmap is None or "beatmapset" not in db_beatmap:
+                missing.append(beatmap)
+                continue
+            beatmap_age = self.ronnia_db.get_beatmap_age(db_beatmap)
+            if beatmap_age > BEATMAP_MAX_STALE_SECONDS:
+                missing.append(beatmap)
+                continue
+            if beatmap_age > BEATMAP_EXPIRE_SECONDS:
+                self._refresh_beatmap_in_background(db_beatmap["id"])
+            found[(beatmap.type, beatmap.id)] = (db_beatmap, db_beatmap["beatmapset"])
+
+        if missing:
+            found |= await self._fetch_beatmaps(missing)
+        return [(beatmap, *found[(beatmap.type, beatmap.id)]) for beatmap in beatmaps
+                if (beatmap.type, beatmap.id) in found]
+
+    async def _fetch_beatmaps(self, beatmaps: list[Beatmap]) -> dict[tuple[BeatmapType, int], tuple[dict, dict]]:
+        """Gets the beatmaps from osu! api and caches them to the database with a single write."""
+        fetched = {}
+        beatmap_ids = [beatmap.id for beatmap in beatmaps if beatmap.type == BeatmapType.MAP]
+        async with asyncio.TaskGroup() as tg:
+            beatmaps_task = tg.create_task(self.osu_api.get_beatmaps(beatmap_ids)) if beatmap_ids else None
+            beatmapset_tasks = {beatmap.id: tg.create_task(self._fetch_beatmap(beatmap))
+                                for beatmap in beatmaps if beatmap.type == BeatmapType.MAPSET}
+
+        if beatmaps_task is not None:
+            beatmap_infos = beatmaps_task.result()
+            if beatmap_infos:
+                _ = asyncio.create_task(self.ronnia_db.add_beatmaps(beatmap_infos))
+            for beatmap_info in beatmap_infos:
+                fetched[(BeatmapType.MAP, beatmap_info["id"])] = (beatmap_info, beatmap_info["beatmapset"])
+        for beatmapset_id, task in beatmapset_tasks.items():
+            fetched[(BeatmapType.MAPSET, beatmapset_id)] = task.result()
+        return fetched
+
+    def _refresh_beatmap_in_background(self, beatmap_id: int):
+        """Starts a single background refresh for the stale beatmap, if one is not running already."""
+        if beatmap_id in self._beatmap_refresh_tasks:
             return
 
+        logger.debug(f"Refreshing stale beatmap {beatmap_id} in the background")
+        task = asyncio.create_task(self._fetch_beatmap(Beatmap(id=beatmap_id, type=BeatmapType.MAP, mods="")))
+        self._beatmap_refresh_tasks[beatmap_id] = task
+        task.add_done_callback(lambda t: self._on_beatmap_refresh_done(beatmap_id, t))
+
+    def _on_beatmap_refresh_done(self, beatmap_id: int, task: asyncio.Task):
+        self._beatmap_refresh_tasks.pop(beatmap_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background refresh of beatmap {beatmap_id} failed, serving stale data.",
+                           exc_info=task.exception())
+
+    async def handle_request(self, message: Message, beatmap: Beatmap):
+        """Sends the requested beatmap parsed from the message to Twitch IRC."""
         beatmap_info, beatmapset_info = await self.get_beatmap(beatmap)
 
         if beatmap_info:
-            await self.check_request_criteria(message, beatmap_info)
+            await self.check_request_criteria(message, beatmap_info, given_mods=beatmap.mods)
 
             logger.info(f"Sending beatmap {beatmap_info['id']} to user {message.channel.name}")
             if self.environment == "testing":
@@ -164,27 +373,80 @@ class TwitchBot(Client):
                         )
                     )
                 tg.create_task(
-                    self._send_beatmap_to_in_game(
+                    self._deliver_in_game(
                         message=message,
-                        beatmap_info=beatmap_info,
-                        beatmapset_info=beatmapset_info,
-                        given_mods=beatmap.mods,
+                        requested=[(beatmap, beatmap_info, beatmapset_info)],
                     )
                 )
                 tg.create_task(
                     self.ronnia_db.add_request(
                         requested_beatmap_id=int(beatmap_info["id"]),
-                        requested_channel_name=message.channel.name,
-                        requester_channel_name=message.author.name,
-                        mods=beatmap.mods,
+                        requested_channel_id=int(message.tags["room-id"]),
+                        requester_twitch_id=int(message.author.id),
+                        mods=beatmap.mods_bitmask,
                     )
                 )
 
-    async def check_beatmap_star_rating(self, message: Message, beatmap_info):
-        """Check if the beatmap's star rating is matching the user settings."""
+    async def handle_multi_request(self, message: Message, beatmaps: list[Beatmap]):
+        """
+        Checks the requester once and sends the beatmaps parsed from the message to osu! chat as one grouped message.
+        """
+        requested = await self.get_beatmaps(beatmaps)
+        if not requested:
+            return
+
+        if not await self.ronnia_db.get_test_status(message.channel.name):
+            await self.check_requester_criteria(message)
+            requested = await self.filter_beatmaps_by_star_rating(message, requested)
+
+        logger.info(f"Sending {len(requested)} beatmaps to user {message.channel.name}")
+        if self.environment == "testing":
+            return
+        async with asyncio.TaskGroup() as tg:
+            if await self.ronnia_db.get_echo_status(twitch_username=message.channel.name):
+                logger.info(f"Sending echo message to {message.channel.name}")
+                tg.create_task(self._send_grouped_twitch_message(message=message, requested=requested))
+            tg.create_task(self._deliver_in_game(message=message, requested=requested))
+            tg.create_task(
+                self.ronnia_db.add_requests(
+                    requester_twitch_id=int(message.author.id),
+                    requested_channel_id=int(message.tags["room-id"]),
+                    beatmaps=[(int(beatmap_info["id"]), beatmap.mods_bitmask)
+                              for beatmap, beatmap_info, _ in requested],
+                )
+            )
+
+    async def get_star_rating(self, beatmap_info: dict, given_mods: str) -> float:
+        """
+        Get the star rating of the beatmap with the given mods.
+        Mods that do not change the difficulty use the nomod star rating without any extra lookups.
+        :param beatmap_info: Beatmap info
+        :param given_mods: Mods as string
+        :return: Star rating of the beatmap with mods
+        """
+        mods = BeatmapParser.get_difficulty_mod_bitmask(given_mods)
+        if mods == 0:
+            return float(beatmap_info["difficulty_rating"])
+
+        beatmap_id = int(beatmap_info["id"])
+        attributes = await self.beatmap_attributes_cache.get_or_load(
+            (beatmap_id, mods), lambda: self._get_beatmap_attributes(beatmap_id, mods)
+        )
+        return float(attributes["star_rating"])
+
+    async def _get_beatmap_attributes(self, beatmap_id: int, mods: int) -> dict:
+        """Gets the beatmap attributes from the database, falls back to osu! api if it is not cached."""
+        attributes = await self.ronnia_db.get_beatmap_attributes(beatmap_id=beatmap_id, mods=mods)
+        if attributes is None:
+            response = await self.osu_api.get_beatmap_attributes(beatmap_id=beatmap_id, mods=mods)
+            attributes = response["attributes"]
+            _ = asyncio.create_task(self.ronnia_db.add_beatmap_attributes(beatmap_id, mods, attributes))
+        return attributes
+
+    async def check_beatmap_star_rating(self, message: Message, beatmap_info, given_mods: str = ""):
+        """Check if the beatmap's star rating with mods is matching the user settings."""
         twitch_username = message.channel.name
         requester_name = message.author.name
-        diff_rating = float(beatmap_info["difficulty_rating"])
         range_low, range_high = await self.ronnia_db.get_setting(
             twitch_username_or_id=twitch_username, setting_key="sr"
         )
@@ -192,17 +454,55 @@ class TwitchBot(Client):
         if range_low == -1 or range_high == -1:
             return
 
+        diff_rating = await self.get_star_rating(beatmap_info, given_mods)
+        mods_postfix = f" with {given_mods}" if given_mods else ""
         assert range_low < diff_rating < range_high, (
             f"@{requester_name} Streamer is accepting requests between {range_low:.1f}-{range_high:.1f}* difficulty."
-            f" Your map is {diff_rating:.1f}*."
+            f" Your map is {diff_rating:.1f}*{mods_postfix}."
+        )
+
+    async def filter_beatmaps_by_star_rating(
+            self, message: Message, requested: list[tuple[Beatmap, dict, dict]]
+    ) -> list[tuple[Beatmap, dict, dict]]:
+        """
+        Keeps the beatmaps whose star rating with mods is matching the user settings.
+        Raises assertion error if none of them match, the requester is told once about the skipped beatmaps.
+        """
+        range_low, range_high = await self.ronnia_db.get_setting(
+            twitch_username_or_id=message.channel.name, setting_key="sr"
         )
+        if range_low == -1 or range_high == -1:
+            return requested
 
-    async def check_request_criteria(self, message: Message, beatmap_info: dict):
+        diff_ratings = await asyncio.gather(
+            *(self.get_star_rating(beatmap_info, beatmap.mods) for beatmap, beatmap_info, _ in requested)
+        )
+        accepted = [request for request, diff_rating in zip(requested, diff_ratings)
+                    if range_low < diff_rating < range_high]
+        if len(accepted) < len(requested):
+            skipped_message = (
+                f"@{message.author.name} Streamer is accepting requests between {range_low:.1f}-{range_high:.1f}*"
+                f" difficulty. Skipped {len(requested) - len(accepted)} of your {len(requested)} maps."
+            )
+            await message.channel.send(skipped_message)
+            assert accepted, skipped_message
+        return accepted
+
+    async def check_request_criteria(self, message: Message, beatmap_info: dict, given_mods: str = ""):
         """Check if the beatmap request matches the user settings"""
         test_status = await self.ronnia_db.get_test_status(message.channel.name)
         if test_status:
             return
 
+        await self.check_requester_criteria(message)
+        try:
+            await self.check_beatmap_star_rating(message, beatmap_info, given_mods=given_mods)
+        except AssertionError as e:
+            await message.channel.send(str(e))
+            raise e
+
+    async def check_requester_criteria(self, message: Message):
+        """Check if the requester is allowed to request beatmaps in the channel"""
         async with asyncio.TaskGroup() as tg:
             tg.create_task(self.check_if_author_is_broadcaster(message))
             tg.create_task(self._check_user_cooldown(
@@ -211,11 +511,6 @@ class TwitchBot(Client):
             tg.create_task(self.check_sub_only_mode(message))
             tg.create_task(self.check_channel_points_only_mode(message))
             tg.create_task(self.check_user_excluded(message))
-        try:
-            await self.check_beatmap_star_rating(message, beatmap_info)
-        except AssertionError as e:
-            await message.channel.send(str(e))
-            raise e
 
     async def check_user_excluded(self, message: Message):
         """
@@ -269,19 +564,24 @@ class TwitchBot(Client):
         if isinstance(channel, Channel):
             if channel.name in self.join_fail_channels:
                 self.join_fail_channels.pop(channel.name)
+                self.join_fail_times.pop(channel.name, None)
         elif isinstance(channel, str):
             if channel in self.join_fail_channels:
                 self.join_fail_channels.pop(channel)
+                self.join_fail_times.pop(channel, None)
         else:
             raise AssertionError(f"Channel type {type(channel)} is not supported on event_channel_joined()")
 
     async def event_channel_join_failure(self, channel: str):
+        self.irc_pool.forget(channel)
         self.join_fail_channels[channel] += 1
+        self.join_fail_times[channel] = time.time()
         if self.join_fail_channels[channel] > self.MAX_CHANNEL_JOIN_TRIES:
             logger.warning(msg=f"Bot could not join channel after {self.MAX_CHANNEL_JOIN_TRIES} tries. Removing user",
                            extra={"channel": channel})
             await self.ronnia_db.remove_user(twitch_username=channel)
             self.join_fail_channels.pop(channel)
+            self.join_fail_times.pop(channel, None)
 
     @staticmethod
     async def check_if_author_is_broadcaster(message: Message):
@@ -353,6 +653,46 @@ class TwitchBot(Client):
         for user in pop_list:
             self.user_last_request.pop(user)
 
+    async def _deliver_in_game(self, message: Message, requested: list[tuple[Beatmap, dict, dict]]):
+        """
+        Sends the requested beatmaps to osu!irc, or adds them to the digest of the channel
+        if it has the digest setting and is above the digest request rate.
+        :param message: Twitch Message object
+        :param requested: (beatmap, beatmap info, beatmapset info) of the requested beatmaps
+        """
+        channel_name = message.channel.name
+        # Only channels with the digest setting count towards the digest rate, each beatmap as one request
+        if (await self.ronnia_db.get_setting("digest", channel_name)
+                and self.request_digest.is_busy(channel_name, count=len(requested))):
+            extra_prefix, extra_postfix = self._get_requester_labels(message)
+            for beatmap, beatmap_info, beatmapset_info in requested:
+                self.request_digest.add(channel_name, DigestedRequest(extra_prefix, message.author.name,
+                                                                      extra_postfix, beatmap.mods,
+                                                                      beatmap_info, beatmapset_info))
+            logger.info(f"Added {len(requested)} beatmaps to the digest of {channel_name}")
+            return
+
+        if len(requested) == 1:
+            beatmap, beatmap_info, beatmapset_info = requested[0]
+            await self._send_beatmap_to_in_game(message=message, beatmap_info=beatmap_info,
+                                                beatmapset_info=beatmapset_info, given_mods=beatmap.mods)
+        else:
+            await self._send_beatmaps_to_in_game(message=message, requested=requested)
+
+    async def _send_digest_to_in_game(self, channel_name: str, digested: list[DigestedRequest]):
+        """
+        Sends the buffered requests of the channel to osu!irc bot as one summary message
+        :param channel_name: Twitch channel name
+        :param digested: Buffered requests in the order they were accepted
+        """
+        irc_messages = self._prepare_digest_irc_messages(digested)
+        target_id = (
+            await self.ronnia_db.get_user_from_twitch_username(channel_name)
+        ).osuId
+        logger.info(f"Sending digest of {len(digested)} requests to user {channel_name}")
+        for irc_message in irc_messages:
+            await self.osu_chat_api.send_message(target_id=target_id, message=irc_message)
+
     async def _send_beatmap_to_in_game(
             self,
             message: Message,
@@ -397,6 +737,36 @@ class TwitchBot(Client):
         except IRCCooldownError as e:
             logger.warning("IRC Cooldown", exc_info=e)
 
+    async def _send_beatmaps_to_in_game(self, message: Message, requested: list[tuple[Beatmap, dict, dict]]):
+        """
+        Sends the requested beatmaps to osu!irc bot as one grouped message
+        :param message: Twitch Message object
+        :param requested: (beatmap, beatmap info, beatmapset info) of the requested beatmaps
+        """
+        irc_messages = self._prepare_grouped_irc_messages(message=message, requested=requested)
+        target_id = (
+            await self.ronnia_db.get_user_from_twitch_username(message.channel.name)
+        ).osuId
+        for irc_message in irc_messages:
+            await self.osu_chat_api.send_message(target_id=target_id, message=irc_message)
+
+    @staticmethod
+    async def _send_grouped_twitch_message(message: Message, requested: list[tuple[Beatmap, dict, dict]]):
+        """
+        Sends one twitch feedback message for the requested beatmaps
+        :param message: Twitch Message object
+        :param requested: (beatmap, beatmap info, beatmapset info) of the requested beatmaps
+        """
+        bmap_info_text = ", ".join(f"{beatmapset_info['artist']} - {beatmapset_info['title']} "
+                                   f"[{beatmap_info['version']}]" for _, beatmap_info, beatmapset_info in requested)
+        postfix = f" - {len(requested)} requests sent!"
+        if len(bmap_info_text) + len(postfix) > TWITCH_CHAT_MAX_LENGTH:
+            bmap_info_text = bmap_info_text[:TWITCH_CHAT_MAX_LENGTH - len(postfix) - 3] + "..."
+        try:
+            await message.channel.send(f"{bmap_info_text}{postfix}")
+        except IRCCooldownError as e:
+            logger.warning("IRC Cooldown", exc_info=e)
+
     @staticmethod
     def _check_message_contains_beatmap_link(
             message: Message,
@@ -413,6 +783,18 @@ class TwitchBot(Client):
             if beatmap:
                 return beatmap
 
+    @staticmethod
+    def _parse_message_beatmap_links(message: Message) -> list[Beatmap]:
+        """
+        Parses the requested beatmaps of the message, every link with MULTI_LINK_REQUESTS, otherwise the first one.
+        :param message: Twitch Message object
+        :return: Requested beatmaps, empty if the message has no beatmap links
+        """
+        if MULTI_LINK_REQUESTS:
+            return BeatmapParser.parse_beatmap_links(message.content, limit=MULTI_LINK_MAX)
+        beatmap = TwitchBot._check_message_contains_beatmap_link(message)
+        return [beatmap] if beatmap else []
+
     @staticmethod
     async def _prepare_irc_message(
             message: Message,
@@ -427,18 +809,90 @@ class TwitchBot(Client):
         :param given_mods: Mods as string
         :return:
         """
-        artist = beatmapset_info["artist"]
-        title = beatmapset_info["title"]
-        version = beatmap_info["version"]
-        bpm = beatmap_info["bpm"]
-        beatmap_status = str(beatmap_info["status"]).capitalize()
-        difficulty_rating = float(beatmap_info["difficulty_rating"])
-        beatmap_id = beatmap_info["id"]
-        beatmap_length = convert_seconds_to_readable(beatmap_info["hit_length"])
-        beatmap_info = (
-            f"[https://osu.ppy.sh/b/{beatmap_id} {artist} - {title} [{version}]] "
-            f"({bpm} BPM, {difficulty_rating:.2f}*, {beatmap_length}) {given_mods}"
-        )
+        extra_prefix, extra_postfix = TwitchBot._get_requester_labels(message)
+        beatmap_text = TwitchBot._format_beatmap(beatmap_info, beatmapset_info, given_mods)
+        return f"{extra_prefix}{message.author.name} -> {beatmap_text} {extra_postfix}"
+
+    @staticmethod
+    def _prepare_grouped_irc_messages(
+            message: Message,
+            requested: list[tuple[Beatmap, dict, dict]],
+            max_length: int = OSU_CHAT_MAX_LENGTH,
+    ) -> list[str]:
+        """
+        Prepare one osu!irc message for several requested beatmaps, split into more messages if it is too long.
+        :param message: Twitch message
+        :param requested: (beatmap, beatmap info, beatmapset info) of the requested beatmaps
+        :param max_length: Maximum length of a message
+        :return: Messages to send in order
+        """
+        extra_prefix, extra_postfix = TwitchBot._get_requester_labels(message)
+        beatmap_texts = [TwitchBot._format_beatmap(beatmap_info, beatmapset_info, beatmap.mods).rstrip()
+                         for beatmap, beatmap_info, beatmapset_info in requested]
+        return TwitchBot._join_irc_messages(f"{extra_prefix}{message.author.name} -> ", beatmap_texts,
+                                            f" {extra_postfix}", max_length)
+
+    @staticmethod
+    def _prepare_digest_irc_messages(
+            digested: list[DigestedRequest],
+            max_maps: int = DIGEST_MAX_MAPS,
+            max_length: int = OSU_CHAT_MAX_LENGTH,
+    ) -> list[str]:
+        """
+        Prepare the summary osu!irc message of buffered requests, listing the most requested beatmaps first
+        with their requesters, split into more messages if it is too long.
+        :param digested: Buffered requests
+        :param max_maps: Maximum number of beatmaps to list, the rest are only counted
+        :param max_length: Maximum length of a message
+        :return: Messages to send in order
+        """
+        requesters_by_beatmap: dict[int, dict[str, str]] = {}
+        first_requests: dict[int, DigestedRequest] = {}
+        for request in digested:
+            beatmap_id = request.beatmap_info["id"]
+            first_requests.setdefault(beatmap_id, request)
+            mods = f" {request.mods}" if request.mods else ""
+            postfix = f" {request.requester_postfix}" if request.requester_postfix else ""
+            requesters_by_beatmap.setdefault(beatmap_id, {}).setdefault(
+                request.requester_name, f"{request.requester_prefix}{request.requester_name}{mods}{postfix}"
+            )
+
+        # Sorting is stable, beatmaps with as many requesters stay in the order they were first requested
+        top_beatmap_ids = sorted(requesters_by_beatmap,
+                                 key=lambda beatmap_id: -len(requesters_by_beatmap[beatmap_id]))
+        beatmap_texts = []
+        for beatmap_id in top_beatmap_ids[:max_maps]:
+            request = first_requests[beatmap_id]
+            requesters = requesters_by_beatmap[beatmap_id]
+            beatmap_text = TwitchBot._format_beatmap(request.beatmap_info, request.beatmapset_info, "").rstrip()
+            beatmap_texts.append(f"{beatmap_text} x{len(requesters)}: {', '.join(requesters.values())}")
+
+        more_beatmaps = len(top_beatmap_ids) - max_maps
+        postfix = f" | and {more_beatmaps} more maps" if more_beatmaps > 0 else ""
+        return TwitchBot._join_irc_messages(f"Digest of {len(digested)} requests -> ", beatmap_texts, postfix,
+                                            max_length)
+
+    @staticmethod
+    def _join_irc_messages(prefix: str, parts: list[str], postfix: str, max_length: int) -> list[str]:
+        """
+        Join the parts with " | " into messages with the prefix and postfix, starting a new message
+        whenever the next part would make it longer than max_length.
+        """
+        groups = [[]]
+        for part in parts:
+            candidate = " | ".join(groups[-1] + [part])
+            if groups[-1] and len(f"{prefix}{candidate}{postfix}") > max_length:
+                groups.append([])
+            groups[-1].append(part)
+        return [f"{prefix}{' | '.join(group)}{postfix}" for group in groups]
+
+    @staticmethod
+    def _get_requester_labels(message: Message) -> tuple[str, str]:
+        """
+        Get the labels of the requester shown around the request in osu!irc.
+        :param message: Twitch message
+        :return: Prefix with the role of the requester and postfix for channel points requests
+        """
         extra_postfix = ""
         extra_prefix = ""
 
@@ -454,10 +908,45 @@ class TwitchBot(Client):
         if "custom-reward-id" in message.tags:
             extra_postfix += "+ USED POINTS"
 
-        return f"{extra_prefix}{message.author.name} -> [{beatmap_status}] {beatmap_info} {extra_postfix}"
+        return extra_prefix, extra_postfix
+
+    @staticmethod
+    def _format_beatmap(beatmap_info: dict, beatmapset_info: dict, given_mods: str) -> str:
+        """
+        Format the beatmap for osu!irc, with its status, link and details.
+        :param beatmap_info: Beatmap info taken from osu!api as dictionary
+        :param beatmapset_info: Beatmapset info taken from osu!api as dictionary
+        :param given_mods: Mods as string
+        :return:
+        """
+        artist = beatmapset_info["artist"]
+        title = beatmapset_info["title"]
+        version = beatmap_info["version"]
+        bpm = beatmap_info["bpm"]
+        beatmap_status = str(beatmap_info["status"]).capitalize()
+        difficulty_rating = float(beatmap_info["difficulty_rating"])
+        beatmap_id = beatmap_info["id"]
+        beatmap_length = convert_seconds_to_readable(beatmap_info["hit_length"])
+        return (
+            f"[{beatmap_status}] [https://osu.ppy.sh/b/{beatmap_id} {artist} - {title} [{version}]] "
+            f"({bpm} BPM, {difficulty_rating:.2f}*, {beatmap_length}) {given_mods}"
+        )
 
     async def event_ready(self):
         logger.info(f"Connected channels: {self.connected_channels}")
         logger.info("Successfully initialized bot!")
         logger.info(f"Ready | {self.nick}")
+        # Every IRC connection of the pool dispatches its own ready event, also after reconnecting
+        await self.irc_pool.sync()
+        if self.receiver_task is not None:
+            return
         self.receiver_task = self.loop.create_task(self.streaming_channel_receiver())
+        if self.initial_channel_names:
+            self.background_tasks.append(self.loop.create_task(self.join_channels(self.initial_channel_names)))
+        self.background_tasks += [self.loop.create_task(self.osu_api.refresh_tokens()),
+                                  self.loop.create_task(self.osu_chat_api.refresh_tokens()),
+                                  self.loop.create_task(metrics_registry.report()),
+                                  self.loop.create_task(self.ronnia_db.rollup_buffer.run()),
+                                  self.loop.create_task(self.ronnia_db.sketches.run()),
+                                  self.loop.create_task(self.request_scheduler.run()),
+                                  self.loop.create_task(self.request_digest.run())]
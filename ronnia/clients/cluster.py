@@ -0,0 +1,180 @@
+import asyncio
+import datetime
+import logging
+import math
+import os
+import random
+import socket
+import time
+import uuid
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import DuplicateKeyError
+
+from ronnia.utils.sketches import hash64
+
+logger = logging.getLogger(__name__)
+
+# Nodes coordinate only if CLUSTER_PARTITIONS is set, otherwise a single node owns every channel
+CLUSTER_PARTITIONS = int(os.getenv("CLUSTER_PARTITIONS", 0))
+CLUSTER_LEASE_SECONDS = float(os.getenv("CLUSTER_LEASE_SECONDS", 30))
+CLUSTER_HEARTBEAT_SECONDS = float(os.getenv("CLUSTER_HEARTBEAT_SECONDS", 10))
+LEADER_LEASE_ID = "leader"
+
+
+def get_partition(channel: str, partitions: int) -> int:
+    return hash64(channel.lower()) % partitions
+
+
+def get_fair_share(partitions: int, alive_nodes: int) -> int:
+    return math.ceil(partitions / max(alive_nodes, 1))
+
+
+def get_default_node_id() -> str:
+    return os.getenv("CLUSTER_NODE_ID") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class ClusterCoordinator:
+    """
+    Coordinates several bot nodes through leases in MongoDB.
+    Channels are hashed into partitions, and every node claims up to its fair share of the partitions.
+    One node also holds the leader lease and runs the live status poll, publishing its result on the leader lease.
+    Leases are renewed every heartbeat, so the partitions of a dead node are claimed by the others
+    within lease_seconds + heartbeat_seconds. A node stops serving its partitions if it can't renew them in time.
+    """
+
+    def __init__(self, leases_col: AsyncCollection, nodes_col: AsyncCollection, partitions: int = CLUSTER_PARTITIONS,
+                 node_id: Optional[str] = None, lease_seconds: float = CLUSTER_LEASE_SECONDS,
+                 heartbeat_seconds: float = CLUSTER_HEARTBEAT_SECONDS):
+        assert partitions > 0, "Cluster needs at least one partition."
+        assert heartbeat_seconds < lease_seconds, "Leases must outlive the heartbeat interval."
+        self.leases_col = leases_col
+        self.nodes_col = nodes_col
+        self.partitions = partitions
+        self.node_id = node_id or get_default_node_id()
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+
+        self.owned_partitions: set[int] = set()
+        self.is_leader = False
+        # Monotonic deadline of the last successful renewal, the leases are not trusted after it
+        self._valid_until = 0.0
+        # Set when the owned partitions or the leadership changed
+        self.changed = asyncio.Event()
+        self.ready = asyncio.Event()
+
+    @staticmethod
+    def partition_lease_id(partition: int) -> str:
+        return f"partition:{partition}"
+
+    def owns(self, channel: str) -> bool:
+        return self._is_valid() and get_partition(channel, self.partitions) in self.owned_partitions
+
+    def _is_valid(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    async def _try_acquire(self, lease_id: str, now: datetime.datetime, expires_at: datetime.datetime) -> bool:
+        try:
+            lease = await self.leases_col.find_one_and_update(
+                {"_id": lease_id, "$or": [{"owner": self.node_id}, {"owner": None}, {"expires_at": {"$lte": now}}]},
+                {"$set": {"owner": self.node_id, "expires_at": expires_at}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The lease is held by another node
+            return False
+        return lease is not None
+
+    async def _release(self, lease_id: str):
+        await self.leases_col.update_one({"_id": lease_id, "owner": self.node_id},
+                                         {"$set": {"owner": None, "expires_at": None}})
+
+    async def heartbeat(self):
+        """Renews the leases of the node, releases partitions above its fair share and claims free partitions."""
+        started = time.monotonic()
+        now = datetime.datetime.now(datetime.timezone.utc)
+        expires_at = now + datetime.timedelta(seconds=self.lease_seconds)
+
+        await self.nodes_col.update_one({"_id": self.node_id}, {"$set": {"expires_at": expires_at}}, upsert=True)
+        alive_nodes = await self.nodes_col.count_documents({"expires_at": {"$gt": now}})
+        fair_share = get_fair_share(self.partitions, alive_nodes)
+
+        await self.leases_col.update_many({"owner": self.node_id}, {"$set": {"expires_at": expires_at}})
+        held = {lease["_id"]: lease["owner"] async for lease in
+                self.leases_col.find({"expires_at": {"$gt": now}}, {"owner": 1})}
+        owned = {partition for partition in range(self.partitions)
+                 if held.get(self.partition_lease_id(partition)) == self.node_id}
+
+        if len(owned) > fair_share:
+            # Hand over one partition per heartbeat to the nodes that joined
+            partition = random.choice(sorted(owned))
+            await self._release(self.partition_lease_id(partition))
+            owned.discard(partition)
+        else:
+            free = [partition for partition in range(self.partitions)
+                    if self.partition_lease_id(partition) not in held]
+            random.shuffle(free)
+            for partition in free[:fair_share - len(owned)]:
+                if await self._try_acquire(self.partition_lease_id(partition), now, expires_at):
+                    owned.add(partition)
+
+        is_leader = held.get(LEADER_LEASE_ID) == self.node_id
+        if not is_leader and LEADER_LEASE_ID not in held:
+            is_leader = await self._try_acquire(LEADER_LEASE_ID, now, expires_at)
+
+        self._valid_until = started + self.lease_seconds
+        self._set_state(owned, is_leader)
+
+    def _set_state(self, owned: set[int], is_leader: bool):
+        if owned != self.owned_partitions or is_leader != self.is_leader:
+            logger.info(f"Cluster node {self.node_id} owns {len(owned)}/{self.partitions} partitions",
+                        extra={"partitions": sorted(owned), "leader": is_leader})
+            self.owned_partitions = owned
+            self.is_leader = is_leader
+            self.changed.set()
+        self.ready.set()
+
+    async def run(self):
+        """Heartbeats every heartbeat_seconds seconds until cancelled, then releases the leases of the node."""
+        try:
+            while True:
+                try:
+                    # A heartbeat that hangs past the leases must not keep the node serving them
+                    remaining = self._valid_until - time.monotonic()
+                    await asyncio.wait_for(self.heartbeat(), timeout=remaining if remaining > 0 else self.lease_seconds)
+                except Exception as e:
+                    logger.exception(f"Cluster heartbeat of {self.node_id} failed", exc_info=e)
+                    if not self._is_valid():
+                        logger.warning(f"Leases of {self.node_id} expired, stopped serving its partitions")
+                        self._set_state(set(), False)
+                await asyncio.sleep(self.heartbeat_seconds)
+        finally:
+            await self.release_all()
+
+    async def release_all(self):
+        """Releases every lease of the node, so other nodes can claim them without waiting for expiry."""
+        self._set_state(set(), False)
+        try:
+            await self.leases_col.update_many({"owner": self.node_id}, {"$set": {"owner": None, "expires_at": None}})
+            await self.nodes_col.delete_one({"_id": self.node_id})
+        except Exception as e:
+            logger.exception(f"Could not release the leases of {self.node_id}", exc_info=e)
+
+    async def publish_live_channels(self, channels: set[str]) -> bool:
+        """
+        Publishes the channels to be joined across the cluster, only the leader can publish.
+        :return: Whether the node was still the leader
+        """
+        result = await self.leases_col.update_one(
+            {"_id": LEADER_LEASE_ID, "owner": self.node_id},
+            {"$set": {"live_channels": sorted(channels),
+                      "live_updated_at": datetime.datetime.now(datetime.timezone.utc)}},
+        )
+        return result.matched_count == 1
+
+    async def get_live_channels(self) -> set[str]:
+        """The channels last published by the leader."""
+        leader = await self.leases_col.find_one({"_id": LEADER_LEASE_ID}, {"live_channels": 1})
+        return set(leader.get("live_channels", [])) if leader else set()
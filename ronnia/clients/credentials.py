@@ -0,0 +1,325 @@
+"""
+Broker of the OAuth app tokens of the osu! and Twitch clients.
+
+Tokens are kept with their expiry in a token store shared by every process of the bot, so restarted and new
+processes reuse the current tokens instead of authenticating again. Each token is refreshed ahead of its expiry,
+at a jittered time per process, and only by the process holding the refresh lock of the token in the store.
+The others wait for the refreshed token, or fetch their own if the refresher doesn't store one in time.
+
+CREDENTIAL_STORE selects the store: "memory" shares tokens only inside the process, "file" shares them between the
+processes of a host through CREDENTIAL_STORE_PATH, and "mongo" shares them with every node in the Credentials
+collection.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import DuplicateKeyError
+
+from ronnia.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+CREDENTIAL_STORE = os.getenv("CREDENTIAL_STORE", "memory")
+CREDENTIAL_STORE_PATH = os.getenv("CREDENTIAL_STORE_PATH", "credentials.json")
+# Tokens are refreshed this long before they expire, minus a random jitter of up to CREDENTIAL_REFRESH_JITTER_SECONDS
+CREDENTIAL_REFRESH_MARGIN_SECONDS = float(os.getenv("CREDENTIAL_REFRESH_MARGIN_SECONDS", 10 * 60))
+CREDENTIAL_REFRESH_JITTER_SECONDS = float(os.getenv("CREDENTIAL_REFRESH_JITTER_SECONDS", 5 * 60))
+# A refresher that holds the lock longer than this is considered dead
+CREDENTIAL_LOCK_SECONDS = float(os.getenv("CREDENTIAL_LOCK_SECONDS", 30))
+CREDENTIAL_STORES = ("memory", "file", "mongo")
+
+
+@dataclass
+class Token:
+    access_token: str
+    # Unix time
+    expires_at: float
+
+    def seconds_left(self, now: Optional[float] = None) -> float:
+        return self.expires_at - (time.time() if now is None else now)
+
+
+class MemoryTokenStore:
+    """Tokens of this process only, for single process deployments and tests."""
+
+    def __init__(self):
+        self.tokens: dict[str, Token] = {}
+        self.locks: dict[str, tuple[str, float]] = {}
+
+    async def get(self, key: str) -> Optional[Token]:
+        return self.tokens.get(key)
+
+    async def put(self, key: str, token: Token):
+        self.tokens[key] = token
+
+    async def acquire_lock(self, key: str, owner: str, seconds: float) -> bool:
+        lock_owner, expires_at = self.locks.get(key, (owner, 0.0))
+        if lock_owner != owner and expires_at > time.time():
+            return False
+        self.locks[key] = (owner, time.time() + seconds)
+        return True
+
+    async def release_lock(self, key: str, owner: str):
+        if self.locks.get(key, (None, 0.0))[0] == owner:
+            del self.locks[key]
+
+
+class FileTokenStore:
+    """
+    Tokens in a JSON file shared by the processes of a host. The file is replaced atomically and readable only by
+    its owner. Refresh locks are files created exclusively next to it, a lock older than its lease is taken over.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except json.JSONDecodeError:
+            logger.warning(f"Token store {self.path} is corrupted, it will be overwritten")
+            return {}
+
+    async def get(self, key: str) -> Optional[Token]:
+        token = self._read().get(key)
+        return Token(**token) if token is not None else None
+
+    async def put(self, key: str, token: Token):
+        tokens = self._read()
+        tokens[key] = {"access_token": token.access_token, "expires_at": token.expires_at}
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(tokens, f)
+        os.replace(temp_path, self.path)
+
+    def _lock_path(self, key: str) -> str:
+        return f"{self.path}.{key.replace(':', '_').replace('/', '_')}.lock"
+
+    async def acquire_lock(self, key: str, owner: str, seconds: float) -> bool:
+        lock_path = self._lock_path(key)
+        try:
+            if time.time() - os.path.getmtime(lock_path) > seconds:
+                os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        try:
+            fd = os.open(lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(owner)
+        return True
+
+    async def release_lock(self, key: str, owner: str):
+        lock_path = self._lock_path(key)
+        try:
+            with open(lock_path, encoding="utf-8") as f:
+                if f.read() != owner:
+                    return
+            os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+
+
+class MongoTokenStore:
+    """Tokens in a MongoDB collection shared by every node, refresh locks are leases on the token documents."""
+
+    def __init__(self, credentials_col: AsyncCollection):
+        self.credentials_col = credentials_col
+
+    async def get(self, key: str) -> Optional[Token]:
+        doc = await self.credentials_col.find_one({"_id": key, "access_token": {"$exists": True}})
+        if doc is None:
+            return None
+        return Token(access_token=doc["access_token"], expires_at=doc["expires_at"])
+
+    async def put(self, key: str, token: Token):
+        await self.credentials_col.update_one(
+            {"_id": key}, {"$set": {"access_token": token.access_token, "expires_at": token.expires_at}}, upsert=True
+        )
+
+    async def acquire_lock(self, key: str, owner: str, seconds: float) -> bool:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        try:
+            doc = await self.credentials_col.find_one_and_update(
+                {"_id": key, "$or": [{"lock_owner": owner}, {"lock_owner": None},
+                                     {"lock_expires_at": {"$lte": now}}]},
+                {"$set": {"lock_owner": owner, "lock_expires_at": now + datetime.timedelta(seconds=seconds)}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Another process holds the lock
+            return False
+        return doc is not None
+
+    async def release_lock(self, key: str, owner: str):
+        await self.credentials_col.update_one({"_id": key, "lock_owner": owner},
+                                              {"$set": {"lock_owner": None, "lock_expires_at": None}})
+
+
+class CredentialBroker:
+    """
+    Hands out the current token of each credential to the clients, refreshing it ahead of expiry through the store.
+    """
+
+    def __init__(self, store, refresh_margin_seconds: float = CREDENTIAL_REFRESH_MARGIN_SECONDS,
+                 refresh_jitter_seconds: float = CREDENTIAL_REFRESH_JITTER_SECONDS,
+                 lock_seconds: float = CREDENTIAL_LOCK_SECONDS, owner: Optional[str] = None,
+                 poll_seconds: float = 0.5):
+        self.store = store
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.refresh_jitter_seconds = refresh_jitter_seconds
+        self.lock_seconds = lock_seconds
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.poll_seconds = poll_seconds
+
+        self._tokens: dict[str, Token] = {}
+        # Unix time after which this process refreshes the token, jittered so processes don't refresh together
+        self._refresh_at: dict[str, float] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+        self.refreshes = 0
+        self.store_hits = 0
+        self.waits = 0
+        self.store_errors = 0
+
+    def _set_token(self, key: str, token: Token):
+        self._tokens[key] = token
+        jitter = random.uniform(0, self.refresh_jitter_seconds)
+        self._refresh_at[key] = token.expires_at - self.refresh_margin_seconds - jitter
+
+    def _is_fresh(self, key: str, token: Optional[Token]) -> bool:
+        if token is None:
+            return False
+        refresh_at = self._refresh_at.get(key, token.expires_at - self.refresh_margin_seconds)
+        return time.time() < refresh_at
+
+    async def get_token(self, key: str, fetch: Callable[[], Awaitable[Token]]) -> str:
+        """
+        Get the current access token of the credential.
+        :param key: Credential key, the provider, client id and scope. Secrets must not be part of it.
+        :param fetch: Authenticates with the provider and returns a new token
+        :return: Access token
+        """
+        token = self._tokens.get(key)
+        if self._is_fresh(key, token):
+            return token.access_token
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            token = self._tokens.get(key)
+            if self._is_fresh(key, token):
+                return token.access_token
+            token = await self._get_or_refresh(key, fetch)
+            self._set_token(key, token)
+            if not self._is_fresh(key, token):
+                # Another process is refreshing it, check the store again shortly instead of on every call
+                self._refresh_at[key] = time.time() + self.poll_seconds
+            return token.access_token
+
+    async def _get_or_refresh(self, key: str, fetch: Callable[[], Awaitable[Token]]) -> Token:
+        current = self._tokens.get(key)
+        try:
+            stored = await self.store.get(key)
+            # A token stored by a process that refreshed first is used, instead of refreshing again
+            if (stored is not None and stored.seconds_left() > self.refresh_margin_seconds
+                    and (current is None or stored.expires_at > current.expires_at)):
+                self.store_hits += 1
+                return stored
+            if not await self.store.acquire_lock(key, self.owner, self.lock_seconds):
+                return await self._wait_for_refresh(key, stored, fetch)
+        except Exception as e:
+            self.store_errors += 1
+            logger.warning(f"Token store failed for {key}, authenticating without it", exc_info=e)
+            return await self._fetch(key, fetch)
+
+        try:
+            token = await self._fetch(key, fetch)
+            await self.store.put(key, token)
+            return token
+        finally:
+            try:
+                await self.store.release_lock(key, self.owner)
+            except Exception as e:
+                logger.warning(f"Could not release the refresh lock of {key}", exc_info=e)
+
+    async def _wait_for_refresh(self, key: str, stored: Optional[Token],
+                                fetch: Callable[[], Awaitable[Token]]) -> Token:
+        """Another process is refreshing the token, the current one is used meanwhile if it has not expired."""
+        if stored is not None and stored.seconds_left() > 0:
+            return stored
+        self.waits += 1
+        deadline = time.monotonic() + self.lock_seconds
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_seconds)
+            stored = await self.store.get(key)
+            if stored is not None and stored.seconds_left() > 0:
+                return stored
+        logger.warning(f"Refresher of {key} did not store a token in time, authenticating without it")
+        return await self._fetch(key, fetch)
+
+    async def _fetch(self, key: str, fetch: Callable[[], Awaitable[Token]]) -> Token:
+        logger.info(f"Refreshing token of {key}")
+        self.refreshes += 1
+        return await fetch()
+
+    async def invalidate(self, key: str, access_token: str):
+        """
+        Marks the token as expired after the provider rejected it, unless it was replaced already.
+        :param key: Credential key
+        :param access_token: Rejected access token
+        """
+        token = self._tokens.get(key)
+        if token is None or token.access_token != access_token:
+            return
+        expired = Token(access_token=access_token, expires_at=0.0)
+        self._tokens[key] = expired
+        self._refresh_at[key] = 0.0
+        try:
+            stored = await self.store.get(key)
+            if stored is not None and stored.access_token == access_token:
+                await self.store.put(key, expired)
+        except Exception as e:
+            logger.warning(f"Could not invalidate the stored token of {key}", exc_info=e)
+
+    def metrics(self) -> dict:
+        return {"refreshes": self.refreshes, "store_hits": self.store_hits, "waits": self.waits,
+                "store_errors": self.store_errors}
+
+
+_credential_broker: Optional[CredentialBroker] = None
+
+
+def create_token_store(store: str = CREDENTIAL_STORE):
+    assert store in CREDENTIAL_STORES, f"CREDENTIAL_STORE must be one of {CREDENTIAL_STORES}."
+    match store:
+        case "file":
+            return FileTokenStore(CREDENTIAL_STORE_PATH)
+        case "mongo":
+            from ronnia.clients.mongo import get_ronnia_database
+            return MongoTokenStore(get_ronnia_database().credentials_col)
+        case _:
+            return MemoryTokenStore()
+
+
+def get_credential_broker() -> CredentialBroker:
+    """The credential broker shared by every client in the process."""
+    global _credential_broker
+    if _credential_broker is None:
+        _credential_broker = CredentialBroker(create_token_store())
+        registry.register("credentials", _credential_broker.metrics)
+    return _credential_broker
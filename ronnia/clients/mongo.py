@@ -1,61 +1,217 @@
 import asyncio
 import datetime
+import hashlib
+import json
 import logging
+import os
 from typing import Optional, Union, Any, Sequence, AsyncGenerator
 
 import pymongo
-from pymongo import AsyncMongoClient
-from pymongo.errors import BulkWriteError
+from pymongo import AsyncMongoClient, ReplaceOne, UpdateOne, IndexModel
+from pymongo.errors import BulkWriteError, OperationFailure
+from pymongo.read_preferences import ReadPreference
 from pymongo.asynchronous.collection import AsyncCollection
 
+from ronnia.clients.mongo_monitoring import MongoCommandMonitor, monitored
+from ronnia.clients.statistics import StatisticsRollupBuffer, StatisticsSketches, truncate_to_day, truncate_to_hour
 from ronnia.models.beatmap import Beatmap, BeatmapType
-from ronnia.models.database import DBUser
+from ronnia.models.database import DBUser, DBRequest
+from ronnia.utils.beatmap import BeatmapParser
+from ronnia.utils.metrics import registry
 
 logger = logging.getLogger(__name__)
-BEATMAP_EXPIRE_SECONDS = 24 * 60 * 60  # Beatmaps should expire after a day
+BEATMAP_EXPIRE_SECONDS = 24 * 60 * 60  # Beatmaps should be refreshed after a day
+# Stale beatmaps are still served (and refreshed in the background) until they are this old
+BEATMAP_MAX_STALE_SECONDS = int(os.getenv("BEATMAP_MAX_STALE_SECONDS", 7 * 24 * 60 * 60))
+INDEX_OPTIONS_CONFLICT = 85
+# Raw request events are removed after this many days (0 keeps them forever), rollups are always kept
+STATISTICS_RETENTION_DAYS = int(os.getenv("STATISTICS_RETENTION_DAYS", 0))
+
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", 50))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", 2))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", 5 * 60 * 1000))
+MONGODB_COMPRESSORS = os.getenv("MONGODB_COMPRESSORS", "zlib")
+# Read preferences per operation class, statistics reads don't need to hit the primary
+USER_READ_PREFERENCE = os.getenv("MONGODB_USER_READ_PREFERENCE", "PRIMARY_PREFERRED")
+CACHE_READ_PREFERENCE = os.getenv("MONGODB_CACHE_READ_PREFERENCE", "NEAREST")
+STATISTICS_READ_PREFERENCE = os.getenv("MONGODB_STATISTICS_READ_PREFERENCE", "SECONDARY_PREFERRED")
+# Only these fields of the osu! api beatmap responses are cached
+BEATMAP_CACHED_FIELDS = ("id", "beatmapset_id", "version", "bpm", "status", "difficulty_rating", "hit_length", "mode")
+BEATMAPSET_CACHED_FIELDS = ("id", "artist", "title")
+
+# Bump when initialize changes in a way the fingerprint of SETTINGS and INDEXES doesn't capture
+SCHEMA_VERSION = 1
+
+# Hardcoded user settings: name, default value, description, type
+SETTINGS = [
+    ("enable", True, "Enables the bot.", "toggle"),
+    ("echo", True, "Enables Twitch chat acknowledge message.", "toggle"),
+    ("sub-only", False, "Subscribers only request mode.", "toggle"),
+    ("points-only", False, "Channel Points only request mode.", "toggle"),
+    ("test", False, "Enables test mode. (Removes all restrictions.)", "toggle"),
+    ("cooldown", 30, "Cooldown for requests.", "value"),
+    ("sr", [0, -1], "Star rating limit for requests.", "range"),
+    ("digest", False, "Sends requests as one summary message per window when chat is busy.", "toggle"),
+]
+
+# Indexes for the query shapes of the bot, keyed by collection name. TTL indexes are created in initialize.
+INDEXES = {
+    "Users": [
+        # get_user_from_twitch_username, remove_user
+        IndexModel([("twitchUsername", pymongo.ASCENDING)]),
+        # get_user_from_twitch_id, live status updates
+        IndexModel([("twitchId", pymongo.ASCENDING)]),
+        # get_enabled_users
+        IndexModel([("settings.enable", pymongo.ASCENDING)]),
+        # Clearing the live status of users that stopped streaming
+        IndexModel([("isLive", pymongo.DESCENDING), ("osuId", pymongo.DESCENDING), ("twitchId", pymongo.DESCENDING)]),
+    ],
+    "Settings": [
+        IndexModel([("name", pymongo.ASCENDING)]),
+    ],
+    "Statistics": [
+        IndexModel([("b", pymongo.DESCENDING), ("t", pymongo.DESCENDING), ("m", pymongo.DESCENDING)]),
+        # get_requests
+        IndexModel([("c", pymongo.ASCENDING), ("t", pymongo.DESCENDING)]),
+    ],
+    "Beatmaps": [
+        IndexModel([("id", pymongo.DESCENDING)]),
+        # get_beatmap and get_beatmaps of beatmapsets
+        IndexModel([("beatmapset_id", pymongo.DESCENDING), ("beatmapset_default", pymongo.DESCENDING)]),
+    ],
+    "BeatmapAttributes": [
+        IndexModel([("beatmap_id", pymongo.DESCENDING), ("mods", pymongo.DESCENDING)]),
+    ],
+    "StatisticsChannelDaily": [
+        IndexModel([("channel", pymongo.ASCENDING), ("day", pymongo.DESCENDING)], unique=True),
+    ],
+    "StatisticsBeatmapDaily": [
+        IndexModel([("beatmap_id", pymongo.ASCENDING), ("day", pymongo.DESCENDING)], unique=True),
+        # get_top_beatmaps
+        IndexModel([("day", pymongo.DESCENDING)]),
+    ],
+    "ClusterNodes": [
+        # Nodes that stopped heartbeating are removed
+        IndexModel([("expires_at", pymongo.ASCENDING)], expireAfterSeconds=0),
+    ],
+    "ClusterLeases": [
+        # Renewing and releasing the leases of a node
+        IndexModel([("owner", pymongo.ASCENDING)]),
+        # Leases held by any node
+        IndexModel([("expires_at", pymongo.ASCENDING)]),
+    ],
+    "BeatmapImports": [
+        # Import progress of a dump, see ronnia.tools.import_beatmaps
+        IndexModel([("path", pymongo.ASCENDING)]),
+    ],
+    "StatisticsChannelHourly": [
+        IndexModel([("channel", pymongo.ASCENDING), ("hour", pymongo.DESCENDING)], unique=True),
+        # get_busiest_hours for every channel
+        IndexModel([("hour", pymongo.DESCENDING)]),
+    ],
+}
 
 
 class RonniaDatabase(AsyncMongoClient):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, database_name: str = "Ronnia", **kwargs):
         super().__init__(*args, **kwargs)
-        self.db = self.get_database("Ronnia")
+        self.db = self.get_database(database_name)
         self.users_col = self.db.get_collection("Users")
         self.settings_col = self.db.get_collection("Settings")
         self.statistics_col = self.db.get_collection("Statistics")
         self.beatmaps_col = self.db.get_collection("Beatmaps")
+        self.beatmap_attributes_col = self.db.get_collection("BeatmapAttributes")
+        self.channel_daily_col = self.db.get_collection("StatisticsChannelDaily")
+        self.beatmap_daily_col = self.db.get_collection("StatisticsBeatmapDaily")
+        self.channel_hourly_col = self.db.get_collection("StatisticsChannelHourly")
+        self.rollup_buffer = StatisticsRollupBuffer(self.channel_daily_col, self.beatmap_daily_col,
+                                                    self.channel_hourly_col)
+        self.sketches_col = self.db.get_collection("Sketches")
+        self.meta_col = self.db.get_collection("Meta")
+        self.cluster_leases_col = self.db.get_collection("ClusterLeases")
+        self.cluster_nodes_col = self.db.get_collection("ClusterNodes")
+        # OAuth app tokens shared by every node, see ronnia/clients/credentials.py
+        self.credentials_col = self.db.get_collection("Credentials")
+
+        # Collections used for reads, routed by read preference of the operation class
+        user_read_preference = getattr(ReadPreference, USER_READ_PREFERENCE)
+        cache_read_preference = getattr(ReadPreference, CACHE_READ_PREFERENCE)
+        self.users_read_col = self.users_col.with_options(read_preference=user_read_preference)
+        self.beatmaps_read_col = self.beatmaps_col.with_options(read_preference=cache_read_preference)
+        self.beatmap_attributes_read_col = self.beatmap_attributes_col.with_options(
+            read_preference=cache_read_preference)
+        statistics_read_preference = getattr(ReadPreference, STATISTICS_READ_PREFERENCE)
+        self.statistics_read_col = self.statistics_col.with_options(read_preference=statistics_read_preference)
+        self.channel_daily_read_col = self.channel_daily_col.with_options(read_preference=statistics_read_preference)
+        self.beatmap_daily_read_col = self.beatmap_daily_col.with_options(read_preference=statistics_read_preference)
+        self.channel_hourly_read_col = self.channel_hourly_col.with_options(
+            read_preference=statistics_read_preference)
+        self.sketches = StatisticsSketches(
+            self.sketches_col, self.sketches_col.with_options(read_preference=statistics_read_preference))
+
+    @staticmethod
+    def get_schema_fingerprint() -> str:
+        """Fingerprint of everything initialize creates, it changes whenever the schema definitions change."""
+        schema = {
+            "version": SCHEMA_VERSION,
+            "settings": SETTINGS,
+            "indexes": {col_name: [index.document for index in indexes] for col_name, indexes in INDEXES.items()},
+            "ttl": [BEATMAP_MAX_STALE_SECONDS, STATISTICS_RETENTION_DAYS],
+        }
+        return hashlib.sha256(json.dumps(schema, sort_keys=True, default=str).encode()).hexdigest()
+
+    @monitored
+    async def initialize(self, force: bool = False):
+        """
+        Initialize the Database, define hardcoded settings and create the indexes.
+        Skipped if the stored schema fingerprint matches, so restarts don't re-issue every command.
+        :param force: Initialize even if the schema fingerprint matches
+        """
+        fingerprint = self.get_schema_fingerprint()
+        if not force:
+            schema = await self.meta_col.find_one({"_id": "schema"})
+            if schema is not None and schema.get("fingerprint") == fingerprint:
+                logger.info(f"Schema of {self.__class__.__name__} is up to date, skipping initialization")
+                return
 
-    async def initialize(self):
-        """Initialize the Database, define hardcoded settings."""
         async with asyncio.TaskGroup() as tg:
-            tg.create_task(self.define_setting("enable", True, "Enables the bot.", "toggle"))
-            tg.create_task(self.define_setting(
-                "echo", True, "Enables Twitch chat acknowledge message.", "toggle"
-            ))
-            tg.create_task(self.define_setting(
-                "sub-only", False, "Subscribers only request mode.", "toggle"
-            ))
-            tg.create_task(self.define_setting(
-                "points-only", False, "Channel Points only request mode.", "toggle"
-            ))
-            tg.create_task(self.define_setting(
-                "test", False, "Enables test mode. (Removes all restrictions.)", "toggle"
-            ))
-            tg.create_task(self.define_setting("cooldown", 30, "Cooldown for requests.", "value"))
-            tg.create_task(self.define_setting(
-                "sr", [0, -1], "Star rating limit for requests.", "range"
-            ))
-            tg.create_task(self.beatmaps_col.create_index([("id", pymongo.DESCENDING)], background=True))
-            tg.create_task(self.beatmaps_col.create_index([("ronnia_updated_at", pymongo.DESCENDING)], background=True,
-                                                          expireAfterSeconds=BEATMAP_EXPIRE_SECONDS))
-            tg.create_task(self.statistics_col.create_index(
-                [("requested_beatmap_id", pymongo.DESCENDING), ("timestamp", pymongo.DESCENDING),
-                 ("mods", pymongo.DESCENDING)], background=True))
-            tg.create_task(self.users_col.create_index(
-                [("isLive", pymongo.DESCENDING), ("osuId", pymongo.DESCENDING), ("twitchId", pymongo.DESCENDING)],
-                background=True))
+            for setting in SETTINGS:
+                tg.create_task(self.define_setting(*setting))
+            for col_name, indexes in INDEXES.items():
+                tg.create_task(self.db.get_collection(col_name).create_indexes(indexes))
+            tg.create_task(self.create_ttl_index(self.beatmaps_col, "ronnia_updated_at",
+                                                 expire_after_seconds=BEATMAP_MAX_STALE_SECONDS))
+            tg.create_task(self.create_ttl_index(self.beatmap_attributes_col, "ronnia_updated_at",
+                                                 expire_after_seconds=BEATMAP_MAX_STALE_SECONDS))
+            if STATISTICS_RETENTION_DAYS > 0:
+                tg.create_task(self.create_ttl_index(self.statistics_col, "t",
+                                                     expire_after_seconds=STATISTICS_RETENTION_DAYS * 24 * 60 * 60))
 
+        await self.meta_col.update_one({"_id": "schema"}, {"$set": {
+            "fingerprint": fingerprint,
+            "version": SCHEMA_VERSION,
+            "initialized_at": datetime.datetime.now(datetime.timezone.utc),
+        }}, upsert=True)
         logger.info(f"Successfully initialized {self.__class__.__name__}")
 
+    async def create_ttl_index(self, col: AsyncCollection, field: str, expire_after_seconds: int):
+        """
+        Create a TTL index on the field, updating the expiry of an already existing index if it changed.
+        :param col: Collection to create the index on
+        :param field: Date field to expire the documents by
+        :param expire_after_seconds: Seconds after which the documents are removed
+        """
+        try:
+            await col.create_index([(field, pymongo.DESCENDING)], background=True,
+                                   expireAfterSeconds=expire_after_seconds)
+        except OperationFailure as e:
+            if e.code != INDEX_OPTIONS_CONFLICT:
+                raise e
+            logger.info(f"Updating TTL of {col.name}.{field} index to {expire_after_seconds} seconds")
+            await self.db.command("collMod", col.name, index={"keyPattern": {field: pymongo.DESCENDING},
+                                                               "expireAfterSeconds": expire_after_seconds})
+
+    @monitored
     async def remove_user(self, twitch_username: str) -> bool:
         """
         Removes the user with the matching twitch username
@@ -63,24 +219,27 @@ class RonniaDatabase(AsyncMongoClient):
         result = await self.users_col.delete_one({"twitchUsername": twitch_username})
         return result.acknowledged
 
+    @monitored
     async def get_user_from_twitch_id(self, twitch_id: int) -> DBUser:
         """
         Gets the user details from database using Twitch username
         :param twitch_id: Twitch ID
         :return: User details of the user associated with twitch username
         """
-        user = await self.users_col.find_one({"twitchId": twitch_id})
+        user = await self.users_read_col.find_one({"twitchId": twitch_id})
         return DBUser(**user)
 
+    @monitored
     async def get_user_from_twitch_username(self, twitch_username: str) -> DBUser:
         """
         Gets the user details from database using Twitch username
         :param twitch_username:
         :return: User details of the user associated with twitch username
         """
-        user = await self.users_col.find_one({"twitchUsername": twitch_username})
+        user = await self.users_read_col.find_one({"twitchUsername": twitch_username})
         return DBUser(**user)
 
+    @monitored
     async def define_setting(
             self, name: str, default_value: Any, description: str, _type: str
     ) -> None:
@@ -158,12 +317,13 @@ class RonniaDatabase(AsyncMongoClient):
         settings = user.settings.model_dump(by_alias=True)
         return settings[setting_key]
 
+    @monitored
     async def get_enabled_users(self) -> AsyncGenerator[DBUser, None]:
         """
         Gets all enabled users in db
         :return:
         """
-        async for user in self.users_col.find({"settings.enable": True}):
+        async for user in self.users_read_col.find({"settings.enable": True}):
             yield DBUser.model_validate(user)
 
     async def get_excluded_users(self, twitch_username: str) -> AsyncGenerator[str, None]:
@@ -176,41 +336,231 @@ class RonniaDatabase(AsyncMongoClient):
         for excluded_user in user.excludedUsers:
             yield excluded_user.lower()
 
+    @monitored
     async def add_request(
             self,
-            requester_channel_name: str,
+            requester_twitch_id: int,
             requested_beatmap_id: int,
-            requested_channel_name: str,
-            mods: Optional[str],
+            requested_channel_id: int,
+            mods: int,
     ):
         """
         Adds a beatmap request to database.
-        :param requester_channel_name: Channel name of the beatmap requester
+        :param requester_twitch_id: Twitch id of the beatmap requester
         :param requested_beatmap_id: Beatmap id of the requested beatmap
-        :param requested_channel_name: Channel id of the chat where the beatmap is requested
-        :param mods: Requested mods (optional)
+        :param requested_channel_id: Twitch id of the channel where the beatmap is requested
+        :param mods: Requested mods as bitmask
         """
         logger.debug("Adding request statistics to the database")
-        await self.statistics_col.insert_one(
-            {
-                "requester_channel_name": requester_channel_name,
-                "requested_beatmap_id": requested_beatmap_id,
-                "requested_channel_name": requested_channel_name,
-                "mods": mods,
-                "timestamp": datetime.datetime.now(datetime.timezone.utc),
-            }
-        )
-
-    async def add_beatmap(self, beatmap_info: dict):
+        request = DBRequest(beatmapId=requested_beatmap_id, channelId=requested_channel_id,
+                            requesterId=requester_twitch_id, mods=mods,
+                            timestamp=datetime.datetime.now(datetime.timezone.utc))
+        should_flush = self.rollup_buffer.add(requested_channel_id, requested_beatmap_id, request.timestamp)
+        self.sketches.add(requested_channel_id, requester_twitch_id, requested_beatmap_id, request.timestamp)
+        await self.statistics_col.insert_one(request.model_dump(by_alias=True, exclude_none=True))
+        if should_flush:
+            await self.rollup_buffer.flush()
+
+    @monitored
+    async def add_requests(self, requester_twitch_id: int, requested_channel_id: int, beatmaps: list[tuple[int, int]]):
+        """
+        Adds the beatmap requests of one message to database with a single insert.
+        :param requester_twitch_id: Twitch id of the beatmap requester
+        :param requested_channel_id: Twitch id of the channel where the beatmaps are requested
+        :param beatmaps: List of (beatmap id, mods as bitmask) of the requested beatmaps
+        """
+        logger.debug(f"Adding {len(beatmaps)} requests statistics to the database")
+        timestamp = datetime.datetime.now(datetime.timezone.utc)
+        requests = []
+        should_flush = False
+        for requested_beatmap_id, mods in beatmaps:
+            request = DBRequest(beatmapId=requested_beatmap_id, channelId=requested_channel_id,
+                                requesterId=requester_twitch_id, mods=mods, timestamp=timestamp)
+            should_flush |= self.rollup_buffer.add(requested_channel_id, requested_beatmap_id, timestamp)
+            self.sketches.add(requested_channel_id, requester_twitch_id, requested_beatmap_id, timestamp)
+            requests.append(request.model_dump(by_alias=True, exclude_none=True))
+        await self.statistics_col.insert_many(requests)
+        if should_flush:
+            await self.rollup_buffer.flush()
+
+    @monitored
+    async def get_requests(self, channel_id: int, limit: int = 100) -> AsyncGenerator[DBRequest, None]:
+        """
+        Gets the latest requests of a channel
+        :param channel_id: Twitch id of the channel
+        :param limit: Maximum number of requests
+        :return: Requests, newest first
+        """
+        cursor = self.statistics_read_col.find({"c": channel_id}).sort("t", pymongo.DESCENDING).limit(limit)
+        async for request in cursor:
+            yield DBRequest.model_validate(request)
+
+    @staticmethod
+    def decode_request(request: DBRequest) -> dict:
+        """
+        Converts a request to readable form, with mods as text.
+        :param request: Request from the Statistics collection
+        :return: Request with long field names
+        """
+        return {
+            "requested_beatmap_id": request.beatmapId,
+            "requested_channel_id": request.channelId,
+            "requester_twitch_id": request.requesterId,
+            "requested_channel_name": request.channelName,
+            "requester_channel_name": request.requesterName,
+            "mods": BeatmapParser.get_mod_text(request.mods),
+            "timestamp": request.timestamp,
+        }
+
+    @monitored
+    async def get_top_beatmaps(self, since: datetime.datetime, limit: int = 20) -> list[dict]:
+        """
+        Get the most requested beatmaps from the daily rollups.
+        :param since: Start of the period, counted from the start of its day
+        :param limit: Number of beatmaps to return
+        :return: List of {"beatmap_id": ..., "count": ...} sorted by count
+        """
+        pipeline = [
+            {"$match": {"day": {"$gte": truncate_to_day(since)}}},
+            {"$group": {"_id": "$beatmap_id", "count": {"$sum": "$count"}}},
+            {"$sort": {"count": -1}},
+            {"$limit": limit},
+            {"$project": {"_id": 0, "beatmap_id": "$_id", "count": 1}},
+        ]
+        return await (await self.beatmap_daily_read_col.aggregate(pipeline)).to_list()
+
+    @monitored
+    async def get_channel_requests_per_day(self, channel_id: int, since: datetime.datetime) -> list[dict]:
+        """
+        Get the number of requests per day of a channel.
+        :param channel_id: Twitch id of the channel
+        :param since: Start of the period
+        :return: List of {"day": ..., "count": ...} sorted by day
+        """
+        cursor = self.channel_daily_read_col.find(
+            {"channel": channel_id, "day": {"$gte": truncate_to_day(since)}},
+            {"_id": 0, "day": 1, "count": 1},
+        ).sort("day", pymongo.ASCENDING)
+        return await cursor.to_list()
+
+    @monitored
+    async def estimate_unique_requesters(self, channel_id: int, month: datetime.datetime) -> int:
+        """
+        Estimate the number of unique requesters of a channel in a month, within about 2% error.
+        :param channel_id: Twitch id of the channel
+        :param month: Any time in the month
+        :return: Estimated unique requester count
+        """
+        return await self.sketches.estimate_unique_requesters(channel_id, month)
+
+    @monitored
+    async def estimate_top_beatmaps(self, week: datetime.datetime, limit: int = 20) -> list[tuple[int, int]]:
+        """
+        Estimate the most requested beatmaps of a week across every channel.
+        :param week: Any time in the week
+        :param limit: Number of beatmaps to return
+        :return: List of (beatmap id, estimated request count) sorted by count
+        """
+        return await self.sketches.estimate_top_beatmaps(week, limit)
+
+    @monitored
+    async def get_busiest_hours(self, since: datetime.datetime, channel_id: Optional[int] = None) -> list[dict]:
+        """
+        Get the request count per hour of day (UTC), for a channel or for every channel.
+        :param since: Start of the period
+        :param channel_id: Twitch id of the channel, every channel if None
+        :return: List of {"hour": 0-23, "count": ...} sorted by count
+        """
+        match_filter = {"hour": {"$gte": truncate_to_hour(since)}}
+        if channel_id is not None:
+            match_filter["channel"] = channel_id
+        pipeline = [
+            {"$match": match_filter},
+            {"$group": {"_id": {"$hour": "$hour"}, "count": {"$sum": "$count"}}},
+            {"$sort": {"count": -1}},
+            {"$project": {"_id": 0, "hour": "$_id", "count": 1}},
+        ]
+        return await (await self.channel_hourly_read_col.aggregate(pipeline)).to_list()
+
+    @staticmethod
+    def compact_beatmap(beatmap_info: dict, beatmapset_info: dict) -> dict:
+        """
+        Strips the osu! api beatmap response down to the fields the bot uses.
+        :param beatmap_info: Beatmap from osu! api
+        :param beatmapset_info: Beatmapset of the beatmap from osu! api
+        :return: Compact beatmap document
+        """
+        beatmap_doc = {key: beatmap_info[key] for key in BEATMAP_CACHED_FIELDS if key in beatmap_info}
+        beatmap_doc["beatmapset"] = {key: beatmapset_info[key] for key in BEATMAPSET_CACHED_FIELDS
+                                     if key in beatmapset_info}
+        beatmap_doc["ronnia_updated_at"] = datetime.datetime.now(tz=datetime.timezone.utc)
+        return beatmap_doc
+
+    @monitored
+    async def add_beatmap(self, beatmap_info: dict, beatmapset_info: Optional[dict] = None):
         """
         Adds beatmap to database
         :param beatmap_info: Beatmap to add
+        :param beatmapset_info: Beatmapset of the beatmap, taken from beatmap_info if not given
         """
         beatmap_id = beatmap_info["id"]
-        beatmap_info["ronnia_updated_at"] = datetime.datetime.now(tz=datetime.timezone.utc)
+        if beatmapset_info is None:
+            beatmapset_info = beatmap_info["beatmapset"]
         logger.debug(f"Adding {beatmap_id} to the database")
-        await self.beatmaps_col.update_one({"id": beatmap_id}, {"$set": beatmap_info}, upsert=True)
+        # $set keeps the beatmapset_default flag written by add_beatmapset
+        await self.beatmaps_col.update_one({"id": beatmap_id},
+                                           {"$set": self.compact_beatmap(beatmap_info, beatmapset_info)}, upsert=True)
+
+    @monitored
+    async def add_beatmapset(self, beatmapset_info: dict):
+        """
+        Adds every difficulty of the beatmapset to database. The first difficulty is the one osu! api lookups of
+        the beatmapset return, it is marked with beatmapset_default so cached lookups return the same one.
+        :param beatmapset_info: Beatmapset to add, with its beatmaps
+        """
+        logger.debug(f"Adding beatmapset {beatmapset_info['id']} to the database")
+        operations = [
+            ReplaceOne({"id": beatmap_info["id"]},
+                       self.compact_beatmap(beatmap_info, beatmapset_info) | {"beatmapset_default": index == 0},
+                       upsert=True)
+            for index, beatmap_info in enumerate(beatmapset_info.get("beatmaps", []))
+        ]
+        await self.bulk_write_operations(operations=operations, col=self.beatmaps_col)
+
+    @monitored
+    async def add_beatmaps(self, beatmap_infos: list[dict]):
+        """
+        Adds beatmaps to database with a single bulk write
+        :param beatmap_infos: Beatmaps to add, each with its beatmapset under the "beatmapset" key
+        """
+        logger.debug(f"Adding {len(beatmap_infos)} beatmaps to the database")
+        operations = [
+            UpdateOne({"id": beatmap_info["id"]},
+                      {"$set": self.compact_beatmap(beatmap_info, beatmap_info["beatmapset"])}, upsert=True)
+            for beatmap_info in beatmap_infos
+        ]
+        await self.bulk_write_operations(operations=operations, col=self.beatmaps_col)
 
+    @monitored
+    async def get_beatmaps(self, beatmaps: list[Beatmap]) -> list[dict]:
+        """
+        Get the cached documents of several beatmaps and beatmapsets with a single query
+        :param beatmaps: Beatmaps to look up
+        :return: Found beatmap documents, beatmapsets match their default difficulty
+        """
+        beatmap_ids = [beatmap.id for beatmap in beatmaps if beatmap.type == BeatmapType.MAP]
+        beatmapset_ids = [beatmap.id for beatmap in beatmaps if beatmap.type == BeatmapType.MAPSET]
+        conditions = []
+        if beatmap_ids:
+            conditions.append({"id": {"$in": beatmap_ids}})
+        if beatmapset_ids:
+            conditions.append({"beatmapset_id": {"$in": beatmapset_ids}, "beatmapset_default": True})
+        if not conditions:
+            return []
+        logger.debug(f"Getting {len(beatmaps)} beatmaps from the database")
+        return await self.beatmaps_read_col.find({"$or": conditions}).to_list()
+
+    @monitored
     async def get_beatmap(self, beatmap: Beatmap):
         """
         Get a beatmap from the database
@@ -218,8 +568,70 @@ class RonniaDatabase(AsyncMongoClient):
         logger.debug(f"Getting {beatmap.type} {beatmap.id} from the database")
         match beatmap.type:
             case BeatmapType.MAP:
-                return await self.beatmaps_col.find_one({"id": beatmap.id})
+                return await self.beatmaps_read_col.find_one({"id": beatmap.id})
             case BeatmapType.MAPSET:
-                return await self.beatmaps_col.find_one({"beatmapset_id": beatmap.id})
+                return await self.beatmaps_read_col.find_one({"beatmapset_id": beatmap.id, "beatmapset_default": True})
             case _:
                 return None
+
+    @staticmethod
+    def get_beatmap_age(db_beatmap: dict) -> float:
+        """
+        Get how many seconds ago the beatmap document was fetched from the osu! api or imported.
+        :param db_beatmap: Beatmap document from the database
+        :return: Age of the document in seconds, infinite for documents without an update time
+        """
+        updated_at = db_beatmap.get("ronnia_updated_at")
+        if updated_at is None:
+            return float("inf")
+        if updated_at.tzinfo is None:
+            updated_at = updated_at.replace(tzinfo=datetime.timezone.utc)
+        return (datetime.datetime.now(tz=datetime.timezone.utc) - updated_at).total_seconds()
+
+    @monitored
+    async def get_beatmap_attributes(self, beatmap_id: int, mods: int) -> Optional[dict]:
+        """
+        Get the cached difficulty attributes of a beatmap with mods
+        :param beatmap_id: Beatmap id
+        :param mods: Difficulty changing mods bitmask
+        :return: Difficulty attributes from osu! api, None if not cached
+        """
+        attributes_doc = await self.beatmap_attributes_read_col.find_one({"beatmap_id": beatmap_id, "mods": mods})
+        if attributes_doc is None:
+            return None
+        return attributes_doc["attributes"]
+
+    @monitored
+    async def add_beatmap_attributes(self, beatmap_id: int, mods: int, attributes: dict):
+        """
+        Adds difficulty attributes of a beatmap with mods to database
+        :param beatmap_id: Beatmap id
+        :param mods: Difficulty changing mods bitmask
+        :param attributes: Difficulty attributes from osu! api
+        """
+        logger.debug(f"Adding attributes of {beatmap_id} with mods {mods} to the database")
+        await self.beatmap_attributes_col.update_one(
+            {"beatmap_id": beatmap_id, "mods": mods},
+            {"$set": {"attributes": attributes,
+                      "ronnia_updated_at": datetime.datetime.now(tz=datetime.timezone.utc)}},
+            upsert=True)
+
+
+_ronnia_database: RonniaDatabase | None = None
+
+
+def get_ronnia_database() -> RonniaDatabase:
+    """
+    The database client shared by every component in the process, with a tuned connection pool.
+    """
+    global _ronnia_database
+    if _ronnia_database is None:
+        command_monitor = MongoCommandMonitor()
+        registry.register("mongo", command_monitor.metrics)
+        _ronnia_database = RonniaDatabase(os.getenv("MONGODB_URL"),
+                                          event_listeners=[command_monitor],
+                                          maxPoolSize=MONGODB_MAX_POOL_SIZE,
+                                          minPoolSize=MONGODB_MIN_POOL_SIZE,
+                                          maxIdleTimeMS=MONGODB_MAX_IDLE_TIME_MS,
+                                          compressors=MONGODB_COMPRESSORS)
+    return _ronnia_database
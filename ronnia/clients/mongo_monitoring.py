@@ -0,0 +1,146 @@
+import contextvars
+import functools
+import inspect
+import logging
+import os
+from typing import Any
+
+from pymongo import monitoring
+
+from ronnia.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+MONGODB_SLOW_QUERY_MS = float(os.getenv("MONGODB_SLOW_QUERY_MS", 100))
+
+current_operation: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_operation", default=None)
+
+
+def monitored(func):
+    """Tags the MongoDB commands sent inside the RonniaDatabase method with the method name."""
+    operation = func.__name__
+
+    if inspect.isasyncgenfunction(func):
+        @functools.wraps(func)
+        async def async_gen_wrapper(*args, **kwargs):
+            agen = func(*args, **kwargs)
+            while True:
+                token = current_operation.set(operation)
+                try:
+                    item = await agen.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    current_operation.reset(token)
+                yield item
+
+        return async_gen_wrapper
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_operation.set(operation)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            current_operation.reset(token)
+
+    return wrapper
+
+
+def get_filter_shape(value: Any) -> Any:
+    """Replaces the values of a query filter with their type names, so it can be logged."""
+    if isinstance(value, dict):
+        return {key: get_filter_shape(val) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [get_filter_shape(value[0])] if value else []
+    return type(value).__name__
+
+
+def get_command_filter(command_name: str, command: dict) -> Any:
+    match command_name:
+        case "find" | "count" | "distinct":
+            return command.get("filter", command.get("query"))
+        case "update":
+            return command["updates"][0]["q"] if command.get("updates") else None
+        case "delete":
+            return command["deletes"][0]["q"] if command.get("deletes") else None
+        case "findAndModify":
+            return command.get("query")
+        case "aggregate":
+            pipeline = command.get("pipeline") or [{}]
+            return pipeline[0].get("$match")
+        case _:
+            return None
+
+
+def get_reply_document_count(command_name: str, reply: dict) -> int:
+    if "cursor" in reply:
+        cursor = reply["cursor"]
+        return len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+    if command_name == "findAndModify":
+        return 0 if reply.get("value") is None else 1
+    return int(reply.get("n", 0))
+
+
+class OperationStats:
+    def __init__(self):
+        self.latency_ms = Histogram()
+        self.documents = 0
+        self.failures = 0
+        self.slow = 0
+
+    def snapshot(self) -> dict:
+        return {"latency_ms": self.latency_ms.snapshot(), "documents": self.documents,
+                "failures": self.failures, "slow": self.slow}
+
+
+class MongoCommandMonitor(monitoring.CommandListener):
+    """
+    Records latency and document counts of MongoDB commands per RonniaDatabase method,
+    and logs the commands slower than slow_query_ms with the shape of their filter.
+    """
+
+    def __init__(self, slow_query_ms: float = MONGODB_SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self.operations: dict[str, OperationStats] = {}
+        self._started: dict[tuple, tuple[str, str, dict]] = {}
+
+    def _get_stats(self, operation: str) -> OperationStats:
+        if operation not in self.operations:
+            self.operations[operation] = OperationStats()
+        return self.operations[operation]
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        operation = current_operation.get() or f"untagged.{event.command_name}"
+        self._started[(event.connection_id, event.request_id)] = (operation, event.command_name, event.command)
+
+    def _finish(self, event, reply: dict | None):
+        started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        operation, command_name, command = started
+        duration_ms = event.duration_micros / 1000
+        stats = self._get_stats(operation)
+        stats.latency_ms.observe(duration_ms)
+        if reply is None:
+            stats.failures += 1
+        else:
+            stats.documents += get_reply_document_count(command_name, reply)
+
+        if duration_ms >= self.slow_query_ms:
+            stats.slow += 1
+            logger.warning("Slow MongoDB command",
+                           extra={"operation": operation,
+                                  "command": command_name,
+                                  "collection": command.get(command_name),
+                                  "filter_shape": get_filter_shape(get_command_filter(command_name, command)),
+                                  "duration_ms": duration_ms})
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event, event.reply)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, None)
+
+    def metrics(self) -> dict:
+        return {operation: stats.snapshot() for operation, stats in self.operations.items()}
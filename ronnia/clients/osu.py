@@ -1,58 +1,72 @@
 import asyncio
 import datetime
 import logging
-from typing import Union, Dict, Optional, Tuple
-
-import aiohttp
+import os
+import time
+from typing import Union, Dict, Optional, Tuple, Type
 
+from ronnia.clients.credentials import Token, get_credential_broker
+from ronnia.clients.transport import get_transport
 from ronnia.models.beatmap import Beatmap, BeatmapType
 from ronnia.utils.singleton import SingletonMeta
 
 logger = logging.getLogger("ronnia")
 
+# Tokens are refreshed ahead of expiry by the credential broker, idle clients check it this often
+TOKEN_REFRESH_CHECK_SECONDS = 60
+# Overridden to point the bot at local stand-ins, see benchmarks/fake_services.py
+OSU_API_URL = os.getenv("OSU_API_URL", "https://osu.ppy.sh/api/v2/")
+OSU_OAUTH_URL = os.getenv("OSU_OAUTH_URL", "https://osu.ppy.sh/oauth/token")
+# Most beatmaps the osu! api returns for one beatmaps lookup
+OSU_BEATMAPS_LOOKUP_MAX = 50
+
 
 class BaseOsuApiV2(metaclass=SingletonMeta):
-    """Async wrapper for osu! api v2"""
-    _session: aiohttp.ClientSession | None = None
+    """
+    Async wrapper for osu! api v2. Every credential has its own token and rate limit,
+    requests are sent through the shared HTTP transport.
+    """
 
     def __init__(self, client_id: str, client_secret: str):
         super().__init__()
         self._client_id = client_id
         self._client_secret = client_secret
-        self._api_base_url = "https://osu.ppy.sh/api/v2/"
+        self._transport = get_transport()
+        self._api_base_url = OSU_API_URL
         self._scopes = None
 
         self._auth_lock = asyncio.Lock()
-        self._is_authenticating = False
         self._access_token = None
-        self._access_token_obtain_date = None
-        self._access_token_expire_date = None
+        self._auth_header = None
 
         self._last_request_time = datetime.datetime.now() - datetime.timedelta(
             weeks=100
         )
         self._cooldown_seconds = 1
+        self.in_flight = 0
 
-    @classmethod
-    async def get_session(cls):
-        if cls._session is None or cls._session.closed:
-            cls._session = aiohttp.ClientSession()
-        return cls._session
+    async def close_session(self):
+        await self._transport.close()
 
-    @classmethod
-    async def close_session(cls):
-        if cls._session and not cls._session.closed:
-            await cls._session.close()
-        cls._session = None
-
-    def _check_token_expired(self):
-        return (
-                datetime.datetime.now() + datetime.timedelta(minutes=1)
-                > self._access_token_expire_date
-        )
+    @property
+    def _credential_key(self) -> str:
+        return f"osu:{self._client_id}:{self._scopes}"
+
+    def seconds_until_available(self) -> float:
+        """Seconds until this client can send its next request without exceeding its rate limit."""
+        next_request_time = self._last_request_time + datetime.timedelta(seconds=self._cooldown_seconds)
+        return max(0.0, (next_request_time - datetime.datetime.now()).total_seconds())
 
     async def _get_access_token(self):
-        """Gets the access token from osu! api"""
+        """Gets the current access token from the credential broker, which asks osu! api for a new one when needed"""
+        access_token = await get_credential_broker().get_token(self._credential_key, self._request_access_token)
+        if access_token != self._access_token:
+            self._access_token = access_token
+            self._auth_header = {"Authorization": f"Bearer {self._access_token}"}
+            logger.info(f"Successfully authenticated with osu! api on {self.__class__.__name__}")
+
+    async def _request_access_token(self) -> Token:
+        """Gets a new access token from osu! api"""
         params = {
             "client_id": self._client_id,
             "client_secret": self._client_secret,
@@ -60,27 +74,21 @@ class BaseOsuApiV2(metaclass=SingletonMeta):
             "scope": self._scopes,
         }
 
-        async with self._session.post("https://osu.ppy.sh/oauth/token", json=params) as r:
-            token_response = await r.json()
-
-        self._access_token = token_response["access_token"]
+        resp = await self._transport.request("POST", OSU_OAUTH_URL, endpoint="osu.oauth",
+                                             idempotent=True, json=params)
+        resp.raise_for_status("osu! api authentication")
+        token_response = resp.data
+        return Token(access_token=token_response["access_token"],
+                     expires_at=time.time() + token_response["expires_in"])
 
-        self._access_token_obtain_date = datetime.datetime.now()
-        self._access_token_expire_date = (
-                self._access_token_obtain_date
-                + datetime.timedelta(seconds=token_response["expires_in"])
-        )
-
-        self._auth_header = {"Authorization": f"Bearer {self._access_token}"}
-        logger.info(f"Successfully authenticated with osu! api on {self.__class__.__name__}")
-
-    async def _get_endpoint(self, endpoint: str, params: dict = None):
+    async def _get_endpoint(self, endpoint: str, params: Union[dict, list[tuple[str, str]]] = None):
         await self.wait_cooldown()
 
         url = f"{self._api_base_url}{endpoint}"
-        async with self._session.get(url, params=params,
-                                     headers=self._auth_header) as resp:
-            contents = await resp.json()
+        resp = await self._transport.request("GET", url, endpoint="osu.api", params=params,
+                                             headers=self._auth_header)
+        resp.raise_for_status(f"osu! api GET {url}")
+        contents = resp.data
 
         logger.debug("Response after GET request to the osu! api.",
                      extra={"response": contents,
@@ -88,18 +96,18 @@ class BaseOsuApiV2(metaclass=SingletonMeta):
                             "params": params
                             }
                      )
-        self._last_request_time = datetime.datetime.now()
 
         return contents
 
-    async def _post_endpoint(self, endpoint: str, data: dict, params: dict = None):
+    async def _post_endpoint(self, endpoint: str, data: dict, params: dict = None, idempotent: bool = False,
+                             transport_endpoint: str = "osu.api"):
         await self.wait_cooldown()
 
         url = f"{self._api_base_url}{endpoint}"
-        async with self._session.post(
-                url, params=params, json=data, headers=self._auth_header
-        ) as resp:
-            contents = await resp.json()
+        resp = await self._transport.request("POST", url, endpoint=transport_endpoint, idempotent=idempotent,
+                                             params=params, json=data, headers=self._auth_header)
+        resp.raise_for_status(f"osu! api POST {url}")
+        contents = resp.data
 
         logger.debug("Response after POST request to the osu! api.",
                      extra={"response": contents,
@@ -108,27 +116,20 @@ class BaseOsuApiV2(metaclass=SingletonMeta):
                             "data": data
                             }
                      )
-        self._last_request_time = datetime.datetime.now()
 
         return contents
 
     async def ensure_authenticated(self):
         async with self._auth_lock:
-            if (self._access_token is None or self._check_token_expired()) and not self._is_authenticating:
-                self._is_authenticating = True
-                try:
-                    await self._get_access_token()
-                finally:
-                    self._is_authenticating = False
+            await self._get_access_token()
 
     async def wait_cooldown(self):
-        self._session = await BaseOsuApiV2.get_session()
         await self.ensure_authenticated()
-        seconds_since_last_request = (
-                datetime.datetime.now() - self._last_request_time
-        ).total_seconds()
-        if seconds_since_last_request < self._cooldown_seconds:
-            await asyncio.sleep(self._cooldown_seconds - seconds_since_last_request)
+        # Reserve the next free request slot before sleeping, so concurrent requests are spaced out
+        wait_seconds = self.seconds_until_available()
+        self._last_request_time = datetime.datetime.now() + datetime.timedelta(seconds=wait_seconds)
+        if wait_seconds > 0:
+            await asyncio.sleep(wait_seconds)
 
 
 class OsuApiV2(BaseOsuApiV2):
@@ -158,20 +159,34 @@ class OsuApiV2(BaseOsuApiV2):
 
         return beatmap_info, beatmapset_info
 
+    async def get_beatmaps(self, beatmap_ids: list[int]) -> list[Dict]:
+        """
+        Gets beatmap data for up to 50 beatmap IDs with a single request.
+        :param beatmap_ids: The IDs of the beatmaps.
+        :return: Returns the found beatmaps, each with its beatmapset under the "beatmapset" key.
+
+        This endpoint returns a dict with the beatmaps under the "beatmaps" key, missing beatmaps are left out.
+        """
+        assert len(beatmap_ids) <= OSU_BEATMAPS_LOOKUP_MAX, f"At most {OSU_BEATMAPS_LOOKUP_MAX} beatmaps per lookup."
+        logger.debug(f"Requesting beatmap information for ids: {beatmap_ids}")
+        params = [("ids[]", str(beatmap_id)) for beatmap_id in beatmap_ids]
+        response = await self._get_endpoint("beatmaps", params=params)
+        return response["beatmaps"]
+
     async def get_beatmap_attributes(
-            self, beatmap_id: int, mods: Optional[str] = None
+            self, beatmap_id: int, mods: Optional[Union[int, list[str]]] = None
     ) -> Dict:
         """
-        Gets beatmap data for the specified beatmap ID.
+        Gets difficulty attributes for the specified beatmap ID.
         :param beatmap_id: The ID of the beatmap.
-        :param mods: Optional added mods to the beatmap.
-        :return: Returns Beatmap object.
+        :param mods: Optional added mods to the beatmap, as bitmask or list of mod acronyms.
+        :return: Returns difficulty attributes of the beatmap.
 
-        This endpoint returns a single beatmap dict.
+        This endpoint returns a dict with the difficulty attributes under the "attributes" key.
         """
-        logger.debug(f"Requesting beatmap information for id: {beatmap_id}")
+        logger.debug(f"Requesting beatmap attributes for id: {beatmap_id} with mods: {mods}")
         data = {"mods": mods}
-        return await self._post_endpoint(f"beatmaps/{beatmap_id}/attributes", data=data)
+        return await self._post_endpoint(f"beatmaps/{beatmap_id}/attributes", data=data, idempotent=True)
 
     async def get_user_info(
             self,
@@ -209,4 +224,57 @@ class OsuChatApiV2(BaseOsuApiV2):
         :param is_action: whether the message is an action
         """
         data = {"target_id": target_id, "message": message, "is_action": is_action}
-        await self._post_endpoint(endpoint="chat/new", data=data)
+        await self._post_endpoint(endpoint="chat/new", data=data, transport_endpoint="osu.chat")
+
+
+class OsuApiPool:
+    """
+    Pool of osu! api clients with different OAuth credentials.
+    Every call is routed to the client that can send a request the soonest.
+    """
+
+    def __init__(self, client_cls: Type[BaseOsuApiV2], credentials: list[tuple[str, str]]):
+        assert len(credentials) > 0, "At least one osu! api credential is required."
+        self.clients = [client_cls(client_id, client_secret) for client_id, client_secret in credentials]
+
+    @classmethod
+    def from_env(cls, client_cls: Type[BaseOsuApiV2]) -> "OsuApiPool":
+        """
+        Creates the pool from comma separated OSU_CLIENT_ID and OSU_CLIENT_SECRET environment variables.
+        """
+        client_ids = os.getenv("OSU_CLIENT_ID", "").split(",")
+        client_secrets = os.getenv("OSU_CLIENT_SECRET", "").split(",")
+        assert len(client_ids) == len(client_secrets), "OSU_CLIENT_ID and OSU_CLIENT_SECRET counts don't match."
+        return cls(client_cls, list(zip(client_ids, client_secrets)))
+
+    def acquire(self) -> BaseOsuApiV2:
+        """Get the client with the most available capacity."""
+        return min(self.clients, key=lambda client: (client.seconds_until_available(), client.in_flight))
+
+    def __getattr__(self, name: str):
+        if name.startswith("_") or not callable(getattr(self.clients[0], name)):
+            raise AttributeError(name)
+
+        async def call_with_client(*args, **kwargs):
+            client = self.acquire()
+            client.in_flight += 1
+            try:
+                return await getattr(client, name)(*args, **kwargs)
+            finally:
+                client.in_flight -= 1
+
+        return call_with_client
+
+    async def refresh_tokens(self):
+        """Refreshes the token of every client before it expires."""
+        while True:
+            for client in self.clients:
+                try:
+                    await client.ensure_authenticated()
+                except Exception as e:
+                    logger.exception(f"Could not refresh token of {client.__class__.__name__}", exc_info=e)
+            await asyncio.sleep(TOKEN_REFRESH_CHECK_SECONDS)
+
+    async def close_session(self):
+        # Clients share the HTTP transport
+        await self.clients[0].close_session()
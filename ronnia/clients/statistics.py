@@ -0,0 +1,195 @@
+import asyncio
+import datetime
+import logging
+import os
+from collections import Counter
+from typing import Optional
+
+from bson import Binary
+from pymongo import UpdateOne
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.errors import DuplicateKeyError
+
+from ronnia.utils.sketches import HyperLogLog, SpaceSaving
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FLUSH_SECONDS = float(os.getenv("STATISTICS_ROLLUP_FLUSH_SECONDS", 10))
+ROLLUP_MAX_PENDING_KEYS = 1000
+SKETCH_PERSIST_SECONDS = float(os.getenv("STATISTICS_SKETCH_PERSIST_SECONDS", 60))
+
+
+def truncate_to_day(timestamp: datetime.datetime) -> datetime.datetime:
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def truncate_to_hour(timestamp: datetime.datetime) -> datetime.datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+class StatisticsRollupBuffer:
+    """
+    Buffers request counts per channel/day, beatmap/day and channel/hour in memory,
+    and writes them to the rollup collections as batched $inc upserts.
+    """
+
+    def __init__(self, channel_daily_col: AsyncCollection, beatmap_daily_col: AsyncCollection,
+                 channel_hourly_col: AsyncCollection, max_pending_keys: int = ROLLUP_MAX_PENDING_KEYS):
+        self.channel_daily_col = channel_daily_col
+        self.beatmap_daily_col = beatmap_daily_col
+        self.channel_hourly_col = channel_hourly_col
+        self.max_pending_keys = max_pending_keys
+
+        self._channel_daily = Counter()
+        self._beatmap_daily = Counter()
+        self._channel_hourly = Counter()
+        self._flush_lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._channel_daily) + len(self._beatmap_daily) + len(self._channel_hourly)
+
+    def add(self, channel_id: int, beatmap_id: int, timestamp: datetime.datetime) -> bool:
+        """
+        Count a request in the rollups.
+        :return: Whether the buffer should be flushed now
+        """
+        day = truncate_to_day(timestamp)
+        self._channel_daily[(channel_id, day)] += 1
+        self._beatmap_daily[(beatmap_id, day)] += 1
+        self._channel_hourly[(channel_id, truncate_to_hour(timestamp))] += 1
+        return len(self) >= self.max_pending_keys
+
+    @staticmethod
+    def _operations(counts: Counter, key_fields: tuple[str, str]) -> list[UpdateOne]:
+        return [
+            UpdateOne(dict(zip(key_fields, key)), {"$inc": {"count": count}}, upsert=True)
+            for key, count in counts.items()
+        ]
+
+    async def flush(self):
+        """Write the buffered counts to the rollup collections."""
+        async with self._flush_lock:
+            batches = [
+                (self.channel_daily_col, self._operations(self._channel_daily, ("channel", "day"))),
+                (self.beatmap_daily_col, self._operations(self._beatmap_daily, ("beatmap_id", "day"))),
+                (self.channel_hourly_col, self._operations(self._channel_hourly, ("channel", "hour"))),
+            ]
+            self._channel_daily, self._beatmap_daily, self._channel_hourly = Counter(), Counter(), Counter()
+
+            for col, operations in batches:
+                if operations:
+                    # $inc upserts are not idempotent, so failed batches are logged instead of retried
+                    try:
+                        await col.bulk_write(operations, ordered=False)
+                    except Exception as e:
+                        logger.exception(f"Could not write {len(operations)} rollups to {col.name}", exc_info=e)
+
+    async def run(self, interval: float = ROLLUP_FLUSH_SECONDS):
+        """Flush the buffer every interval seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+
+def get_month_period(timestamp: datetime.datetime) -> str:
+    return timestamp.strftime("%Y-%m")
+
+
+def get_week_period(timestamp: datetime.datetime) -> str:
+    year, week, _ = timestamp.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class StatisticsSketches:
+    """
+    Approximate statistics fed from the request path: unique requesters per channel and month (HyperLogLog)
+    and the most requested beatmaps per week (Space-Saving).
+    Sketches are merged into the Sketches collection periodically, so every bot process contributes to them.
+    """
+
+    def __init__(self, sketches_col: AsyncCollection, sketches_read_col: Optional[AsyncCollection] = None):
+        self.sketches_col = sketches_col
+        self.sketches_read_col = sketches_col if sketches_read_col is None else sketches_read_col
+        self._unique_requesters: dict[str, HyperLogLog] = {}
+        self._top_beatmaps: dict[str, SpaceSaving] = {}
+        self._persist_lock = asyncio.Lock()
+
+    @staticmethod
+    def unique_requesters_key(channel_id: int, period: str) -> str:
+        return f"unique_requesters:{channel_id}:{period}"
+
+    @staticmethod
+    def top_beatmaps_key(period: str) -> str:
+        return f"top_beatmaps:{period}"
+
+    def add(self, channel_id: int, requester_id: int, beatmap_id: int, timestamp: datetime.datetime):
+        unique_requesters_key = self.unique_requesters_key(channel_id, get_month_period(timestamp))
+        if unique_requesters_key not in self._unique_requesters:
+            self._unique_requesters[unique_requesters_key] = HyperLogLog()
+        self._unique_requesters[unique_requesters_key].add(requester_id)
+
+        top_beatmaps_key = self.top_beatmaps_key(get_week_period(timestamp))
+        if top_beatmaps_key not in self._top_beatmaps:
+            self._top_beatmaps[top_beatmaps_key] = SpaceSaving()
+        self._top_beatmaps[top_beatmaps_key].add(beatmap_id)
+
+    async def _merge_into_stored(self, key: str, sketch: HyperLogLog | SpaceSaving, max_tries: int = 5):
+        """Merges the sketch into the stored one, with optimistic concurrency between processes."""
+        for _ in range(max_tries):
+            stored = await self.sketches_col.find_one({"_id": key})
+            version = 0 if stored is None else stored["version"]
+            merged = sketch
+            if stored is not None:
+                merged = type(sketch).from_bytes(stored["data"])
+                merged.merge(sketch)
+            try:
+                result = await self.sketches_col.update_one(
+                    {"_id": key, "version": version},
+                    {"$set": {"data": Binary(merged.to_bytes()),
+                              "updated_at": datetime.datetime.now(datetime.timezone.utc)},
+                     "$inc": {"version": 1}},
+                    upsert=stored is None,
+                )
+            except DuplicateKeyError:
+                # Another process created the document first
+                continue
+            if result.matched_count or result.upserted_id is not None:
+                return
+        logger.warning(f"Could not persist sketch {key} after {max_tries} tries")
+
+    async def persist(self):
+        """Merge the in-memory sketches into the stored sketches and start over."""
+        async with self._persist_lock:
+            sketches = {**self._unique_requesters, **self._top_beatmaps}
+            self._unique_requesters, self._top_beatmaps = {}, {}
+            for key, sketch in sketches.items():
+                try:
+                    await self._merge_into_stored(key, sketch)
+                except Exception as e:
+                    logger.exception(f"Could not persist sketch {key}", exc_info=e)
+
+    async def run(self, interval: float = SKETCH_PERSIST_SECONDS):
+        """Persist the sketches every interval seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            await self.persist()
+
+    async def _load(self, key: str, sketch_type: type, local: dict):
+        stored = await self.sketches_read_col.find_one({"_id": key})
+        sketch = None if stored is None else sketch_type.from_bytes(stored["data"])
+        if key in local:
+            if sketch is None:
+                sketch = sketch_type.from_bytes(local[key].to_bytes())
+            else:
+                sketch.merge(local[key])
+        return sketch
+
+    async def estimate_unique_requesters(self, channel_id: int, month: datetime.datetime) -> int:
+        key = self.unique_requesters_key(channel_id, get_month_period(month))
+        sketch = await self._load(key, HyperLogLog, self._unique_requesters)
+        return 0 if sketch is None else sketch.count()
+
+    async def estimate_top_beatmaps(self, week: datetime.datetime, k: int = 20) -> list[tuple[int, int]]:
+        key = self.top_beatmaps_key(get_week_period(week))
+        sketch = await self._load(key, SpaceSaving, self._top_beatmaps)
+        return [] if sketch is None else sketch.top(k)
@@ -0,0 +1,316 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Optional
+
+import aiohttp
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from yarl import URL
+
+from ronnia.utils.metrics import Histogram, registry
+
+logger = logging.getLogger(__name__)
+
+CONNECTION_LIMIT = 100
+CONNECTION_LIMIT_PER_HOST = 20
+DNS_CACHE_SECONDS = 300
+KEEPALIVE_SECONDS = 30
+RETRY_ATTEMPTS = 3
+RETRY_MAX_WAIT_SECONDS = 10
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_SECONDS = 30
+
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=10, sock_connect=5)
+ENDPOINT_TIMEOUTS = {
+    "osu.oauth": aiohttp.ClientTimeout(total=10, sock_connect=5),
+    "osu.api": aiohttp.ClientTimeout(total=5, sock_connect=3),
+    "osu.chat": aiohttp.ClientTimeout(total=10, sock_connect=3),
+    "twitch.oauth": aiohttp.ClientTimeout(total=10, sock_connect=5),
+    "twitch.helix": aiohttp.ClientTimeout(total=10, sock_connect=3),
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised without sending the request while the circuit of the host is open."""
+
+
+class RequestFailedError(aiohttp.ClientError):
+    """A non-idempotent request failed after it may have been sent, so it is not retried."""
+
+
+class ResponseStatusError(aiohttp.ClientError):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class RetryableStatusError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"Retryable response status {status}")
+        self.status = status
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and fails fast for reset_seconds.
+    After that a single trial request is let through, closing the circuit again if it succeeds.
+    """
+
+    def __init__(self, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def release_trial(self):
+        """
+        The trial request ended without telling whether the host recovered, e.g. it was cancelled or rate limited,
+        so another one may run.
+        """
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+
+@dataclass
+class HostMetrics:
+    requests: int = 0
+    failures: int = 0
+    new_connections: int = 0
+    reused_connections: int = 0
+    latency_ms: Histogram = field(default_factory=Histogram)
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "latency_ms": self.latency_ms.snapshot(),
+        }
+
+
+@dataclass
+class TransportResponse:
+    status: int
+    data: Any
+    headers: dict
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    def raise_for_status(self, message: str = ""):
+        if not self.ok:
+            raise ResponseStatusError(self.status, f"{message} returned {self.status}".strip())
+
+
+class HttpTransport:
+    """
+    HTTP transport shared by the osu! and Twitch clients.
+    Keeps a single tuned connection pool, applies per endpoint timeouts, retries with jittered backoff
+    and fails fast with a per host circuit breaker while an upstream is down.
+    """
+
+    def __init__(
+            self,
+            retry_attempts: int = RETRY_ATTEMPTS,
+            retry_max_wait: float = RETRY_MAX_WAIT_SECONDS,
+            endpoint_timeouts: Optional[dict[str, aiohttp.ClientTimeout]] = None,
+            circuit_failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+            circuit_reset_seconds: float = CIRCUIT_RESET_SECONDS,
+            metrics_name: Optional[str] = "http",
+    ):
+        self.retry_attempts = retry_attempts
+        self.retry_max_wait = retry_max_wait
+        self.endpoint_timeouts = ENDPOINT_TIMEOUTS if endpoint_timeouts is None else endpoint_timeouts
+        self.circuit_failure_threshold = circuit_failure_threshold
+        self.circuit_reset_seconds = circuit_reset_seconds
+
+        self._session: aiohttp.ClientSession | None = None
+        self._session_lock = asyncio.Lock()
+        self.circuit_breakers: dict[str, CircuitBreaker] = {}
+        self.host_metrics: dict[str, HostMetrics] = {}
+
+        if metrics_name is not None:
+            registry.register(metrics_name, self.metrics)
+
+    def _create_trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_connection_create_end(session, context, params):
+            self._get_host_metrics(context.trace_request_ctx.host).new_connections += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            self._get_host_metrics(context.trace_request_ctx.host).reused_connections += 1
+
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        async with self._session_lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(limit=CONNECTION_LIMIT,
+                                                 limit_per_host=CONNECTION_LIMIT_PER_HOST,
+                                                 ttl_dns_cache=DNS_CACHE_SECONDS,
+                                                 keepalive_timeout=KEEPALIVE_SECONDS)
+                self._session = aiohttp.ClientSession(connector=connector,
+                                                      timeout=DEFAULT_TIMEOUT,
+                                                      trace_configs=[self._create_trace_config()])
+            return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _get_host_metrics(self, host: str) -> HostMetrics:
+        if host not in self.host_metrics:
+            self.host_metrics[host] = HostMetrics()
+        return self.host_metrics[host]
+
+    def get_circuit_breaker(self, host: str) -> CircuitBreaker:
+        if host not in self.circuit_breakers:
+            self.circuit_breakers[host] = CircuitBreaker(self.circuit_failure_threshold, self.circuit_reset_seconds)
+        return self.circuit_breakers[host]
+
+    def metrics(self) -> dict:
+        return {
+            host: {**host_metrics.snapshot(), "circuit": self.get_circuit_breaker(host).state}
+            for host, host_metrics in self.host_metrics.items()
+        }
+
+    async def _send(self, method: str, url: str, endpoint: str, idempotent: bool, **kwargs) -> TransportResponse:
+        host = URL(url).host
+        circuit_breaker = self.get_circuit_breaker(host)
+        host_metrics = self._get_host_metrics(host)
+        is_trial = circuit_breaker.state == "half-open"
+        if not circuit_breaker.allow_request():
+            raise CircuitOpenError(f"Circuit for {host} is open, not sending {method} {endpoint}")
+
+        start = time.perf_counter()
+        host_metrics.requests += 1
+        try:
+            session = await self.get_session()
+            async with session.request(method, url,
+                                       timeout=self.endpoint_timeouts.get(endpoint, DEFAULT_TIMEOUT),
+                                       trace_request_ctx=SimpleNamespace(host=host),
+                                       **kwargs) as resp:
+                body = await resp.read()
+                try:
+                    data = json.loads(body) if body else None
+                except ValueError:
+                    data = body.decode(errors="replace")
+                response = TransportResponse(status=resp.status, data=data, headers=dict(resp.headers))
+        except aiohttp.ClientConnectorError:
+            # The request was never sent, safe to retry for every method
+            host_metrics.failures += 1
+            circuit_breaker.record_failure()
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            host_metrics.failures += 1
+            circuit_breaker.record_failure()
+            if idempotent:
+                raise
+            raise RequestFailedError(f"{method} {endpoint} failed: {e!r}") from e
+        except BaseException:
+            # Cancelled by the caller, the host didn't fail but the trial must not block the circuit forever
+            if is_trial:
+                circuit_breaker.release_trial()
+            raise
+        finally:
+            host_metrics.latency_ms.observe((time.perf_counter() - start) * 1000)
+
+        if response.status in RETRY_STATUSES:
+            host_metrics.failures += 1
+            if response.status != 429:
+                circuit_breaker.record_failure()
+            elif is_trial:
+                # Rate limited is not a failure of the host, but the trial must still end
+                circuit_breaker.release_trial()
+            if idempotent or response.status == 429:
+                raise RetryableStatusError(response.status)
+            return response
+
+        circuit_breaker.record_success()
+        return response
+
+    async def request(
+            self,
+            method: str,
+            url: str,
+            endpoint: str = "default",
+            idempotent: Optional[bool] = None,
+            **kwargs,
+    ) -> TransportResponse:
+        """
+        Sends the request and reads the JSON body.
+        :param method: HTTP method
+        :param url: Request url
+        :param endpoint: Endpoint name, used for the timeout of the request
+        :param idempotent: Whether the request can be retried after it is sent, defaults to True for GET
+        :return: Response status, JSON body and headers. Responses with retryable statuses are returned
+                 after retries are exhausted.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in ("GET", "HEAD", "OPTIONS")
+
+        retrying = AsyncRetrying(
+            stop=stop_after_attempt(self.retry_attempts),
+            wait=wait_random_exponential(multiplier=0.5, max=self.retry_max_wait),
+            retry=retry_if_exception_type((aiohttp.ClientConnectorError, asyncio.TimeoutError,
+                                           aiohttp.ServerDisconnectedError, RetryableStatusError)),
+            reraise=True,
+        )
+        try:
+            async for attempt in retrying:
+                with attempt:
+                    return await self._send(method, url, endpoint, idempotent, **kwargs)
+        except RetryableStatusError as e:
+            logger.warning(f"{method} {endpoint} failed after {self.retry_attempts} attempts with status {e.status}")
+            return TransportResponse(status=e.status, data=None, headers={})
+
+
+_default_transport: HttpTransport | None = None
+
+
+def get_transport() -> HttpTransport:
+    """The transport shared by every client in the process."""
+    global _default_transport
+    if _default_transport is None:
+        _default_transport = HttpTransport()
+    return _default_transport
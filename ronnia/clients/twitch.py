@@ -1,78 +1,83 @@
 import asyncio
-from typing import AsyncGenerator, AsyncIterable
-
-import aiohttp
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+import logging
+import os
+import time
+from typing import AsyncGenerator, AsyncIterable, Optional
 
+from ronnia.clients.credentials import Token, get_credential_broker
+from ronnia.clients.transport import get_transport
 from ronnia.utils.singleton import SingletonMeta
 from ronnia.utils.utils import async_batcher
 
+logger = logging.getLogger(__name__)
+
+# Overridden to point the bot at local stand-ins, see benchmarks/fake_services.py
+TWITCH_API_URL = os.getenv("TWITCH_API_URL", "https://api.twitch.tv/helix")
+TWITCH_AUTH_URL = os.getenv("TWITCH_AUTH_URL", "https://id.twitch.tv/oauth2/token")
+
 
 class TwitchAPI(metaclass=SingletonMeta):
     def __init__(self, client_id: str, client_secret: str, max_concurrent: int = 4):
         self.client_id = client_id
         self.client_secret = client_secret
         self.access_token = None
-        self.base_url = "https://api.twitch.tv/helix"
-        self.session = None
+        self.base_url = TWITCH_API_URL
+        self.transport = get_transport()
         self.semaphore = asyncio.Semaphore(max_concurrent)
         self.auth_lock = asyncio.Lock()
-        self.authenticating = False
 
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
         await self.authenticate()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.session.close()
+        # The HTTP transport is shared and kept open between polls
+        pass
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        retry=retry_if_exception_type((aiohttp.ClientError, aiohttp.ServerConnectionError))
-    )
     async def _make_request(self, method: str, url: str, **kwargs) -> dict:
         async with self.semaphore:
-            while self.authenticating:
-                await asyncio.sleep(0.1)
-            async with self.session.request(method, url, **kwargs) as response:
+            response = await self.transport.request(method, url, endpoint="twitch.helix", **kwargs)
+            if response.status == 200:
+                return response.data
+            elif response.status == 401 and method != "POST":
+                # Token might have been revoked, try to re-authenticate unless another request already did
+                rejected_token = kwargs['headers']["Authorization"].removeprefix("Bearer ")
+                await get_credential_broker().invalidate(self.credential_key, rejected_token)
+                await self.authenticate()
+                kwargs['headers']["Authorization"] = f"Bearer {self.access_token}"
+                response = await self.transport.request(method, url, endpoint="twitch.helix", **kwargs)
                 if response.status == 200:
-                    return await response.json()
-                elif response.status == 401 and method != "POST":
-                    # Token might be expired, try to re-authenticate
-                    await self.authenticate()
-                    kwargs['headers']["Authorization"] = f"Bearer {self.access_token}"
-                    return await self._make_request(method, url, **kwargs)
-                else:
-                    response.raise_for_status()
+                    return response.data
+            response.raise_for_status(f"Twitch API {method} {url}")
+            return response.data
 
     async def _auth_request(self, url: str, params: dict) -> dict:
-        async with self.session.post(url, params=params) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                response.raise_for_status()
+        response = await self.transport.request("POST", url, endpoint="twitch.oauth", idempotent=True, params=params)
+        response.raise_for_status("Twitch authentication")
+        return response.data
+
+    @property
+    def credential_key(self) -> str:
+        return f"twitch:{self.client_id}"
 
     async def authenticate(self):
+        """Gets the current app access token from the credential broker, which refreshes it ahead of expiry."""
         async with self.auth_lock:
-            if self.access_token:
-                return
+            self.access_token = await get_credential_broker().get_token(self.credential_key, self._request_token)
 
-            auth_url = "https://id.twitch.tv/oauth2/token"
-            params = {
-                "client_id": self.client_id,
-                "client_secret": self.client_secret,
-                "grant_type": "client_credentials"
-            }
+    async def _request_token(self) -> Token:
+        params = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "grant_type": "client_credentials"
+        }
 
-            data = await self._auth_request(auth_url, params)
-            self.access_token = data["access_token"]
+        data = await self._auth_request(TWITCH_AUTH_URL, params)
+        return Token(access_token=data["access_token"], expires_at=time.time() + data["expires_in"])
 
     async def get_streams_batch(self, user_ids: list[int]) -> dict:
         """Fetch /streams from the TwitchAPI for the given user_ids list."""
-        if not self.access_token:
-            await self.authenticate()
+        await self.authenticate()
 
         headers = {
             "Client-ID": self.client_id,
@@ -85,15 +90,45 @@ class TwitchAPI(metaclass=SingletonMeta):
 
         return await self._make_request("GET", url, headers=headers)
 
-    async def get_streams(self, user_ids: AsyncIterable[int]) -> AsyncGenerator[dict, None]:
-        """Get current streaming users for the given user_ids list."""
+    async def get_users_batch(self, logins: list[str]) -> dict:
+        """Fetch /users from the TwitchAPI for at most 100 logins."""
+        await self.authenticate()
+
+        headers = {
+            "Client-ID": self.client_id,
+            "Authorization": f"Bearer {self.access_token}"
+        }
+
+        login_params = "&".join(f"login={login}" for login in logins)
+        url = f"{self.base_url}/users?{login_params}"
+
+        return await self._make_request("GET", url, headers=headers)
+
+    async def _get_streams_batch_or_unknown(self, user_ids: list[int], failed_user_ids: Optional[set[int]]) -> dict:
+        try:
+            return await self.get_streams_batch(user_ids)
+        except Exception as e:
+            if failed_user_ids is None:
+                raise e
+            logger.warning(f"Could not get the streams of {len(user_ids)} users, their status is unknown",
+                           exc_info=e)
+            failed_user_ids.update(user_ids)
+            return {"data": []}
+
+    async def get_streams(self, user_ids: AsyncIterable[int],
+                          failed_user_ids: Optional[set[int]] = None) -> AsyncGenerator[dict, None]:
+        """
+        Get current streaming users for the given user_ids list.
+        :param user_ids: Twitch ids of the users
+        :param failed_user_ids: If given, the ids of the batches that failed are added to it instead of raising
+        """
         # Create tasks for each batch
         async with asyncio.TaskGroup() as tg:
             tasks = []
             async for batch in async_batcher(user_ids, 100):
                 if not len(batch):
                     continue
-                tasks.append(tg.create_task(self.get_streams_batch(batch)))
+                tasks.append(tg.create_task(self._get_streams_batch_or_unknown(batch, failed_user_ids)))
 
             for task in asyncio.as_completed(tasks):
                 users = await task
@@ -6,21 +6,45 @@ import platform
 import sys
 
 from ronnia.bots.bot_manager import BotManager
+from ronnia.utils.profiler import ProfilerToggle
+from ronnia.utils.sampling import SENTRY_PROFILES_SAMPLE_RATE, AdaptiveSampler
 from utils.logger import CustomJsonFormatter
 
-if __name__ == "__main__":
 
+def init_sentry():
+    import sentry_sdk
+    from sentry_sdk.integrations.logging import LoggingIntegration
+    sentry_sdk.init(
+        dsn=os.getenv("SENTRY_DSN"),
+        traces_sampler=AdaptiveSampler(),
+        profiles_sample_rate=SENTRY_PROFILES_SAMPLE_RATE,
+        integrations=[
+            LoggingIntegration(),
+        ],
+    )
+
+
+def log_sentry_init_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logging.getLogger(__name__).error("Could not initialize Sentry, errors are not reported",
+                                          exc_info=task.exception())
+
+
+async def main():
     if os.getenv("SENTRY_DSN"):
-        import sentry_sdk
-        from sentry_sdk.integrations.logging import LoggingIntegration
-        sentry_sdk.init(
-            dsn=os.getenv("SENTRY_DSN"),
-            traces_sample_rate=1.0,
-            profiles_sample_rate=1.0,
-            integrations=[
-                LoggingIntegration(),
-            ],
-        )
+        # sentry_sdk is slow to import, so it is initialized while the bot is connecting
+        sentry_init_task = asyncio.create_task(asyncio.to_thread(init_sentry))
+        sentry_init_task.add_done_callback(log_sentry_init_failure)
+
+    # `kill -USR1 <pid>` profiles the bot for PROFILER_SECONDS seconds
+    profiler_toggle = ProfilerToggle()
+    profiler_toggle.install_signal_handler()
+
+    bot_manager = BotManager()
+    await bot_manager.start()
+
+
+if __name__ == "__main__":
 
     # Required for multiprocessing to work on Linux
     multiprocessing.set_start_method("spawn")
@@ -38,5 +62,4 @@ if __name__ == "__main__":
         logger.info(f"Windows platform detected, setting event loop policy to {loop_policy.__class__.__name__}")
         asyncio.set_event_loop_policy(loop_policy)
 
-    bot_manager = BotManager()
-    asyncio.run(bot_manager.start())
+    asyncio.run(main())
@@ -8,7 +8,28 @@ class BeatmapType(enum.StrEnum):
     MAPSET = "Beatmapset"
 
 
+class Mods(enum.IntFlag):
+    """osu! mod bitmask values, as used by the osu! api."""
+    NF = 1
+    EZ = 2
+    TD = 4
+    HD = 8
+    HR = 16
+    SD = 32
+    DT = 64
+    HT = 256
+    NC = 512
+    FL = 1024
+    SO = 4096
+    PF = 16384
+
+
+# Mods that change the star rating of a beatmap (NC is counted as DT)
+DIFFICULTY_MODS = Mods.EZ | Mods.HR | Mods.DT | Mods.HT | Mods.FL
+
+
 class Beatmap(BaseModel):
     id: int
     type: BeatmapType
     mods: str
+    mods_bitmask: int = 0
@@ -1,6 +1,7 @@
-from typing import List
+import datetime
+from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class DBSettings(BaseModel):
@@ -11,6 +12,7 @@ class DBSettings(BaseModel):
     test: bool = False
     cooldown: float = 0
     sr: List[float] = [0, -1]
+    digest: bool = False
 
 
 class DBUser(BaseModel):
@@ -23,3 +25,17 @@ class DBUser(BaseModel):
     excludedUsers: List[str] = []
     settings: DBSettings = DBSettings()
     isLive: bool = False
+
+
+class DBRequest(BaseModel):
+    """Beatmap request event in the Statistics collection, stored with short keys."""
+    model_config = ConfigDict(populate_by_name=True)
+
+    beatmapId: int = Field(alias="b")
+    channelId: Optional[int] = Field(None, alias="c")
+    requesterId: Optional[int] = Field(None, alias="r")
+    mods: int = Field(0, alias="m")
+    timestamp: datetime.datetime = Field(alias="t")
+    # Only set for migrated requests whose Twitch ids could not be resolved
+    channelName: Optional[str] = Field(None, alias="cn")
+    requesterName: Optional[str] = Field(None, alias="rn")
@@ -0,0 +1,56 @@
+"""
+Runs a cluster node without the Twitch bot, logging the partitions it owns and whether it is the leader.
+Start several of these against one local mongod to try out the lease coordination, and kill some of them
+to see their partitions being taken over.
+
+Usage: MONGODB_URL=mongodb://localhost:27017 python -m ronnia.tools.cluster_node [--partitions 16] [--node-id a]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from typing import Optional
+
+from ronnia.clients.cluster import CLUSTER_HEARTBEAT_SECONDS, CLUSTER_LEASE_SECONDS, ClusterCoordinator
+from ronnia.clients.mongo import get_ronnia_database
+from ronnia.utils.logger import formatter
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args(args: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run a cluster node without the Twitch bot.")
+    parser.add_argument("--partitions", type=int, default=int(os.getenv("CLUSTER_PARTITIONS") or 16))
+    parser.add_argument("--node-id", default=None, help="Defaults to host name, process id and a random suffix")
+    parser.add_argument("--lease-seconds", type=float, default=CLUSTER_LEASE_SECONDS)
+    parser.add_argument("--heartbeat-seconds", type=float, default=CLUSTER_HEARTBEAT_SECONDS)
+    return parser.parse_args(args)
+
+
+async def main(args: argparse.Namespace):
+    db_client = get_ronnia_database()
+    coordinator = ClusterCoordinator(db_client.cluster_leases_col, db_client.cluster_nodes_col,
+                                     partitions=args.partitions, node_id=args.node_id,
+                                     lease_seconds=args.lease_seconds, heartbeat_seconds=args.heartbeat_seconds)
+    run_task = asyncio.create_task(coordinator.run())
+    try:
+        while True:
+            await coordinator.changed.wait()
+            coordinator.changed.clear()
+            logger.info(f"{coordinator.node_id} owns partitions {sorted(coordinator.owned_partitions)}, "
+                        f"leader: {coordinator.is_leader}")
+    finally:
+        run_task.cancel()
+        await asyncio.gather(run_task, return_exceptions=True)
+        await db_client.close()
+
+
+if __name__ == "__main__":
+    root_logger = logging.getLogger()
+    root_logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+    logHandler = logging.StreamHandler(sys.stdout)
+    logHandler.setFormatter(formatter)
+    root_logger.addHandler(logHandler)
+
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,263 @@
+"""
+Imports beatmap metadata dumps into the Beatmaps collection, so cold beatmaps don't need an osu! api call.
+
+Supported dumps:
+- data.ppy.sh SQL dumps. Import `osu_beatmaps.sql` first, then `osu_beatmapsets.sql` to fill in artist and title.
+- JSONL files with one osu! api beatmap (with its beatmapset) or beatmapset (with its beatmaps) per line.
+
+Imported beatmaps are stamped with the import time, like beatmaps fetched from the osu! api they are refreshed in the
+background once expired and removed if they are not requested for BEATMAP_MAX_STALE_SECONDS.
+
+Usage: python -m ronnia.tools.import_beatmaps osu_beatmaps.sql osu_beatmapsets.sql
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import re
+import sys
+from typing import Iterator, Optional
+
+from pymongo import UpdateOne, UpdateMany
+
+from ronnia.clients.mongo import RonniaDatabase, get_ronnia_database
+from ronnia.utils.logger import formatter
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 1000
+# Beatmaps with these statuses don't change anymore, the rest are left to the osu! api by default
+IMMUTABLE_STATUSES = {"ranked", "approved", "loved"}
+SQL_STATUSES = {-2: "graveyard", -1: "wip", 0: "pending", 1: "ranked", 2: "approved", 3: "qualified", 4: "loved"}
+SQL_MODES = {0: "osu", 1: "taiko", 2: "fruits", 3: "mania"}
+
+SQL_CREATE_TABLE_PATTERN = re.compile(r"CREATE TABLE `(\w+)`")
+SQL_COLUMN_PATTERN = re.compile(r"^\s+`(\w+)`")
+SQL_INSERT_PATTERN = re.compile(r"INSERT INTO `(\w+)`(?: \(([^)]*)\))? VALUES ")
+SQL_TOKEN_PATTERN = re.compile(r"'((?:[^'\\]|\\.)*)'|(NULL)|([-+0-9.eE]+)|([(),;])")
+SQL_ESCAPES = {"0": "\0", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+
+
+def unescape_sql_string(value: str) -> str:
+    return re.sub(r"\\(.)", lambda m: SQL_ESCAPES.get(m.group(1), m.group(1)), value)
+
+
+def parse_sql_values(values: str) -> Iterator[list]:
+    """
+    Parses the rows of an extended INSERT statement.
+    :param values: Part of the statement after VALUES
+    :return: Rows as lists of python values
+    """
+    row = None
+    for match in SQL_TOKEN_PATTERN.finditer(values):
+        string_value, null_value, number_value, punctuation = match.groups()
+        if punctuation == "(":
+            row = []
+        elif punctuation == ")":
+            yield row
+            row = None
+        elif row is None:
+            continue
+        elif string_value is not None:
+            row.append(unescape_sql_string(string_value))
+        elif null_value is not None:
+            row.append(None)
+        elif number_value is not None:
+            row.append(float(number_value) if any(c in number_value for c in ".eE") else int(number_value))
+
+
+def sql_beatmap_to_document(row: dict) -> dict:
+    return {
+        "id": row["beatmap_id"],
+        "beatmapset_id": row["beatmapset_id"],
+        "version": row["version"],
+        "bpm": row["bpm"],
+        "status": SQL_STATUSES.get(row["approved"], "pending"),
+        "difficulty_rating": row["difficultyrating"],
+        "hit_length": row["hit_length"],
+        "mode": SQL_MODES.get(row["playmode"], "osu"),
+    }
+
+
+def sql_beatmapset_to_document(row: dict) -> dict:
+    return {"id": row["beatmapset_id"], "artist": row["artist"], "title": row["title"]}
+
+
+class BeatmapDumpImporter:
+    def __init__(self, db_client: RonniaDatabase, batch_size: int = IMPORT_BATCH_SIZE, all_statuses: bool = False):
+        self.db_client = db_client
+        self.batch_size = batch_size
+        self.all_statuses = all_statuses
+        self.progress_col = db_client.db.get_collection("BeatmapImports")
+        self.imported_at = datetime.datetime.now(tz=datetime.timezone.utc)
+
+    def _should_import(self, beatmap_doc: dict) -> bool:
+        return self.all_statuses or beatmap_doc["status"] in IMMUTABLE_STATUSES
+
+    def _beatmap_operation(self, beatmap_doc: dict) -> UpdateOne:
+        # Imported beatmaps age from the import like beatmaps fetched from the osu! api
+        beatmap_doc["ronnia_imported_at"] = self.imported_at
+        beatmap_doc["ronnia_updated_at"] = self.imported_at
+        return UpdateOne({"id": beatmap_doc["id"]}, {"$set": beatmap_doc}, upsert=True)
+
+    def _beatmapset_operation(self, beatmapset_doc: dict) -> UpdateMany:
+        return UpdateMany({"beatmapset_id": beatmapset_doc["id"]}, {"$set": {"beatmapset": beatmapset_doc}})
+
+    def _api_operations(self, api_object: dict) -> Iterator[UpdateOne]:
+        """Operations for a beatmap or beatmapset object from the osu! api."""
+        if "beatmaps" in api_object:
+            beatmapset_info = api_object
+            beatmaps = api_object["beatmaps"]
+        else:
+            beatmapset_info = api_object["beatmapset"]
+            beatmaps = [api_object]
+
+        for index, beatmap_info in enumerate(beatmaps):
+            beatmap_doc = RonniaDatabase.compact_beatmap(beatmap_info, beatmapset_info)
+            beatmap_doc.pop("ronnia_updated_at")
+            if "beatmaps" in api_object:
+                # Like RonniaDatabase.add_beatmapset
+                beatmap_doc["beatmapset_default"] = index == 0
+            if self._should_import(beatmap_doc):
+                yield self._beatmap_operation(beatmap_doc)
+
+    def read_jsonl(self, dump_file) -> Iterator[tuple[list, int]]:
+        """Yields the operations of every line with the file offset after the line."""
+        for line in iter(dump_file.readline, b""):
+            if line.strip():
+                yield list(self._api_operations(json.loads(line))), dump_file.tell()
+
+    @staticmethod
+    def read_sql_columns(dump_file) -> dict[str, list[str]]:
+        """Reads the column names of the tables from the CREATE TABLE statements before the first INSERT."""
+        table_columns: dict[str, list[str]] = {}
+        create_table = None
+        for raw_line in iter(dump_file.readline, b""):
+            line = raw_line.decode("utf-8", errors="replace")
+            if SQL_INSERT_PATTERN.match(line):
+                break
+            if match := SQL_CREATE_TABLE_PATTERN.match(line):
+                create_table = match.group(1)
+                table_columns[create_table] = []
+            elif create_table is not None:
+                if match := SQL_COLUMN_PATTERN.match(line):
+                    table_columns[create_table].append(match.group(1))
+                elif line.startswith(")"):
+                    create_table = None
+        return table_columns
+
+    def read_sql(self, dump_file, table_columns: Optional[dict[str, list[str]]] = None) -> Iterator[tuple[list, int]]:
+        """Yields the operations of every INSERT statement with the file offset after the statement."""
+        table_columns = {} if table_columns is None else table_columns
+        create_table = None
+        for raw_line in iter(dump_file.readline, b""):
+            line = raw_line.decode("utf-8", errors="replace")
+            if match := SQL_CREATE_TABLE_PATTERN.match(line):
+                create_table = match.group(1)
+                table_columns[create_table] = []
+                continue
+            if create_table is not None:
+                if match := SQL_COLUMN_PATTERN.match(line):
+                    table_columns[create_table].append(match.group(1))
+                elif line.startswith(")"):
+                    create_table = None
+                continue
+
+            match = SQL_INSERT_PATTERN.match(line)
+            if match is None:
+                continue
+            table, columns = match.groups()
+            columns = [c.strip(" `") for c in columns.split(",")] if columns else table_columns.get(table)
+            if columns is None:
+                raise ValueError(f"Columns of table {table} are unknown, the dump has no CREATE TABLE statement.")
+
+            operations = []
+            for values in parse_sql_values(line[match.end():]):
+                row = dict(zip(columns, values))
+                if "beatmap_id" in row:
+                    beatmap_doc = sql_beatmap_to_document(row)
+                    if self._should_import(beatmap_doc):
+                        operations.append(self._beatmap_operation(beatmap_doc))
+                elif "artist" in row:
+                    operations.append(self._beatmapset_operation(sql_beatmapset_to_document(row)))
+            yield operations, dump_file.tell()
+
+    async def _get_resume_offset(self, dump_path: str) -> int:
+        progress = await self.progress_col.find_one({"path": dump_path})
+        return 0 if progress is None else progress["offset"]
+
+    async def _save_progress(self, dump_path: str, offset: int, imported: int):
+        await self.progress_col.update_one({"path": dump_path},
+                                           {"$set": {"offset": offset, "updated_at": datetime.datetime.now()},
+                                            "$inc": {"imported": imported}},
+                                           upsert=True)
+
+    async def import_dump(self, dump_path: str, restart: bool = False):
+        """
+        Streams the dump into the Beatmaps collection in batches, continuing from the last saved offset.
+        :param dump_path: Path of the .sql or .jsonl dump
+        :param restart: Ignore the saved progress and import from the beginning
+        """
+        dump_path = os.path.abspath(dump_path)
+        offset = 0 if restart else await self._get_resume_offset(dump_path)
+        if restart:
+            await self.progress_col.delete_one({"path": dump_path})
+        logger.info(f"Importing {dump_path} from offset {offset}")
+
+        with open(dump_path, "rb") as dump_file:
+            if dump_path.endswith((".jsonl", ".json")):
+                dump_file.seek(offset)
+                statements = self.read_jsonl(dump_file)
+            else:
+                # Resumed imports start after the CREATE TABLE statements, read the columns first
+                table_columns = self.read_sql_columns(dump_file)
+                dump_file.seek(offset)
+                statements = self.read_sql(dump_file, table_columns)
+
+            batch = []
+            imported = 0
+            for operations, offset in statements:
+                batch.extend(operations)
+                if len(batch) >= self.batch_size:
+                    await self.db_client.bulk_write_operations(operations=batch, col=self.db_client.beatmaps_col)
+                    await self._save_progress(dump_path, offset, len(batch))
+                    imported += len(batch)
+                    batch = []
+
+            await self.db_client.bulk_write_operations(operations=batch, col=self.db_client.beatmaps_col)
+            await self._save_progress(dump_path, offset, len(batch))
+            imported += len(batch)
+
+        logger.info(f"Finished importing {dump_path}, wrote {imported} operations")
+
+
+def parse_args(args: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Import beatmap metadata dumps into the Ronnia beatmap cache.")
+    parser.add_argument("dumps", nargs="+", help="data.ppy.sh .sql dumps or .jsonl files, imported in given order")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Operations per bulk_write")
+    parser.add_argument("--all-statuses", action="store_true",
+                        help="Also import beatmaps that are not ranked, approved or loved")
+    parser.add_argument("--restart", action="store_true", help="Ignore saved progress of the dumps")
+    return parser.parse_args(args)
+
+
+async def main(args: argparse.Namespace):
+    db_client = get_ronnia_database()
+    importer = BeatmapDumpImporter(db_client, batch_size=args.batch_size, all_statuses=args.all_statuses)
+    try:
+        for dump_path in args.dumps:
+            await importer.import_dump(dump_path, restart=args.restart)
+    finally:
+        await db_client.close()
+
+
+if __name__ == "__main__":
+    root_logger = logging.getLogger()
+    root_logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+    logHandler = logging.StreamHandler(sys.stdout)
+    logHandler.setFormatter(formatter)
+    root_logger.addHandler(logHandler)
+
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,189 @@
+"""
+Migrates Statistics documents to the compact request schema (see DBRequest), in place and in batches.
+Channel and requester names are resolved to Twitch ids from the Users collection, then from the Twitch API.
+The statistics rollups already count the requests made since they were added, pass --update-rollups only if
+the legacy documents were never counted into them.
+The migration can be stopped and restarted at any time, already migrated documents are skipped.
+The index of the old schema is dropped once no legacy documents are left.
+
+Usage: python -m ronnia.tools.migrate_statistics [--update-rollups] [--keep-legacy-index]
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import sys
+from typing import Optional
+
+from pymongo import ReplaceOne
+from pymongo.errors import OperationFailure
+
+from ronnia.clients.mongo import RonniaDatabase, get_ronnia_database
+from ronnia.clients.twitch import TwitchAPI
+from ronnia.models.database import DBRequest
+from ronnia.utils.beatmap import BeatmapParser
+from ronnia.utils.cache import AsyncLRUCache
+from ronnia.utils.logger import formatter
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 1000
+LEGACY_FILTER = {"requested_beatmap_id": {"$exists": True}}
+LEGACY_INDEX_NAME = "requested_beatmap_id_-1_timestamp_-1_mods_-1"
+INDEX_NOT_FOUND = 27
+
+
+def legacy_mods_to_bitmask(mods: Optional[str]) -> int:
+    try:
+        return BeatmapParser.get_mod_bitmask(mods or "")
+    except KeyError:
+        return 0
+
+
+class StatisticsMigrator:
+    def __init__(self, db_client: RonniaDatabase, twitch_api: Optional[TwitchAPI] = None,
+                 batch_size: int = MIGRATION_BATCH_SIZE, update_rollups: bool = False):
+        self.db_client = db_client
+        self.twitch_api = twitch_api
+        self.batch_size = batch_size
+        self.update_rollups = update_rollups
+        # Twitch login -> Twitch id, None if the login could not be resolved
+        self.twitch_ids = AsyncLRUCache(max_size=100_000)
+
+    async def resolve_twitch_ids(self, logins: set[str]):
+        """Resolves the logins missing from the cache, first from Users, then from the Twitch API."""
+        missing = {login for login in logins if login not in self.twitch_ids}
+        if not missing:
+            return
+
+        async for user in self.db_client.users_read_col.find({"twitchUsername": {"$in": list(missing)}},
+                                                             {"twitchUsername": 1, "twitchId": 1}):
+            self.twitch_ids.set(user["twitchUsername"], user["twitchId"])
+            missing.discard(user["twitchUsername"])
+
+        if missing and self.twitch_api is not None:
+            missing_logins = sorted(missing)
+            for i in range(0, len(missing_logins), 100):
+                users = await self.twitch_api.get_users_batch(missing_logins[i: i + 100])
+                for user in users["data"]:
+                    self.twitch_ids.set(user["login"], int(user["id"]))
+                    missing.discard(user["login"])
+
+        for login in missing:
+            self.twitch_ids.set(login, None)
+
+    def migrate_document(self, legacy_doc: dict) -> DBRequest:
+        channel_name = legacy_doc.get("requested_channel_name")
+        requester_name = legacy_doc.get("requester_channel_name")
+        channel_id = self.twitch_ids.get(channel_name)
+        requester_id = self.twitch_ids.get(requester_name)
+        timestamp = legacy_doc["timestamp"]
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+        return DBRequest(
+            beatmapId=legacy_doc["requested_beatmap_id"],
+            channelId=channel_id,
+            requesterId=requester_id,
+            mods=legacy_mods_to_bitmask(legacy_doc.get("mods")),
+            timestamp=timestamp,
+            channelName=channel_name if channel_id is None else None,
+            requesterName=requester_name if requester_id is None else None,
+        )
+
+    async def migrate_batch(self, legacy_docs: list[dict]):
+        logins = set()
+        for legacy_doc in legacy_docs:
+            logins.update(filter(None, (legacy_doc.get("requested_channel_name"),
+                                        legacy_doc.get("requester_channel_name"))))
+        await self.resolve_twitch_ids(logins)
+
+        operations = []
+        requests = []
+        for legacy_doc in legacy_docs:
+            request = self.migrate_document(legacy_doc)
+            requests.append(request)
+            operations.append(ReplaceOne({"_id": legacy_doc["_id"]},
+                                         request.model_dump(by_alias=True, exclude_none=True)))
+        await self.db_client.bulk_write_operations(operations=operations, col=self.db_client.statistics_col)
+
+        if self.update_rollups:
+            for request in requests:
+                if request.channelId is not None:
+                    self.db_client.rollup_buffer.add(request.channelId, request.beatmapId, request.timestamp)
+            await self.db_client.rollup_buffer.flush()
+
+    async def run(self):
+        migrated = 0
+        last_id = None
+        while True:
+            query = dict(LEGACY_FILTER)
+            if last_id is not None:
+                query["_id"] = {"$gt": last_id}
+            cursor = self.db_client.statistics_col.find(query).sort("_id", 1).limit(self.batch_size)
+            legacy_docs = await cursor.to_list()
+            if not legacy_docs:
+                break
+
+            await self.migrate_batch(legacy_docs)
+            last_id = legacy_docs[-1]["_id"]
+            migrated += len(legacy_docs)
+            logger.info(f"Migrated {migrated} statistics documents")
+
+        logger.info(f"Finished migrating {migrated} statistics documents")
+
+    async def drop_legacy_index(self) -> bool:
+        """
+        Drops the index of the old schema if no legacy documents are left.
+        :return: Whether the index is gone
+        """
+        if await self.db_client.statistics_col.count_documents(LEGACY_FILTER, limit=1):
+            logger.warning(f"Legacy statistics documents are left, keeping {LEGACY_INDEX_NAME} index")
+            return False
+
+        try:
+            await self.db_client.statistics_col.drop_index(LEGACY_INDEX_NAME)
+        except OperationFailure as e:
+            if e.code != INDEX_NOT_FOUND:
+                raise e
+            return True
+        logger.info(f"Dropped {LEGACY_INDEX_NAME} index")
+        return True
+
+
+def parse_args(args: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Migrate Statistics documents to the compact request schema.")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE, help="Documents per batch")
+    parser.add_argument("--update-rollups", action="store_true",
+                        help="Count migrated requests into the rollups, only if they don't count them already")
+    parser.add_argument("--keep-legacy-index", action="store_true",
+                        help="Keep the index of the old schema after migrating")
+    return parser.parse_args(args)
+
+
+async def main(args: argparse.Namespace):
+    db_client = get_ronnia_database()
+    twitch_api = None
+    if os.getenv("TWITCH_CLIENT_ID"):
+        twitch_api = TwitchAPI(os.getenv("TWITCH_CLIENT_ID"), os.getenv("TWITCH_CLIENT_SECRET"))
+    migrator = StatisticsMigrator(db_client, twitch_api=twitch_api, batch_size=args.batch_size,
+                                  update_rollups=args.update_rollups)
+    try:
+        await db_client.initialize()
+        await migrator.run()
+        if not args.keep_legacy_index:
+            await migrator.drop_legacy_index()
+    finally:
+        if twitch_api is not None:
+            await twitch_api.transport.close()
+        await db_client.close()
+
+
+if __name__ == "__main__":
+    root_logger = logging.getLogger()
+    root_logger.setLevel(os.getenv("LOG_LEVEL", logging.INFO))
+    logHandler = logging.StreamHandler(sys.stdout)
+    logHandler.setFormatter(formatter)
+    root_logger.addHandler(logHandler)
+
+    asyncio.run(main(parse_args()))
@@ -1,7 +1,7 @@
 import re
 from collections import OrderedDict
 
-from ronnia.models.beatmap import Beatmap, BeatmapType
+from ronnia.models.beatmap import Beatmap, BeatmapType, Mods, DIFFICULTY_MODS
 
 
 class BeatmapParser:
@@ -30,6 +30,44 @@ class BeatmapParser:
 
         return mods_as_text
 
+    @staticmethod
+    def get_mod_bitmask(mods_as_text: str) -> int:
+        """
+        Converts mods text (e.g. +HDDT) to osu! mod bitmask
+        :param mods_as_text: Mods text returned from get_mod_from_text
+        :return: Mod bitmask
+        """
+        mods_as_text = mods_as_text.lstrip("+")
+        bitmask = Mods(0)
+        for i in range(0, len(mods_as_text), 2):
+            bitmask |= Mods[mods_as_text[i: i + 2]]
+        return int(bitmask)
+
+    @staticmethod
+    def get_mod_text(bitmask: int) -> str:
+        """
+        Converts osu! mod bitmask back to mods text (e.g. +HDDT)
+        :param bitmask: Mod bitmask
+        :return: Mods text, empty string for nomod
+        """
+        mods = Mods(bitmask)
+        if Mods.NC in mods:
+            mods &= ~Mods.DT
+        mods_as_text = "".join(mod.name for mod in Mods if mod in mods)
+        return f"+{mods_as_text}" if mods_as_text else ""
+
+    @staticmethod
+    def get_difficulty_mod_bitmask(mods_as_text: str) -> int:
+        """
+        Get the bitmask of the mods that change the star rating of the beatmap.
+        :param mods_as_text: Mods text returned from get_mod_from_text
+        :return: Difficulty changing mods bitmask, 0 if the mods do not affect the star rating
+        """
+        bitmask = Mods(BeatmapParser.get_mod_bitmask(mods_as_text))
+        if Mods.NC in bitmask:
+            bitmask |= Mods.DT
+        return int(bitmask & DIFFICULTY_MODS)
+
     @staticmethod
     def extract_url_parameters(headers_string, desired_keys) -> list | None:
         headers = {
@@ -100,11 +138,36 @@ class BeatmapParser:
             mods_as_text = BeatmapParser.get_mod_from_text(content, beatmap_link)
             return Beatmap(id=result,
                            type=BeatmapType.MAP,
-                           mods=mods_as_text)
+                           mods=mods_as_text,
+                           mods_bitmask=BeatmapParser.get_mod_bitmask(mods_as_text))
 
         beatmapset_result = BeatmapParser.parse_beatmapset(beatmap_link)
         if beatmapset_result:
             mods_as_text = BeatmapParser.get_mod_from_text(content, beatmap_link)
             return Beatmap(id=beatmapset_result,
                            type=BeatmapType.MAPSET,
-                           mods=mods_as_text)
+                           mods=mods_as_text,
+                           mods_bitmask=BeatmapParser.get_mod_bitmask(mods_as_text))
+
+    @staticmethod
+    def parse_beatmap_links(content: str, limit: int) -> list[Beatmap]:
+        """
+        Finds every beatmap link in the message, each with the mods written after it and before the next link.
+        :param content: Message content
+        :param limit: Maximum number of links to return, the rest are ignored
+        :return: Unique beatmaps in the order they appear in the message
+        """
+        tokens = content.split(" ")
+        link_indices = [i for i, token in enumerate(tokens) if BeatmapParser.parse_beatmap_link(token, token)]
+
+        beatmaps = []
+        seen = set()
+        for i, next_i in zip(link_indices, link_indices[1:] + [len(tokens)]):
+            beatmap = BeatmapParser.parse_beatmap_link(tokens[i], " ".join(tokens[i:next_i]))
+            if (beatmap.type, beatmap.id) in seen:
+                continue
+            seen.add((beatmap.type, beatmap.id))
+            beatmaps.append(beatmap)
+            if len(beatmaps) == limit:
+                break
+        return beatmaps
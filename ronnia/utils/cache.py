@@ -0,0 +1,72 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+class AsyncLRUCache:
+    """
+    Bounded in-memory cache for async lookups.
+    Concurrent lookups of the same key share a single call to the loader.
+    """
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._items: OrderedDict[Hashable, Any] = OrderedDict()
+        # Unix time each item was loaded at
+        self._inserted_at: dict[Hashable, float] = {}
+        self._pending: dict[Hashable, asyncio.Task] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def items(self) -> list[tuple[Hashable, Any]]:
+        """Cached items, from the least to the most recently used."""
+        return list(self._items.items())
+
+    def get_inserted_at(self, key: Hashable) -> Optional[float]:
+        return self._inserted_at.get(key)
+
+    def set(self, key: Hashable, value: Any, inserted_at: Optional[float] = None):
+        """
+        Caches the value as the most recently used item.
+        :param inserted_at: Unix time the value was loaded at, now by default
+        """
+        self._items[key] = value
+        self._items.move_to_end(key)
+        self._inserted_at[key] = time.time() if inserted_at is None else inserted_at
+        while len(self._items) > self.max_size:
+            evicted, _ = self._items.popitem(last=False)
+            del self._inserted_at[evicted]
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Get the value from the cache, or load it with the loader if it is missing.
+        The load runs in its own task, so a cancelled caller doesn't cancel it for the others waiting on it.
+        :param key: Cache key
+        :param loader: Coroutine function that loads the value
+        :return: Cached or loaded value
+        """
+        if key in self._items:
+            return self.get(key)
+
+        if key not in self._pending:
+            self._pending[key] = asyncio.create_task(self._load(key, loader))
+        return await asyncio.shield(self._pending[key])
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await loader()
+            self.set(key, value)
+            return value
+        finally:
+            self._pending.pop(key, None)
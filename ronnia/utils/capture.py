@@ -0,0 +1,130 @@
+"""
+Capture of the chat messages the bot receives, to replay real traffic shapes with benchmarks/replay.py.
+
+Each message is a JSON line: {"t": arrival time, "c": channel, "u": author, "tags": tags, "x": content}.
+Only the tags the request checks look at are kept. The file is rotated like logging's RotatingFileHandler,
+capture.jsonl is the newest and capture.jsonl.<n> are older.
+Redacted captures pseudonymize chatters and channel ids with a keyed hash. The key is random for every capture and
+never written, so the pseudonyms can't be reversed by hashing known names or linked across captures.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import secrets
+import time
+from typing import Iterator, Optional
+
+from ronnia.utils.beatmap import BeatmapParser
+
+logger = logging.getLogger(__name__)
+
+# Capture is off unless a path is set
+CHAT_CAPTURE_PATH = os.getenv("CHAT_CAPTURE_PATH", "")
+CHAT_CAPTURE_MAX_BYTES = int(os.getenv("CHAT_CAPTURE_MAX_BYTES", 64 * 1024 * 1024))
+CHAT_CAPTURE_BACKUPS = int(os.getenv("CHAT_CAPTURE_BACKUPS", 5))
+# Replaces the chatters with pseudonyms and blanks out everything in the messages except beatmap links and mods
+CHAT_CAPTURE_REDACT = os.getenv("CHAT_CAPTURE_REDACT", "1") == "1"
+
+CAPTURED_TAGS = ("badges", "mod", "subscriber", "vip", "custom-reward-id", "room-id", "user-id")
+MODS_TOKEN = re.compile(r"(?i)^[-+~|]?(?:EZ|HD|HR|DT|HT|NC|FL|SO|PF|SD)+[~|]?$")
+BUFFER_SIZE = 256 * 1024
+
+
+def get_pseudonym_id(value: str, key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), key=key, digest_size=8).digest()) % 10 ** 10
+
+
+def get_pseudonym(name: str, key: bytes) -> str:
+    return f"user_{get_pseudonym_id(name, key)}"
+
+
+def redact_content(content: str) -> str:
+    """Keeps the beatmap links and mods of the message, other words are replaced with x's of the same length."""
+    return " ".join(
+        token if BeatmapParser.parse_beatmap_link(token, content) or MODS_TOKEN.match(token) else "x" * len(token)
+        for token in content.split(" ")
+    )
+
+
+def create_record(channel: str, author: str, tags: dict, content: str, arrived_at: float,
+                  redact_key: Optional[bytes] = None) -> dict:
+    """
+    Creates the capture record of a message.
+    :param redact_key: Secret to pseudonymize the chatter and ids with, the message is kept as-is without it
+    """
+    tags = {tag: tags[tag] for tag in CAPTURED_TAGS if tag in tags}
+    if redact_key is not None:
+        author = get_pseudonym(author, redact_key)
+        for tag in ("user-id", "room-id"):
+            if tag in tags:
+                tags[tag] = str(get_pseudonym_id(tags[tag], redact_key))
+        content = redact_content(content)
+    return {"t": round(arrived_at, 3), "c": channel, "u": author, "tags": tags, "x": content}
+
+
+class ChatCapture:
+    """Appends messages to a rotating JSON lines file, writes are buffered and flushed on rotation and close."""
+
+    def __init__(self, path: str, max_bytes: int = CHAT_CAPTURE_MAX_BYTES, backups: int = CHAT_CAPTURE_BACKUPS,
+                 redact: bool = CHAT_CAPTURE_REDACT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.redact = redact
+        # Only kept in memory, see the module docstring
+        self._redact_key = secrets.token_bytes(hashlib.blake2b.MAX_KEY_SIZE) if redact else None
+        self.records = 0
+        self._file = open(path, "a", encoding="utf-8", buffering=BUFFER_SIZE)
+
+    def record(self, channel: str, author: str, tags: dict, content: str, arrived_at: Optional[float] = None):
+        arrived_at = time.time() if arrived_at is None else arrived_at
+        record = create_record(channel, author, tags, content, arrived_at, redact_key=self._redact_key)
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self.records += 1
+        if self._file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8", buffering=BUFFER_SIZE)
+        logger.info(f"Rotated chat capture {self.path}")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def metrics(self) -> dict:
+        return {"records": self.records}
+
+
+def get_capture_files(path: str) -> list[str]:
+    """Files of the capture from the oldest to the newest."""
+    backups = []
+    i = 1
+    while os.path.exists(f"{path}.{i}"):
+        backups.append(f"{path}.{i}")
+        i += 1
+    return list(reversed(backups)) + ([path] if os.path.exists(path) else [])
+
+
+def read_capture(path: str) -> Iterator[dict]:
+    """Reads the records of the capture and its rotated files in arrival order, skipping malformed lines."""
+    for file_path in get_capture_files(path):
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be cut if the bot was killed
+                    continue
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+RATE_WINDOW_SECONDS = 60
+
+
+class DigestBuffer:
+    """
+    Buffers the items of busy keys for a window and flushes them together.
+    A key is busy once it had rate_per_minute items in the last minute. The first buffered item of a key
+    opens its window, and every item added before the window closes is flushed with it in one call.
+    Items of quiet keys are not buffered, so they are delivered without delay.
+    """
+
+    def __init__(self, flush: Callable[[Hashable, list[Any]], Awaitable[Any]], rate_per_minute: float = 6,
+                 window_seconds: float = 30, max_items: int = 200):
+        assert rate_per_minute >= 1, "Digest rate must be at least one item per minute."
+        self.flush = flush
+        self.rate_per_minute = int(rate_per_minute)
+        self.window_seconds = window_seconds
+        self.max_items = max_items
+
+        # Arrival times of the latest rate_per_minute items of each key
+        self._arrivals: dict[Hashable, deque[float]] = {}
+        self._pending: dict[Hashable, tuple[float, list[Any]]] = {}
+
+        self.buffered = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    def __len__(self) -> int:
+        return sum(len(items) for _, items in self._pending.values())
+
+    def is_busy(self, key: Hashable, now: Optional[float] = None, count: int = 1) -> bool:
+        """
+        Counts the arriving items of the key and checks if the key is above the digest rate.
+        :param count: Number of items that arrived together
+        :return: Whether the items should be buffered instead of delivered now
+        """
+        now = time.monotonic() if now is None else now
+        arrivals = self._arrivals.setdefault(key, deque(maxlen=self.rate_per_minute))
+        arrivals.extend([now] * count)
+        if key in self._pending:
+            return True
+        return len(arrivals) == self.rate_per_minute and now - arrivals[0] < RATE_WINDOW_SECONDS
+
+    def add(self, key: Hashable, item: Any, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        deadline, items = self._pending.setdefault(key, (now + self.window_seconds, []))
+        if len(items) >= self.max_items:
+            self.dropped += 1
+            return
+        items.append(item)
+        self.buffered += 1
+
+    async def flush_due(self, now: Optional[float] = None):
+        """Flushes the keys whose window closed, and forgets the keys that were quiet for a minute."""
+        now = time.monotonic() if now is None else now
+        due = [key for key, (deadline, _) in self._pending.items() if deadline <= now]
+        for key in due:
+            _, items = self._pending.pop(key)
+            self.flushes += 1
+            try:
+                await self.flush(key, items)
+            except Exception as e:
+                logger.exception(f"Could not flush the digest of {key} with {len(items)} items", exc_info=e)
+
+        for key in [key for key, arrivals in self._arrivals.items() if now - arrivals[-1] >= RATE_WINDOW_SECONDS]:
+            del self._arrivals[key]
+
+    async def run(self, interval: float = 1.0):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush_due()
+
+    def metrics(self) -> dict:
+        return {"buffered": self.buffered, "dropped": self.dropped, "flushes": self.flushes, "pending": len(self),
+                "tracked_keys": len(self._arrivals)}
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from ronnia.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_INTERVAL_SECONDS = float(os.getenv("LOOP_MONITOR_INTERVAL_SECONDS", 0.5))
+# The stack of the event loop thread is captured when the loop doesn't run for this long
+LOOP_STALL_MS = float(os.getenv("LOOP_STALL_MS", 250))
+# Enables asyncio debug mode to report every callback slower than this, 0 disables it because of its overhead
+LOOP_SLOW_CALLBACK_MS = float(os.getenv("LOOP_SLOW_CALLBACK_MS", 0))
+MAX_OFFENDERS = 20
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_offender(stack: traceback.StackSummary) -> str:
+    """The innermost frame of the bot's own code in the stack, or the innermost frame if there is none."""
+    for frame in reversed(stack):
+        if frame.filename.startswith(PACKAGE_DIR):
+            return f"{os.path.relpath(frame.filename, PACKAGE_DIR)}:{frame.lineno} in {frame.name}"
+    frame = stack[-1]
+    return f"{frame.filename}:{frame.lineno} in {frame.name}"
+
+
+class SlowCallbackHandler(logging.Handler):
+    """Records the slow callbacks reported by asyncio debug mode as offenders."""
+
+    def __init__(self, monitor: "EventLoopMonitor"):
+        super().__init__(level=logging.WARNING)
+        self.monitor = monitor
+
+    def emit(self, record: logging.LogRecord):
+        if record.msg.startswith("Executing") and len(record.args or ()) == 2:
+            handle, seconds = record.args
+            self.monitor.record_offender(str(handle), seconds * 1000)
+
+
+class EventLoopMonitor:
+    """
+    Measures how late the event loop wakes up from a sleep of interval seconds, which is the time every callback
+    waits to be scheduled. A watchdog thread captures the stack of the event loop thread when the loop stalls
+    for more than stall_ms, so the code blocking the loop can be found from the logs.
+    """
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL_SECONDS, stall_ms: float = LOOP_STALL_MS,
+                 slow_callback_ms: float = LOOP_SLOW_CALLBACK_MS):
+        self.interval = interval
+        self.stall_ms = stall_ms
+        self.slow_callback_ms = slow_callback_ms
+
+        self.lag_ms = Histogram()
+        self.current_lag_ms = 0.0
+        self.stalls = 0
+        # offender -> [count, worst duration in ms]
+        self.offenders: dict[str, list] = {}
+        self._offenders_lock = threading.Lock()
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._beat = 0
+        self._captured_beat = -1
+        self._stall_offender: Optional[str] = None
+        self._stopped = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+        self._slow_callback_handler: Optional[SlowCallbackHandler] = None
+
+    def record_offender(self, offender: str, duration_ms: float):
+        with self._offenders_lock:
+            if offender not in self.offenders:
+                if len(self.offenders) >= MAX_OFFENDERS:
+                    # Keep the worst offenders
+                    mildest = min(self.offenders, key=lambda key: self.offenders[key][1])
+                    if self.offenders[mildest][1] >= duration_ms:
+                        return
+                    del self.offenders[mildest]
+                self.offenders[offender] = [0, 0.0]
+            self.offenders[offender][0] += 1
+            self.offenders[offender][1] = max(self.offenders[offender][1], duration_ms)
+
+    def _capture_stall(self, stalled_ms: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        self._stall_offender = get_offender(stack)
+        logger.warning("Event loop stalled",
+                       extra={"stalled_ms": stalled_ms, "offender": self._stall_offender,
+                              "stack": traceback.format_list(stack)})
+
+    def _watch(self):
+        while not self._stopped.wait(self.stall_ms / 4000):
+            stalled_ms = (time.monotonic() - self._last_beat - self.interval) * 1000
+            if stalled_ms >= self.stall_ms and self._captured_beat != self._beat:
+                # One capture per stall, the stack is taken while the loop is still blocked
+                self._captured_beat = self._beat
+                self._capture_stall(stalled_ms)
+
+    def _on_beat(self, lag_ms: float):
+        self.current_lag_ms = lag_ms
+        self.lag_ms.observe(lag_ms)
+        if lag_ms >= self.stall_ms:
+            self.stalls += 1
+            offender = self._stall_offender or "unknown"
+            self.record_offender(offender, lag_ms)
+            logger.warning("Event loop lag spike", extra={"lag_ms": lag_ms, "offender": offender})
+        self._stall_offender = None
+        self._last_beat = time.monotonic()
+        self._beat += 1
+
+    def start(self) -> asyncio.Task:
+        """Starts monitoring the running event loop, returns the task measuring the lag."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        if self.slow_callback_ms > 0:
+            self._loop.slow_callback_duration = self.slow_callback_ms / 1000
+            self._loop.set_debug(True)
+            self._slow_callback_handler = SlowCallbackHandler(self)
+            logging.getLogger("asyncio").addHandler(self._slow_callback_handler)
+
+        self._stopped.clear()
+        self._last_beat = time.monotonic()
+        self._watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+        self._watchdog.start()
+        return self._loop.create_task(self.run())
+
+    async def run(self):
+        try:
+            while True:
+                started = time.monotonic()
+                await asyncio.sleep(self.interval)
+                self._on_beat((time.monotonic() - started - self.interval) * 1000)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stopped.set()
+        if self._slow_callback_handler is not None:
+            logging.getLogger("asyncio").removeHandler(self._slow_callback_handler)
+            self._slow_callback_handler = None
+
+    def metrics(self) -> dict:
+        with self._offenders_lock:
+            worst = sorted(self.offenders.items(), key=lambda item: item[1][1], reverse=True)[:5]
+        return {
+            "current_lag_ms": self.current_lag_ms,
+            "lag_ms": self.lag_ms.snapshot(),
+            "stalls": self.stalls,
+            "worst_offenders": [{"offender": offender, "count": count, "max_ms": max_ms}
+                                for offender, (count, max_ms) in worst],
+        }
@@ -0,0 +1,79 @@
+import asyncio
+import bisect
+import logging
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+METRICS_REPORT_SECONDS = 60
+
+
+class Histogram:
+    """Fixed bucket histogram, cheap enough to observe on every request."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, percentile: float) -> float:
+        """Upper bound of the bucket the percentile falls into."""
+        if self.count == 0:
+            return 0.0
+        rank = percentile / 100 * self.count
+        cumulative = 0
+        for bucket, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bucket, self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """Collects snapshots from the registered metric collectors."""
+
+    def __init__(self):
+        self._collectors: dict[str, Callable[[], dict]] = {}
+
+    def register(self, name: str, collector: Callable[[], dict]):
+        self._collectors[name] = collector
+
+    def unregister(self, name: str):
+        self._collectors.pop(name, None)
+
+    def snapshot(self) -> dict:
+        snapshot = {}
+        for name, collector in self._collectors.items():
+            try:
+                snapshot[name] = collector()
+            except Exception as e:
+                logger.exception(f"Metric collector {name} failed", exc_info=e)
+        return snapshot
+
+    async def report(self, interval: float = METRICS_REPORT_SECONDS):
+        """Logs the metrics snapshot every interval seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            logger.info("Metrics snapshot", extra={"metrics": self.snapshot()})
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,177 @@
+"""
+Statistical profiler that can be toggled in the running bot.
+
+A sampler thread records the stacks of the other threads every interval, so the profiled code pays only for the
+GIL handovers of the sampler. The samples are written as collapsed stacks, readable by flamegraph.pl and
+speedscope, or as a speedscope profile.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILER_SECONDS = float(os.getenv("PROFILER_SECONDS", 30))
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", 10))
+PROFILER_OUTPUT_DIR = os.getenv("PROFILER_OUTPUT_DIR", "profiles")
+# "speedscope" or "collapsed"
+PROFILER_FORMAT = os.getenv("PROFILER_FORMAT", "speedscope")
+
+PROFILER_FORMATS = {"speedscope": "speedscope.json", "collapsed": "folded"}
+
+
+def get_frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+def get_stack(frame: FrameType) -> tuple[str, ...]:
+    """Names of the frames of the stack, from the outermost to the innermost."""
+    stack = []
+    while frame is not None:
+        stack.append(get_frame_name(frame))
+        frame = frame.f_back
+    return tuple(reversed(stack))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every other thread every interval_ms milliseconds while it is running.
+    Samples are aggregated by stack, with the thread name as the outermost frame.
+    """
+
+    def __init__(self, interval_ms: float = PROFILER_INTERVAL_MS):
+        self.interval_ms = interval_ms
+        self.samples: Counter[tuple[str, ...]] = Counter()
+        self.started_at: Optional[float] = None
+        self.duration = 0.0
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def sample(self):
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != own_id:
+                self.samples[(thread_names.get(thread_id, str(thread_id)),) + get_stack(frame)] += 1
+
+    def _run(self):
+        interval = self.interval_ms / 1000
+        while not self._stopped.wait(interval):
+            self.sample()
+
+    def start(self):
+        assert not self.is_running, "Profiler is already running."
+        self.samples.clear()
+        self._stopped.clear()
+        self.started_at = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.started_at is not None:
+            self.duration = time.monotonic() - self.started_at
+
+    def to_collapsed(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.samples.most_common())
+
+    def to_speedscope(self, name: str = "ronnia") -> dict:
+        """Speedscope profile with one sampled profile per thread, weighted in milliseconds."""
+        frame_indexes: dict[str, int] = {}
+        profiles: dict[str, dict] = {}
+        for stack, count in self.samples.most_common():
+            thread_name, frames = stack[0], stack[1:]
+            profile = profiles.setdefault(thread_name, {
+                "type": "sampled", "name": thread_name, "unit": "milliseconds",
+                "startValue": 0, "endValue": 0, "samples": [], "weights": [],
+            })
+            profile["samples"].append([frame_indexes.setdefault(frame, len(frame_indexes)) for frame in frames])
+            profile["weights"].append(count * self.interval_ms)
+            profile["endValue"] += count * self.interval_ms
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "ronnia",
+            "shared": {"frames": [{"name": frame} for frame in frame_indexes]},
+            "profiles": list(profiles.values()),
+        }
+
+    def write(self, path: str, profile_format: str = PROFILER_FORMAT):
+        assert profile_format in PROFILER_FORMATS, f"Unknown profile format {profile_format}."
+        with open(path, "w") as f:
+            if profile_format == "speedscope":
+                json.dump(self.to_speedscope(name=os.path.basename(path)), f)
+            else:
+                f.write(self.to_collapsed())
+
+
+class ProfilerToggle:
+    """
+    Runs the SamplingProfiler for seconds on toggle, and writes the profile to output_dir when it finishes.
+    Toggling while the profiler runs stops it early.
+    """
+
+    def __init__(self, seconds: float = PROFILER_SECONDS, output_dir: str = PROFILER_OUTPUT_DIR,
+                 profile_format: str = PROFILER_FORMAT, interval_ms: float = PROFILER_INTERVAL_MS):
+        assert profile_format in PROFILER_FORMATS, f"Unknown profile format {profile_format}."
+        self.seconds = seconds
+        self.output_dir = output_dir
+        self.profile_format = profile_format
+        self.profiler = SamplingProfiler(interval_ms=interval_ms)
+        self.task: Optional[asyncio.Task] = None
+        self._stop_early = asyncio.Event()
+
+    def toggle(self):
+        if self.task is not None and not self.task.done():
+            self._stop_early.set()
+            return
+        self._stop_early.clear()
+        self.task = asyncio.create_task(self.profile())
+
+    async def profile(self) -> str:
+        """Profiles for seconds or until toggled again, then writes the profile. :return: Path of the profile"""
+        logger.info(f"Started profiling for {self.seconds}s")
+        self.profiler.start()
+        try:
+            await asyncio.wait_for(self._stop_early.wait(), timeout=self.seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.profiler.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir,
+                            f"profile-{time.strftime('%Y%m%d-%H%M%S')}.{PROFILER_FORMATS[self.profile_format]}")
+        await asyncio.to_thread(self.profiler.write, path, self.profile_format)
+        logger.info(f"Wrote profile of {self.profiler.duration:.1f}s to {path}",
+                    extra={"samples": self.profiler.samples.total()})
+        return path
+
+    def install_signal_handler(self, signum: int = getattr(signal, "SIGUSR1", 0)) -> bool:
+        """
+        Toggles the profiler on signum, e.g. `kill -USR1 <pid>`.
+        :return: False if the platform doesn't support signal handlers in the event loop
+        """
+        try:
+            asyncio.get_running_loop().add_signal_handler(signum, self.toggle)
+        except (NotImplementedError, RuntimeError, ValueError):
+            logger.info("Profiler signal handler is not supported on this platform")
+            return False
+        return True
@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+from typing import Optional
+
+# Upper bound of the Sentry trace sample rate
+SENTRY_TRACES_SAMPLE_RATE = float(os.getenv("SENTRY_TRACES_SAMPLE_RATE", 1.0))
+# Sampled traces are adapted to about this many per minute, 0 samples at SENTRY_TRACES_SAMPLE_RATE
+SENTRY_TRACES_PER_MINUTE = float(os.getenv("SENTRY_TRACES_PER_MINUTE", 60))
+# Share of the sampled traces that are also profiled
+SENTRY_PROFILES_SAMPLE_RATE = float(os.getenv("SENTRY_PROFILES_SAMPLE_RATE", 0.1))
+
+
+class AdaptiveSampler:
+    """
+    Sentry traces_sampler that keeps the sampled transactions around target_per_minute.
+    The rate of each window is the target divided by the number of transactions seen in the previous window,
+    so quiet periods are sampled fully and bursts don't multiply the cost of tracing.
+    """
+
+    def __init__(self, target_per_minute: float = SENTRY_TRACES_PER_MINUTE,
+                 max_rate: float = SENTRY_TRACES_SAMPLE_RATE, min_rate: float = 0.001, window_seconds: float = 60):
+        self.target_per_minute = target_per_minute
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.window_seconds = window_seconds
+
+        self.rate = max_rate
+        self._window_started = time.monotonic()
+        self._seen = 0
+        # Sentry samples transactions in whichever thread starts them
+        self._lock = threading.Lock()
+
+    def _update_rate(self, now: float):
+        elapsed = now - self._window_started
+        if elapsed < self.window_seconds:
+            return
+        per_minute = self._seen / elapsed * 60
+        if per_minute == 0:
+            self.rate = self.max_rate
+        else:
+            self.rate = max(self.min_rate, min(self.max_rate, self.target_per_minute / per_minute))
+        self._window_started = now
+        self._seen = 0
+
+    def __call__(self, sampling_context: dict, now: Optional[float] = None) -> float:
+        # Keep the decision of the parent, so distributed traces are not cut in half
+        parent_sampled = sampling_context.get("parent_sampled")
+        if parent_sampled is not None:
+            return float(parent_sampled)
+        if self.target_per_minute <= 0:
+            return self.max_rate
+
+        with self._lock:
+            self._update_rate(time.monotonic() if now is None else now)
+            self._seen += 1
+            return self.rate
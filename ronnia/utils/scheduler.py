@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from ronnia.utils.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+def parse_weights(weights: Optional[str]) -> dict[str, float]:
+    """
+    Parses per-key weights in the form of "key:weight,key:weight".
+    :param weights: Weights string, None or empty for no weights
+    :return: Dictionary of key to weight
+    """
+    parsed = {}
+    for entry in filter(None, (weights or "").split(",")):
+        key, _, weight = entry.partition(":")
+        parsed[key.strip()] = float(weight)
+    return parsed
+
+
+class FairScheduler:
+    """
+    Processes submitted items with a fixed number of workers, scheduling between keys with deficit round-robin.
+    Each key has its own queue, and in every round a key gets to process quantum * weight items,
+    so a burst from one key can't delay the items of the other keys for more than one round.
+    """
+
+    def __init__(self, handler: Callable[[Any], Awaitable[Any]], workers: int = 8, quantum: float = 1.0,
+                 max_queue_size: int = 100, weights: Optional[dict[Hashable, float]] = None):
+        self.handler = handler
+        self.workers = workers
+        self.quantum = quantum
+        self.max_queue_size = max_queue_size
+        self.weights = {} if weights is None else weights
+        assert all(weight > 0 for weight in self.weights.values()), "Scheduler weights must be positive."
+
+        self._queues: dict[Hashable, deque[tuple[float, Any]]] = {}
+        self._deficits: dict[Hashable, float] = {}
+        self._active: deque[Hashable] = deque()
+        self._pending = asyncio.Semaphore(0)
+
+        self.wait_ms = Histogram()
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, key: Hashable, item: Any) -> bool:
+        """
+        Queues the item for processing under the key.
+        :return: False if the queue of the key is full and the item is dropped
+        """
+        if key not in self._queues:
+            self._queues[key] = deque()
+            self._deficits[key] = 0.0
+            self._active.append(key)
+
+        queue = self._queues[key]
+        if len(queue) >= self.max_queue_size:
+            self.dropped += 1
+            logger.debug(f"Dropping item of {key}, its queue is full")
+            return False
+
+        queue.append((time.monotonic(), item))
+        self._pending.release()
+        return True
+
+    def _next(self) -> tuple[Hashable, float, Any]:
+        """Pops the next item in deficit round-robin order, there must be at least one queued item."""
+        while True:
+            key = self._active[0]
+            if self._deficits[key] < 1:
+                self._deficits[key] += self.quantum * self.weights.get(key, 1.0)
+                if self._deficits[key] < 1:
+                    # Keys with a weight below 1 save up their deficit over several rounds
+                    self._active.rotate(-1)
+                    continue
+
+            queue = self._queues[key]
+            submitted_at, item = queue.popleft()
+            self._deficits[key] -= 1
+            if not queue:
+                self._active.popleft()
+                del self._queues[key]
+                del self._deficits[key]
+            elif self._deficits[key] < 1:
+                self._active.rotate(-1)
+            return key, submitted_at, item
+
+    async def _worker(self):
+        while True:
+            await self._pending.acquire()
+            key, submitted_at, item = self._next()
+            self.wait_ms.observe((time.monotonic() - submitted_at) * 1000)
+            try:
+                await self.handler(item)
+            except Exception as e:
+                logger.exception(f"Could not process item of {key}", exc_info=e)
+
+    async def run(self):
+        """Runs the workers until cancelled."""
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(self.workers):
+                tg.create_task(self._worker())
+
+    def metrics(self) -> dict:
+        return {"queued": len(self), "active_keys": len(self._active), "dropped": self.dropped,
+                "wait_ms": self.wait_ms.snapshot()}
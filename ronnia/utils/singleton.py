@@ -1,8 +1,10 @@
 class SingletonMeta(type):
+    """One instance per class and constructor arguments."""
     _instances = {}
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
+        key = (cls, args, tuple(sorted(kwargs.items())))
+        if key not in cls._instances:
             instance = super().__call__(*args, **kwargs)
-            cls._instances[cls] = instance
-        return cls._instances[cls]
+            cls._instances[key] = instance
+        return cls._instances[key]
@@ -0,0 +1,139 @@
+import hashlib
+import heapq
+import math
+import struct
+from typing import Union
+
+Item = Union[int, str]
+
+
+def hash64(item: Item) -> int:
+    """Stable 64-bit hash, the same in every process (unlike hash())."""
+    return int.from_bytes(hashlib.blake2b(str(item).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    Cardinality estimator using 2^precision one byte registers.
+    The standard error is about 1.04 / sqrt(2^precision), 1.6% for the default precision.
+    """
+
+    def __init__(self, precision: int = 12):
+        assert 4 <= precision <= 16, "HyperLogLog precision must be between 4 and 16."
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item: Item):
+        hashed = hash64(item)
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        assert self.precision == other.precision, "Can't merge HyperLogLogs with different precisions."
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        register_count = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / register_count)
+        estimate = alpha * register_count ** 2 / sum(2.0 ** -register for register in self.registers)
+        zero_registers = self.registers.count(0)
+        if estimate <= 2.5 * register_count and zero_registers:
+            # Linear counting is more accurate for small cardinalities
+            estimate = register_count * math.log(register_count / zero_registers)
+        return round(estimate)
+
+    def to_bytes(self) -> bytes:
+        return bytes([self.precision]) + bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HyperLogLog":
+        hll = cls(precision=data[0])
+        hll.registers = bytearray(data[1:])
+        return hll
+
+
+class SpaceSaving:
+    """
+    Heavy hitters summary keeping at most capacity integer items.
+    Counts are overestimated by at most the error of the item, and every item
+    more frequent than total / capacity is guaranteed to be kept.
+    """
+    _entry = struct.Struct(">qQQ")
+
+    def __init__(self, capacity: int = 200):
+        self.capacity = capacity
+        # item -> [count, error]
+        self.counters: dict[int, list[int]] = {}
+        # (count, item) of every counted item, hits don't update it, so a count may be lower than the real one
+        self._heap: list[tuple[int, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.counters)
+
+    def add(self, item: int, count: int = 1):
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+            return
+
+        if len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+            heapq.heappush(self._heap, (count, item))
+        else:
+            min_count, min_item = self._peek_min()
+            del self.counters[min_item]
+            self.counters[item] = [min_count + count, min_count]
+            heapq.heapreplace(self._heap, (min_count + count, item))
+
+    def _peek_min(self) -> tuple[int, int]:
+        """
+        The least counted item, updating the outdated counts on top of the heap first.
+        Every hit outdates at most one heap entry, so this is amortized O(log capacity).
+        """
+        count, item = self._heap[0]
+        while count != self.counters[item][0]:
+            heapq.heapreplace(self._heap, (self.counters[item][0], item))
+            count, item = self._heap[0]
+        return count, item
+
+    def _rebuild_heap(self):
+        self._heap = [(count, item) for item, (count, _) in self.counters.items()]
+        heapq.heapify(self._heap)
+
+    def _min_count(self) -> int:
+        if len(self.counters) < self.capacity:
+            return 0
+        return self._peek_min()[0]
+
+    def merge(self, other: "SpaceSaving"):
+        """Merges the other summary, items missing from a full summary get its minimum count as error."""
+        self_min, other_min = self._min_count(), other._min_count()
+        merged = {}
+        for item in self.counters.keys() | other.counters.keys():
+            self_count, self_error = self.counters.get(item, (self_min, self_min))
+            other_count, other_error = other.counters.get(item, (other_min, other_min))
+            merged[item] = [self_count + other_count, self_error + other_error]
+        top_items = sorted(merged, key=lambda key: merged[key][0], reverse=True)[:self.capacity]
+        self.counters = {item: merged[item] for item in top_items}
+        self._rebuild_heap()
+
+    def top(self, k: int) -> list[tuple[int, int]]:
+        """The k most frequent items with their estimated counts."""
+        items = sorted(self.counters.items(), key=lambda entry: entry[1][0], reverse=True)[:k]
+        return [(item, count) for item, (count, _) in items]
+
+    def to_bytes(self) -> bytes:
+        return struct.pack(">I", self.capacity) + b"".join(
+            self._entry.pack(item, count, error) for item, (count, error) in self.counters.items()
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "SpaceSaving":
+        summary = cls(capacity=struct.unpack_from(">I", data)[0])
+        for item, count, error in cls._entry.iter_unpack(data[4:]):
+            summary.counters[item] = [count, error]
+        summary._rebuild_heap()
+        return summary
@@ -0,0 +1,121 @@
+"""
+Length-prefixed binary snapshots of in-memory state, used to warm start the bot after a restart.
+
+A snapshot is a header followed by named sections, each a list of (key, timestamp, value) entries:
+    header:  magic (6s) | version (B) | created_at (d)
+    section: name length (H) | name | entry count (I) | entries
+    entry:   key length (H) | key | timestamp (d) | value length (I) | value
+"""
+import logging
+import os
+import struct
+import time
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"RNSNAP"
+SNAPSHOT_VERSION = 1
+
+_header = struct.Struct(">6sBd")
+_name_length = struct.Struct(">H")
+_entry_count = struct.Struct(">I")
+_timestamp = struct.Struct(">d")
+_value_length = struct.Struct(">I")
+
+
+class SnapshotEntry(NamedTuple):
+    key: str
+    timestamp: float
+    value: bytes = b""
+
+
+class SnapshotFormatError(Exception):
+    pass
+
+
+def encode_snapshot(sections: dict[str, list[SnapshotEntry]], created_at: Optional[float] = None) -> bytes:
+    created_at = time.time() if created_at is None else created_at
+    data = bytearray(_header.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, created_at))
+    for name, entries in sections.items():
+        encoded_name = name.encode()
+        data += _name_length.pack(len(encoded_name)) + encoded_name + _entry_count.pack(len(entries))
+        for entry in entries:
+            encoded_key = entry.key.encode()
+            data += _name_length.pack(len(encoded_key)) + encoded_key
+            data += _timestamp.pack(entry.timestamp)
+            data += _value_length.pack(len(entry.value)) + entry.value
+    return bytes(data)
+
+
+def decode_snapshot(data: bytes) -> tuple[float, dict[str, list[SnapshotEntry]]]:
+    """
+    Decodes a snapshot.
+    :param data: Encoded snapshot
+    :return: Creation time of the snapshot and its sections
+    """
+    try:
+        magic, version, created_at = _header.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise SnapshotFormatError(f"Unsupported snapshot format {magic!r} version {version}")
+
+        view = memoryview(data)
+        offset = _header.size
+        sections = {}
+        while offset < len(data):
+            name, offset = _read_string(view, offset)
+            (entry_count,), offset = _entry_count.unpack_from(view, offset), offset + _entry_count.size
+            entries = []
+            for _ in range(entry_count):
+                key, offset = _read_string(view, offset)
+                (timestamp,), offset = _timestamp.unpack_from(view, offset), offset + _timestamp.size
+                (value_length,), offset = _value_length.unpack_from(view, offset), offset + _value_length.size
+                if offset + value_length > len(data):
+                    raise SnapshotFormatError("Snapshot is truncated")
+                entries.append(SnapshotEntry(key, timestamp, bytes(view[offset: offset + value_length])))
+                offset += value_length
+            sections[name] = entries
+        return created_at, sections
+    except (struct.error, UnicodeDecodeError) as e:
+        raise SnapshotFormatError("Snapshot is corrupted") from e
+
+
+def _read_string(view: memoryview, offset: int) -> tuple[str, int]:
+    (length,) = _name_length.unpack_from(view, offset)
+    offset += _name_length.size
+    if offset + length > len(view):
+        raise SnapshotFormatError("Snapshot is truncated")
+    return bytes(view[offset: offset + length]).decode(), offset + length
+
+
+def write_snapshot(path: str, sections: dict[str, list[SnapshotEntry]]):
+    """Writes the snapshot atomically, readers see either the old or the new snapshot."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(encode_snapshot(sections))
+    os.replace(temp_path, path)
+
+
+def read_snapshot(path: str, max_age_seconds: float, now: Optional[float] = None) -> dict[str, list[SnapshotEntry]]:
+    """
+    Reads the snapshot, dropping the entries older than max_age_seconds.
+    :return: Sections of the snapshot, empty if it is missing, unreadable or too old
+    """
+    now = time.time() if now is None else now
+    try:
+        with open(path, "rb") as f:
+            created_at, sections = decode_snapshot(f.read())
+    except FileNotFoundError:
+        return {}
+    except (OSError, SnapshotFormatError) as e:
+        logger.warning(f"Could not read snapshot {path}, starting cold", exc_info=e)
+        return {}
+
+    if now - created_at > max_age_seconds:
+        logger.info(f"Snapshot {path} is {now - created_at:.0f}s old, starting cold")
+        return {}
+
+    return {
+        name: [entry for entry in entries if now - entry.timestamp <= max_age_seconds]
+        for name, entries in sections.items()
+    }
@@ -0,0 +1,93 @@
+"""
+Runs several cluster nodes against a local mongod and checks that the partitions and the leadership are
+split between them, and taken over when a node dies.
+Set MONGODB_TEST_URL (e.g. mongodb://localhost:27017) to run these tests.
+"""
+import asyncio
+import os
+import unittest
+
+from ronnia.clients.cluster import LEADER_LEASE_ID, ClusterCoordinator
+from ronnia.clients.mongo import RonniaDatabase
+
+MONGODB_TEST_URL = os.getenv("MONGODB_TEST_URL")
+TEST_DATABASE_NAME = "RonniaClusterTest"
+PARTITIONS = 12
+
+
+@unittest.skipUnless(MONGODB_TEST_URL, "MONGODB_TEST_URL is not set")
+class TestClusterCoordinator(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        # Every node has its own client, like separate bot processes
+        self.db_clients = [RonniaDatabase(MONGODB_TEST_URL, database_name=TEST_DATABASE_NAME) for _ in range(3)]
+        await self.db_clients[0].drop_database(TEST_DATABASE_NAME)
+        self.nodes = [
+            ClusterCoordinator(db_client.cluster_leases_col, db_client.cluster_nodes_col, partitions=PARTITIONS,
+                               node_id=f"node-{i}", lease_seconds=2, heartbeat_seconds=0.5)
+            for i, db_client in enumerate(self.db_clients)
+        ]
+
+    async def asyncTearDown(self) -> None:
+        await self.db_clients[0].drop_database(TEST_DATABASE_NAME)
+        for db_client in self.db_clients:
+            await db_client.close()
+
+    async def heartbeat(self, nodes: list[ClusterCoordinator], rounds: int = PARTITIONS):
+        for _ in range(rounds):
+            for node in nodes:
+                await node.heartbeat()
+
+    def assert_partitions_split(self, nodes: list[ClusterCoordinator]):
+        owned = [node.owned_partitions for node in nodes]
+        self.assertEqual(set(range(PARTITIONS)), set().union(*owned))
+        self.assertEqual(PARTITIONS, sum(len(partitions) for partitions in owned))
+        self.assertEqual(1, sum(node.is_leader for node in nodes))
+
+    async def test_partitions_are_split_between_nodes(self):
+        await self.heartbeat(self.nodes)
+
+        self.assert_partitions_split(self.nodes)
+        self.assertEqual([4, 4, 4], [len(node.owned_partitions) for node in self.nodes])
+
+    async def test_new_node_gets_a_fair_share(self):
+        await self.heartbeat(self.nodes[:1])
+        self.assertEqual(PARTITIONS, len(self.nodes[0].owned_partitions))
+
+        await self.heartbeat(self.nodes[:2])
+
+        self.assert_partitions_split(self.nodes[:2])
+        self.assertEqual([6, 6], [len(node.owned_partitions) for node in self.nodes[:2]])
+
+    async def test_partitions_of_dead_node_are_taken_over(self):
+        await self.heartbeat(self.nodes)
+        dead_node = next(node for node in self.nodes if node.is_leader)
+        alive_nodes = [node for node in self.nodes if node is not dead_node]
+
+        # The dead node stops heartbeating, its leases expire after lease_seconds
+        await asyncio.sleep(2.5)
+        await self.heartbeat(alive_nodes)
+
+        self.assert_partitions_split(alive_nodes)
+        self.assertFalse(dead_node._is_valid())
+        self.assertFalse(any(dead_node.owns(f"channel_{i}") for i in range(100)))
+
+    async def test_release_all_hands_over_immediately(self):
+        await self.heartbeat(self.nodes)
+        leaving_node = self.nodes[0]
+
+        await leaving_node.release_all()
+        await self.heartbeat(self.nodes[1:])
+
+        self.assert_partitions_split(self.nodes[1:])
+
+    async def test_only_the_leader_publishes_live_channels(self):
+        await self.heartbeat(self.nodes)
+        leader = next(node for node in self.nodes if node.is_leader)
+        follower = next(node for node in self.nodes if not node.is_leader)
+
+        self.assertTrue(await leader.publish_live_channels({"heyronii", "other"}))
+        self.assertFalse(await follower.publish_live_channels({"wrong"}))
+        self.assertEqual({"heyronii", "other"}, await follower.get_live_channels())
+        leader_lease = await self.db_clients[0].cluster_leases_col.find_one({"_id": LEADER_LEASE_ID})
+        self.assertEqual(leader.node_id, leader_lease["owner"])
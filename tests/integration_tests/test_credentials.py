@@ -0,0 +1,49 @@
+"""
+Shares OAuth tokens between brokers through a local mongod, like separate bot processes.
+Set MONGODB_TEST_URL (e.g. mongodb://localhost:27017) to run these tests.
+"""
+import asyncio
+import os
+import time
+import unittest
+
+from ronnia.clients.credentials import CredentialBroker, MongoTokenStore, Token
+from ronnia.clients.mongo import RonniaDatabase
+
+MONGODB_TEST_URL = os.getenv("MONGODB_TEST_URL")
+TEST_DATABASE_NAME = "RonniaCredentialsTest"
+
+
+@unittest.skipUnless(MONGODB_TEST_URL, "MONGODB_TEST_URL is not set")
+class TestMongoTokenStore(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.db_clients = [RonniaDatabase(MONGODB_TEST_URL, database_name=TEST_DATABASE_NAME) for _ in range(3)]
+        await self.db_clients[0].drop_database(TEST_DATABASE_NAME)
+        self.brokers = [CredentialBroker(MongoTokenStore(db_client.credentials_col), owner=f"node-{i}",
+                                         refresh_jitter_seconds=0, poll_seconds=0.01)
+                        for i, db_client in enumerate(self.db_clients)]
+        self.issued = 0
+
+    async def asyncTearDown(self) -> None:
+        await self.db_clients[0].drop_database(TEST_DATABASE_NAME)
+        for db_client in self.db_clients:
+            await db_client.close()
+
+    async def fetch(self) -> Token:
+        await asyncio.sleep(0.05)
+        self.issued += 1
+        return Token(access_token=f"token-{self.issued}", expires_at=time.time() + 3600)
+
+    async def test_nodes_refresh_once(self):
+        tokens = await asyncio.gather(*(broker.get_token("twitch:1", self.fetch) for broker in self.brokers))
+
+        self.assertEqual({"token-1"}, set(tokens))
+        self.assertEqual(1, self.issued)
+
+    async def test_lock_is_released_after_refresh(self):
+        store = self.brokers[0].store
+        await self.brokers[0].get_token("twitch:1", self.fetch)
+
+        self.assertTrue(await store.acquire_lock("twitch:1", "node-1", seconds=30))
+        self.assertFalse(await store.acquire_lock("twitch:1", "node-2", seconds=30))
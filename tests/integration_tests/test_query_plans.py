@@ -0,0 +1,88 @@
+"""
+Runs explain() for every query shape of RonniaDatabase against a local mongod and fails on collection scans.
+Set MONGODB_TEST_URL (e.g. mongodb://localhost:27017) to run these tests.
+"""
+import datetime
+import os
+import unittest
+
+from ronnia.clients.mongo import RonniaDatabase
+
+MONGODB_TEST_URL = os.getenv("MONGODB_TEST_URL")
+TEST_DATABASE_NAME = "RonniaQueryPlanTest"
+
+# (collection name, filter) of every query the bot sends
+QUERY_SHAPES = [
+    ("Users", {"twitchUsername": "heyronii"}),
+    ("Users", {"twitchId": 1}),
+    ("Users", {"settings.enable": True}),
+    ("Users", {"isLive": True, "twitchId": {"$nin": [1, 2]}}),
+    ("Settings", {"name": "echo"}),
+    ("Beatmaps", {"id": 1170505}),
+    ("Beatmaps", {"beatmapset_id": 552726, "beatmapset_default": True}),
+    ("BeatmapAttributes", {"beatmap_id": 1170505, "mods": 64}),
+    ("Statistics", {"c": 12345}),
+    ("StatisticsChannelDaily", {"channel": 12345, "day": {"$gte": datetime.datetime(2024, 1, 1)}}),
+    ("StatisticsBeatmapDaily", {"day": {"$gte": datetime.datetime(2024, 1, 1)}}),
+    ("StatisticsChannelHourly", {"hour": {"$gte": datetime.datetime(2024, 1, 1)}}),
+    ("StatisticsChannelHourly", {"channel": 12345, "hour": {"$gte": datetime.datetime(2024, 1, 1)}}),
+    ("ClusterLeases", {"owner": "node-1"}),
+    ("ClusterLeases", {"expires_at": {"$gt": datetime.datetime(2024, 1, 1)}}),
+    ("BeatmapImports", {"path": "osu_beatmaps.sql"}),
+]
+
+
+def find_stages(plan: dict) -> set[str]:
+    stages = {plan["stage"]} if "stage" in plan else set()
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages |= find_stages(plan[key])
+    for input_stage in plan.get("inputStages", []):
+        stages |= find_stages(input_stage)
+    return stages
+
+
+@unittest.skipUnless(MONGODB_TEST_URL, "MONGODB_TEST_URL is not set")
+class TestQueryPlans(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.db_client = RonniaDatabase(MONGODB_TEST_URL, database_name=TEST_DATABASE_NAME)
+        await self.db_client.drop_database(TEST_DATABASE_NAME)
+        await self.db_client.initialize()
+
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        await self.db_client.users_col.insert_many([
+            {"twitchUsername": f"user{i}", "twitchId": i, "osuId": i, "isLive": i % 2 == 0,
+             "settings": {"enable": i % 3 != 0}} for i in range(100)
+        ])
+        await self.db_client.beatmaps_col.insert_many([
+            {"id": i, "beatmapset_id": i // 5, "beatmapset_default": i % 5 == 0, "ronnia_updated_at": now} for i in range(100)
+        ])
+        await self.db_client.cluster_leases_col.insert_many([
+            {"_id": f"partition-{i}", "owner": f"node-{i % 3}", "expires_at": now} for i in range(100)
+        ])
+        await self.db_client.db.get_collection("BeatmapImports").insert_many([
+            {"path": f"dump_{i}.sql", "offset": i} for i in range(100)
+        ])
+        await self.db_client.beatmap_attributes_col.insert_many([
+            {"beatmap_id": i, "mods": 64, "ronnia_updated_at": now} for i in range(100)
+        ])
+
+        await self.db_client.statistics_col.insert_many([
+            {"b": i, "c": i % 10, "r": i, "m": 0, "t": now} for i in range(100)
+        ])
+        for i in range(100):
+            self.db_client.rollup_buffer.add(i % 10, i, now - datetime.timedelta(hours=i))
+        await self.db_client.rollup_buffer.flush()
+
+    async def asyncTearDown(self) -> None:
+        await self.db_client.drop_database(TEST_DATABASE_NAME)
+        await self.db_client.close()
+
+    async def test_no_query_uses_collection_scan(self):
+        for col_name, query in QUERY_SHAPES:
+            with self.subTest(collection=col_name, query=query):
+                explain = await self.db_client.db.get_collection(col_name).find(query).explain()
+                stages = find_stages(explain["queryPlanner"]["winningPlan"])
+
+                self.assertNotIn("COLLSCAN", stages)
@@ -176,4 +176,52 @@ class TestBeatmapLinkParser(unittest.TestCase):
 
         self.assertEqual(beatmap.id, returned_map.id)
         self.assertEqual(beatmap.mods, returned_map.mods)
-        self.assertEqual(beatmap.type, returned_map.type)
\ No newline at end of file
+        self.assertEqual(beatmap.type, returned_map.type)
+
+    def test_parse_beatmap_links_scopes_mods_to_each_link(self):
+        content = (f'pack night {self.old_beatmap_link} +HD {self.official_beatmapset_link} '
+                   f'{self.official_beatmap_link_alt_2}+DT hr')
+
+        beatmaps = BeatmapParser.parse_beatmap_links(content, limit=5)
+
+        self.assertEqual([(2778999, BeatmapType.MAP, '+HD', 8),
+                          (1341551, BeatmapType.MAPSET, '', 0),
+                          (806017, BeatmapType.MAP, '+DTHR', 64 | 16)],
+                         [(beatmap.id, beatmap.type, beatmap.mods, beatmap.mods_bitmask) for beatmap in beatmaps])
+
+    def test_parse_beatmap_links_skips_duplicates_and_caps(self):
+        content = ' '.join([self.old_beatmap_link, self.old_beatmap_link] + [f'https://osu.ppy.sh/b/{i}'
+                                                                          for i in range(10)])
+
+        beatmaps = BeatmapParser.parse_beatmap_links(content, limit=3)
+
+        self.assertEqual([2778999, 0, 1], [beatmap.id for beatmap in beatmaps])
+
+
+class TestModBitmask(unittest.TestCase):
+
+    def test_get_mod_bitmask_returns_zero_for_nomod(self):
+        self.assertEqual(0, BeatmapParser.get_mod_bitmask(""))
+
+    def test_get_mod_bitmask_combines_mods(self):
+        self.assertEqual(8 | 64, BeatmapParser.get_mod_bitmask("+HDDT"))
+
+    def test_get_difficulty_mod_bitmask_ignores_visual_mods(self):
+        self.assertEqual(0, BeatmapParser.get_difficulty_mod_bitmask("+HDSD"))
+
+    def test_get_difficulty_mod_bitmask_counts_nightcore_as_double_time(self):
+        self.assertEqual(BeatmapParser.get_difficulty_mod_bitmask("+HDDT"),
+                         BeatmapParser.get_difficulty_mod_bitmask("+NCHD"))
+
+    def test_get_difficulty_mod_bitmask_keeps_difficulty_mods(self):
+        self.assertEqual(16 | 64 | 1024, BeatmapParser.get_difficulty_mod_bitmask("+HRDTFL"))
+
+    def test_get_mod_text_is_inverse_of_get_mod_bitmask(self):
+        for mods_text in ["", "+HD", "+HDDT", "+EZHTFL", "+HRNC"]:
+            self.assertEqual(mods_text, BeatmapParser.get_mod_text(BeatmapParser.get_mod_bitmask(mods_text)))
+
+    def test_parse_beatmap_link_sets_mod_bitmask(self):
+        link = 'https://osu.ppy.sh/b/2778999'
+        beatmap = BeatmapParser.parse_beatmap_link(link, f'{link} +HDDT')
+
+        self.assertEqual(8 | 64, beatmap.mods_bitmask)
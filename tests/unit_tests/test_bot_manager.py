@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from ronnia.bots.bot_manager import BotManager, ChannelPresence
+from ronnia.clients.twitch import TwitchAPI
+from ronnia.utils.singleton import SingletonMeta
+
+
+class TestChannelPresence(unittest.TestCase):
+
+    def test_channel_is_parted_after_missed_polls(self):
+        presence = ChannelPresence(part_after_missed_polls=3)
+
+        self.assertEqual({"heyronii"}, presence.update({"heyronii"}, set(), now=0))
+        self.assertEqual({"heyronii"}, presence.update(set(), set(), now=60))
+        self.assertEqual({"heyronii"}, presence.update(set(), set(), now=120))
+        self.assertEqual(set(), presence.update(set(), set(), now=180))
+
+    def test_live_poll_resets_missed_polls(self):
+        presence = ChannelPresence(part_after_missed_polls=2)
+
+        presence.update({"heyronii"}, set(), now=0)
+        presence.update(set(), set(), now=60)
+        presence.update({"heyronii"}, set(), now=120)
+
+        self.assertEqual({"heyronii"}, presence.update(set(), set(), now=180))
+
+    def test_unknown_status_does_not_count_as_offline(self):
+        presence = ChannelPresence(part_after_missed_polls=1)
+
+        presence.update({"heyronii"}, set(), now=0)
+
+        self.assertEqual({"heyronii"}, presence.update(set(), {"heyronii"}, now=60))
+        self.assertEqual(set(), presence.update(set(), set(), now=120))
+
+    def test_unknown_channels_are_not_joined(self):
+        presence = ChannelPresence()
+
+        self.assertEqual(set(), presence.update(set(), {"heyronii"}, now=0))
+
+    def test_grace_period(self):
+        presence = ChannelPresence(part_after_missed_polls=1, grace_seconds=300)
+
+        presence.update({"heyronii"}, set(), now=0)
+
+        self.assertEqual({"heyronii"}, presence.update(set(), set(), now=240))
+        self.assertEqual(set(), presence.update(set(), set(), now=300))
+
+
+class TestGetStreams(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        SingletonMeta._instances.clear()
+
+    async def test_failed_batches_are_reported_as_unknown(self):
+        twitch_api = TwitchAPI("client_id", "client_secret")
+
+        async def get_streams_batch(user_ids):
+            if 150 in user_ids:
+                raise ConnectionError("Helix is down")
+            return {"data": [{"user_id": str(user_ids[0]), "user_login": "heyronii"}]}
+
+        async def user_ids():
+            for user_id in range(200):
+                yield user_id
+
+        failed_user_ids = set()
+        with patch.object(twitch_api, "get_streams_batch", side_effect=get_streams_batch):
+            streams = [stream async for stream in twitch_api.get_streams(user_ids(), failed_user_ids)]
+
+        self.assertEqual([{"user_id": "0", "user_login": "heyronii"}], streams)
+        self.assertEqual(set(range(100, 200)), failed_user_ids)
+
+
+class TestChannelPresenceSnapshot(unittest.TestCase):
+
+    def test_restored_presence_keeps_missed_polls(self):
+        presence = ChannelPresence(part_after_missed_polls=2)
+        presence.update({"heyronii"}, set(), now=0)
+        presence.update(set(), set(), now=60)
+
+        restored = ChannelPresence(part_after_missed_polls=2)
+        restored.restore_state(presence.snapshot_state())
+
+        self.assertEqual(set(), restored.update(set(), set(), now=120))
+
+
+@patch("ronnia.bots.bot_manager.WARM_START_SNAPSHOT_PATH", "")
+class TestBotManagerStart(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.started: list[asyncio.Task] = []
+        self.bot_manager = BotManager.__new__(BotManager)
+        self.bot_manager.cluster = None
+        self.bot_manager.twitch_bot = None
+        self.bot_manager.channel_presence = ChannelPresence()
+        self.bot_manager.loop_monitor = MagicMock()
+        self.bot_manager.loop_monitor.start.side_effect = lambda: self.create_task(self.wait_forever())
+        self.bot_manager.db_client = MagicMock()
+        self.bot_manager.db_client.initialize = self.wait_forever
+        self.bot_manager.get_channels_to_join = self.wait_forever
+        twitch_bot = MagicMock()
+        twitch_bot.start = self.wait_forever
+        self.twitch_bot_module = SimpleNamespace(TwitchBot=MagicMock(return_value=twitch_bot))
+
+    def create_task(self, coro) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coro)
+        self.started.append(task)
+        return task
+
+    @staticmethod
+    async def wait_forever():
+        await asyncio.Event().wait()
+
+    async def test_failed_start_cancels_the_started_tasks(self):
+        self.bot_manager.wait_for_receiver = AsyncMock(side_effect=RuntimeError("TwitchBot stopped"))
+
+        with (patch("ronnia.bots.bot_manager.asyncio.create_task", side_effect=self.create_task),
+              patch("ronnia.bots.bot_manager.importlib.import_module", return_value=self.twitch_bot_module)):
+            with self.assertRaises(RuntimeError):
+                await self.bot_manager.start()
+        await asyncio.sleep(0)
+
+        # Loop monitor, schema initialization, first poll and the Twitch bot
+        self.assertEqual(4, len(self.started))
+        self.assertTrue(all(task.cancelled() for task in self.started))
@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+
+from ronnia.utils.cache import AsyncLRUCache
+
+
+class TestAsyncLRUCache(unittest.IsolatedAsyncioTestCase):
+
+    async def test_get_or_load_coalesces_concurrent_lookups(self):
+        cache = AsyncLRUCache()
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return 7.5
+
+        results = await asyncio.gather(*[cache.get_or_load((1, 64), loader) for _ in range(10)])
+
+        self.assertEqual([7.5] * 10, results)
+        self.assertEqual(1, calls)
+
+    async def test_get_or_load_does_not_cache_failures(self):
+        cache = AsyncLRUCache()
+
+        async def failing_loader():
+            raise ValueError("osu! api is down")
+
+        with self.assertRaises(ValueError):
+            await cache.get_or_load("key", failing_loader)
+
+        self.assertNotIn("key", cache)
+
+    async def test_cancelled_caller_does_not_cancel_shared_lookup(self):
+        cache = AsyncLRUCache()
+        release = asyncio.Event()
+
+        async def loader():
+            await release.wait()
+            return 7.5
+
+        starter = asyncio.create_task(cache.get_or_load((1, 64), loader))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_load((1, 64), loader))
+        await asyncio.sleep(0)
+        starter.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(7.5, await waiter)
+        self.assertTrue(starter.cancelled())
+        self.assertEqual(7.5, cache.get((1, 64)))
+
+    def test_set_evicts_least_recently_used(self):
+        cache = AsyncLRUCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(2, len(cache))
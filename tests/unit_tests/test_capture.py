@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import unittest
+
+from ronnia.utils.capture import ChatCapture, create_record, get_pseudonym, read_capture, redact_content
+
+
+class TestChatCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "capture.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_redaction_keeps_links_and_mods(self):
+        content = "please play https://osu.ppy.sh/b/123 +HDDT thanks"
+
+        self.assertEqual("xxxxxx xxxx https://osu.ppy.sh/b/123 +HDDT xxxxxx", redact_content(content))
+
+        tags = {"user-id": "42", "room-id": "7", "mod": "1", "color": "#FF0000"}
+        record = create_record("heyronii", "some_chatter", tags, content, arrived_at=1.0, redact_key=b"secret")
+        self.assertNotEqual("some_chatter", record["u"])
+        self.assertEqual(record["u"], create_record("c", "some_chatter", {}, "", 0, redact_key=b"secret")["u"])
+        self.assertNotEqual("42", record["tags"]["user-id"])
+        self.assertNotEqual("7", record["tags"]["room-id"])
+        self.assertTrue(record["tags"]["room-id"].isdigit())
+        self.assertEqual({"user-id", "room-id", "mod"}, set(record["tags"]))
+
+    def test_pseudonyms_depend_on_the_capture_key(self):
+        self.assertNotEqual(get_pseudonym("some_chatter", b"first"), get_pseudonym("some_chatter", b"second"))
+
+        capture = ChatCapture(self.path, redact=True)
+        capture.record("heyronii", "some_chatter", {"user-id": "42"}, "hi", arrived_at=1)
+        capture.record("heyronii", "some_chatter", {"user-id": "42"}, "hi", arrived_at=2)
+        capture.close()
+        first, second = read_capture(self.path)
+
+        self.assertEqual(first["u"], second["u"])
+        with open(self.path, "rb") as f:
+            self.assertNotIn(capture._redact_key, f.read())
+
+    def test_record_without_redaction(self):
+        record = create_record("heyronii", "some_chatter", {"custom-reward-id": "abc"}, "hello", 1.23456)
+
+        self.assertEqual({"t": 1.235, "c": "heyronii", "u": "some_chatter", "tags": {"custom-reward-id": "abc"},
+                          "x": "hello"}, record)
+
+    def test_rotation_keeps_backups_and_reads_in_order(self):
+        capture = ChatCapture(self.path, max_bytes=200, backups=2, redact=False)
+        for i in range(20):
+            capture.record("heyronii", "chatter", {}, f"message {i}", arrived_at=i)
+        capture.close()
+
+        self.assertTrue(os.path.exists(f"{self.path}.2"))
+        self.assertFalse(os.path.exists(f"{self.path}.3"))
+        arrivals = [record["t"] for record in read_capture(self.path)]
+        self.assertEqual(sorted(arrivals), arrivals)
+        self.assertEqual(19, arrivals[-1])
+
+    def test_read_skips_cut_lines(self):
+        with open(self.path, "w") as f:
+            f.write(json.dumps({"t": 1, "c": "a", "u": "b", "tags": {}, "x": "hi"}) + "\n")
+            f.write('{"t": 2, "c": "a", "u"')
+
+        self.assertEqual(1, len(list(read_capture(self.path))))
@@ -0,0 +1,203 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from typing import Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from ronnia.clients.cluster import ClusterCoordinator, get_fair_share, get_partition
+
+PARTITIONS = 12
+
+
+class TestClusterPartitions(unittest.TestCase):
+
+    def test_partition_is_stable_and_case_insensitive(self):
+        self.assertEqual(get_partition("heyronii", 16), get_partition("HeyRonii", 16))
+        self.assertTrue(0 <= get_partition("heyronii", 16) < 16)
+
+    def test_channels_are_spread_over_partitions(self):
+        partitions = [get_partition(f"channel_{i}", 16) for i in range(1600)]
+
+        self.assertEqual(16, len(set(partitions)))
+        self.assertLess(max(partitions.count(p) for p in range(16)), 150)
+
+    def test_fair_share(self):
+        self.assertEqual(16, get_fair_share(16, 1))
+        self.assertEqual(6, get_fair_share(16, 3))
+        self.assertEqual(16, get_fair_share(16, 0))
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub_query) for sub_query in condition):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(condition, dict):
+            if "$gt" in condition and (value is None or not value > condition["$gt"]):
+                return False
+            if "$lte" in condition and (value is None or not value <= condition["$lte"]):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCollection:
+    """In-memory collection with the operations the coordinator uses, every call yields to the event loop."""
+
+    def __init__(self):
+        self.docs: dict[str, dict] = {}
+        self.failing = False
+        self.hanging = asyncio.Event()
+        self.hanging.set()
+
+    async def _operation(self):
+        await asyncio.sleep(0)
+        await self.hanging.wait()
+        if self.failing:
+            raise ConnectionError("mongod is unreachable")
+
+    def _find(self, query: dict) -> list[dict]:
+        return [doc for doc in self.docs.values() if matches(doc, query)]
+
+    async def find_one_and_update(self, query: dict, update: dict, upsert: bool = False, return_document=None):
+        await self._operation()
+        found = self._find(query)
+        if found:
+            found[0].update(update["$set"])
+            return dict(found[0])
+        if not upsert:
+            return None
+        if query["_id"] in self.docs:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        self.docs[query["_id"]] = {"_id": query["_id"]} | update["$set"]
+        return dict(self.docs[query["_id"]])
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        await self._operation()
+        found = self._find(query)
+        if found:
+            found[0].update(update["$set"])
+        elif upsert:
+            self.docs[query["_id"]] = {"_id": query["_id"]} | update["$set"]
+        return SimpleNamespace(matched_count=len(found[:1]))
+
+    async def update_many(self, query: dict, update: dict):
+        await self._operation()
+        for doc in self._find(query):
+            doc.update(update["$set"])
+
+    async def count_documents(self, query: dict) -> int:
+        await self._operation()
+        return len(self._find(query))
+
+    async def delete_one(self, query: dict):
+        await self._operation()
+        for doc in self._find(query)[:1]:
+            del self.docs[doc["_id"]]
+
+    async def find_one(self, query: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        await self._operation()
+        found = self._find(query)
+        return dict(found[0]) if found else None
+
+    async def _iterate(self, query: dict):
+        await self._operation()
+        for doc in self._find(query):
+            yield dict(doc)
+
+    def find(self, query: dict, projection: Optional[dict] = None):
+        return self._iterate(query)
+
+
+class TestClusterCoordinator(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.leases_col = FakeCollection()
+        self.nodes_col = FakeCollection()
+
+    def create_node(self, node_id: str, lease_seconds: float = 60, heartbeat_seconds: float = 1):
+        return ClusterCoordinator(self.leases_col, self.nodes_col, partitions=PARTITIONS, node_id=node_id,
+                                  lease_seconds=lease_seconds, heartbeat_seconds=heartbeat_seconds)
+
+    def assert_no_double_ownership(self, nodes: list[ClusterCoordinator]):
+        owned = [node.owned_partitions for node in nodes]
+        self.assertEqual(sum(len(partitions) for partitions in owned), len(set().union(*owned)))
+        self.assertLessEqual(sum(node.is_leader for node in nodes), 1)
+
+    async def test_partitions_are_taken_over_after_the_lease_expires(self):
+        dead = self.create_node("dead", lease_seconds=0.1, heartbeat_seconds=0.05)
+        survivor = self.create_node("survivor")
+        await dead.heartbeat()
+        await survivor.heartbeat()
+        self.assertEqual((PARTITIONS, 0), (len(dead.owned_partitions), len(survivor.owned_partitions)))
+
+        # The dead node stops heartbeating without releasing its leases
+        await asyncio.sleep(0.15)
+        await survivor.heartbeat()
+
+        self.assertEqual(set(range(PARTITIONS)), survivor.owned_partitions)
+        self.assertTrue(survivor.is_leader)
+        self.assertFalse(dead.owns("heyronii"))
+
+    async def test_racing_nodes_never_own_the_same_partition(self):
+        nodes = [self.create_node(f"node-{i}") for i in range(3)]
+
+        for _ in range(PARTITIONS):
+            await asyncio.gather(*(node.heartbeat() for node in nodes))
+            self.assert_no_double_ownership(nodes)
+
+        self.assertEqual(set(range(PARTITIONS)), set().union(*(node.owned_partitions for node in nodes)))
+        self.assertEqual([4, 4, 4], [len(node.owned_partitions) for node in nodes])
+        self.assertEqual(1, sum(node.is_leader for node in nodes))
+
+    async def test_partitions_are_rebalanced_when_a_node_joins(self):
+        first = self.create_node("first")
+        await first.heartbeat()
+        self.assertEqual(PARTITIONS, len(first.owned_partitions))
+
+        second = self.create_node("second")
+        for _ in range(PARTITIONS):
+            await first.heartbeat()
+            await second.heartbeat()
+            self.assert_no_double_ownership([first, second])
+
+        self.assertEqual([6, 6], [len(first.owned_partitions), len(second.owned_partitions)])
+        self.assertTrue(first.is_leader)
+
+    async def test_node_stops_serving_when_its_heartbeat_fails(self):
+        node = self.create_node("node", lease_seconds=0.1, heartbeat_seconds=0.02)
+        run_task = asyncio.create_task(node.run())
+        await node.ready.wait()
+        self.assertEqual(PARTITIONS, len(node.owned_partitions))
+
+        self.leases_col.failing = True
+        with self.assertLogs("ronnia.clients.cluster", level="WARNING"):
+            await asyncio.sleep(0.2)
+
+        self.assertEqual(set(), node.owned_partitions)
+        self.assertFalse(node.is_leader)
+        self.assertFalse(node.owns("heyronii"))
+        run_task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await run_task
+
+    async def test_node_stops_serving_when_its_heartbeat_hangs_past_the_lease(self):
+        node = self.create_node("node", lease_seconds=0.1, heartbeat_seconds=0.02)
+        run_task = asyncio.create_task(node.run())
+        await node.ready.wait()
+        node.changed.clear()
+
+        self.leases_col.hanging.clear()
+        with self.assertLogs("ronnia.clients.cluster", level="WARNING"):
+            await asyncio.wait_for(node.changed.wait(), timeout=1)
+
+        self.assertEqual(set(), node.owned_partitions)
+        self.assertFalse(node.is_leader)
+        self.leases_col.hanging.set()
+        run_task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await run_task
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from ronnia.clients.credentials import CredentialBroker, FileTokenStore, MemoryTokenStore, Token
+
+
+class FakeProvider:
+    """OAuth token endpoint that counts the tokens it issued."""
+
+    def __init__(self, expires_in: float = 3600, delay: float = 0.0):
+        self.expires_in = expires_in
+        self.delay = delay
+        self.issued = 0
+
+    async def fetch(self) -> Token:
+        await asyncio.sleep(self.delay)
+        self.issued += 1
+        return Token(access_token=f"token-{self.issued}", expires_at=time.time() + self.expires_in)
+
+
+class TestCredentialBroker(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "credentials.json")
+        self.provider = FakeProvider()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_broker(self, store, owner: str, **kwargs) -> CredentialBroker:
+        kwargs = {"refresh_margin_seconds": 60, "refresh_jitter_seconds": 0, "poll_seconds": 0.01} | kwargs
+        return CredentialBroker(store, owner=owner, **kwargs)
+
+    async def test_concurrent_callers_share_one_token(self):
+        self.provider.delay = 0.01
+        broker = self.create_broker(MemoryTokenStore(), "a")
+
+        tokens = await asyncio.gather(*(broker.get_token("osu:1:public", self.provider.fetch) for _ in range(10)))
+
+        self.assertEqual({"token-1"}, set(tokens))
+        self.assertEqual(1, self.provider.issued)
+
+    async def test_processes_reuse_the_stored_token(self):
+        first = self.create_broker(FileTokenStore(self.path), "a")
+        restarted = self.create_broker(FileTokenStore(self.path), "b")
+
+        await first.get_token("twitch:1", self.provider.fetch)
+        token = await restarted.get_token("twitch:1", self.provider.fetch)
+
+        self.assertEqual("token-1", token)
+        self.assertEqual(1, self.provider.issued)
+        self.assertEqual(1, restarted.store_hits)
+        self.assertEqual(0o600, os.stat(self.path).st_mode & 0o777)
+
+    async def test_token_is_refreshed_ahead_of_expiry(self):
+        self.provider.expires_in = 60.05
+        broker = self.create_broker(MemoryTokenStore(), "a")
+
+        first = await broker.get_token("twitch:1", self.provider.fetch)
+        cached = await broker.get_token("twitch:1", self.provider.fetch)
+        await asyncio.sleep(0.1)
+        # The first token is still valid, but within the refresh margin
+        refreshed = await broker.get_token("twitch:1", self.provider.fetch)
+
+        self.assertEqual(("token-1", "token-1", "token-2"), (first, cached, refreshed))
+
+    async def test_only_the_lock_holder_refreshes(self):
+        self.provider.expires_in = 120
+        store = FileTokenStore(self.path)
+        await store.put("twitch:1", Token("old", expires_at=time.time() - 1))
+        self.provider.delay = 0.05
+        brokers = [self.create_broker(FileTokenStore(self.path), f"node-{i}") for i in range(3)]
+
+        tokens = await asyncio.gather(*(broker.get_token("twitch:1", self.provider.fetch) for broker in brokers))
+
+        self.assertEqual({"token-1"}, set(tokens))
+        self.assertEqual(1, self.provider.issued)
+        self.assertEqual(2, sum(broker.waits for broker in brokers))
+
+    async def test_current_token_is_used_while_another_process_refreshes(self):
+        store = MemoryTokenStore()
+        await store.put("twitch:1", Token("current", expires_at=time.time() + 30))
+        await store.acquire_lock("twitch:1", "other", seconds=60)
+        broker = self.create_broker(store, "a")
+
+        self.assertEqual("current", await broker.get_token("twitch:1", self.provider.fetch))
+        self.assertEqual(0, self.provider.issued)
+
+    async def test_stuck_refresher_does_not_block(self):
+        store = MemoryTokenStore()
+        await store.acquire_lock("twitch:1", "dead", seconds=60)
+        broker = self.create_broker(store, "a", lock_seconds=0.05)
+
+        self.assertEqual("token-1", await broker.get_token("twitch:1", self.provider.fetch))
+        self.assertEqual(1, broker.waits)
+
+    async def test_invalidated_token_is_replaced(self):
+        store = MemoryTokenStore()
+        broker = self.create_broker(store, "a")
+        other = self.create_broker(store, "b")
+        await broker.get_token("twitch:1", self.provider.fetch)
+
+        await broker.invalidate("twitch:1", "token-1")
+        await broker.invalidate("twitch:1", "token-0")
+
+        self.assertEqual("token-2", await other.get_token("twitch:1", self.provider.fetch))
+        self.assertEqual("token-2", await broker.get_token("twitch:1", self.provider.fetch))
+
+    async def test_store_failure_falls_back_to_authenticating(self):
+        os.mkdir(self.path)
+        broker = self.create_broker(FileTokenStore(self.path), "a")
+
+        self.assertEqual("token-1", await broker.get_token("twitch:1", self.provider.fetch))
+        self.assertEqual(1, broker.store_errors)
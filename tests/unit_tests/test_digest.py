@@ -0,0 +1,67 @@
+import unittest
+
+from ronnia.utils.digest import DigestBuffer
+
+
+class TestDigestBuffer(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.flushed = []
+
+        async def flush(key, items):
+            self.flushed.append((key, items))
+
+        self.digest = DigestBuffer(flush, rate_per_minute=3, window_seconds=10, max_items=4)
+
+    def test_key_is_busy_above_the_rate(self):
+        self.assertEqual([False, False, True], [self.digest.is_busy("a", now=t) for t in (0, 1, 2)])
+        self.assertFalse(self.digest.is_busy("b", now=3))
+        # Three items spread over more than a minute are below the rate
+        self.assertEqual([False, False, False], [self.digest.is_busy("c", now=t) for t in (0, 40, 80)])
+
+    def test_items_arriving_together_count_separately(self):
+        self.assertFalse(self.digest.is_busy("a", now=0))
+        self.assertTrue(self.digest.is_busy("a", now=1, count=2))
+
+    async def test_window_is_flushed_in_one_call(self):
+        for t in range(6):
+            if self.digest.is_busy("a", now=t):
+                self.digest.add("a", t, now=t)
+
+        await self.digest.flush_due(now=11)
+        self.assertEqual([], self.flushed)
+        await self.digest.flush_due(now=12)
+
+        self.assertEqual([("a", [2, 3, 4, 5])], self.flushed)
+        self.assertEqual(0, len(self.digest))
+
+    async def test_full_window_drops_items(self):
+        for t in range(6):
+            self.digest.add("a", t, now=0)
+
+        await self.digest.flush_due(now=10)
+
+        self.assertEqual([("a", [0, 1, 2, 3])], self.flushed)
+        self.assertEqual(2, self.digest.dropped)
+
+    async def test_quiet_keys_are_forgotten(self):
+        self.digest.is_busy("a", now=0)
+        self.digest.is_busy("b", now=50)
+
+        await self.digest.flush_due(now=70)
+
+        self.assertEqual({"b"}, set(self.digest._arrivals))
+
+    async def test_flush_failure_does_not_stop_other_keys(self):
+        async def flush(key, items):
+            if key == "a":
+                raise RuntimeError("osu! chat is down")
+            self.flushed.append((key, items))
+
+        self.digest.flush = flush
+        self.digest.add("a", 1, now=0)
+        self.digest.add("b", 2, now=0)
+
+        await self.digest.flush_due(now=10)
+
+        self.assertEqual([("b", [2])], self.flushed)
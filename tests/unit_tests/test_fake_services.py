@@ -0,0 +1,131 @@
+import time
+import unittest
+from unittest import mock
+
+from aiohttp import ClientSession
+
+from benchmarks.fake_services import FIRST_BEATMAP_ID, FakeOsu, FakeServices, FakeTwitch
+from benchmarks.replay import ReplayTwitch
+from ronnia.clients.osu import OsuApiV2, OsuChatApiV2
+from ronnia.clients.transport import HttpTransport
+from ronnia.clients.twitch import TwitchAPI
+from ronnia.models.beatmap import Beatmap, BeatmapType
+from ronnia.utils.singleton import SingletonMeta
+
+
+async def aiter_list(items):
+    for item in items:
+        yield item
+
+
+class TestFakeServices(unittest.IsolatedAsyncioTestCase):
+    """The bot's own clients against the fake services used by the soak runner."""
+
+    async def asyncSetUp(self) -> None:
+        SingletonMeta._instances.clear()
+        self.services = FakeServices(FakeTwitch(channels=250, live_ratio=0.4, churn_ratio=0.1, seed=1),
+                                     FakeOsu(latency_ms=0, rate_limit_ratio=0, seed=1))
+        await self.services.start()
+        self.env = self.services.get_env()
+        self.transport = HttpTransport(retry_max_wait=0.01, metrics_name=None)
+
+    async def asyncTearDown(self) -> None:
+        await self.transport.close()
+        await self.services.stop()
+        SingletonMeta._instances.clear()
+
+    async def get_live_ids(self, twitch_api: TwitchAPI) -> set[int]:
+        user_ids = aiter_list(list(self.services.twitch.channels))
+        return {int(stream["user_id"]) async for stream in twitch_api.get_streams(user_ids)}
+
+    async def test_helix_streams_churn(self):
+        twitch_api = TwitchAPI("soak", "soak")
+        twitch_api.transport = self.transport
+        twitch_api.base_url = self.env["TWITCH_API_URL"]
+
+        with mock.patch("ronnia.clients.twitch.TWITCH_AUTH_URL", self.env["TWITCH_AUTH_URL"]):
+            live = await self.get_live_ids(twitch_api)
+            self.assertEqual(self.services.twitch.live, live)
+            self.assertEqual(100, len(live))
+
+            self.services.twitch.churn()
+            churned = await self.get_live_ids(twitch_api)
+
+        self.assertEqual(25, len(live ^ churned))
+        self.assertEqual(3 * 2, self.services.twitch.counters["helix.streams"])
+
+    def create_osu_client(self, client_cls):
+        client = client_cls("1", "soak")
+        client._transport = self.transport
+        client._api_base_url = self.env["OSU_API_URL"]
+        client._cooldown_seconds = 0
+        return client
+
+    async def test_osu_beatmap_and_chat(self):
+        osu_api = self.create_osu_client(OsuApiV2)
+        osu_chat_api = self.create_osu_client(OsuChatApiV2)
+
+        with mock.patch("ronnia.clients.osu.OSU_OAUTH_URL", self.env["OSU_OAUTH_URL"]):
+            beatmap_info, beatmapset_info = await osu_api.get_beatmap(
+                Beatmap(id=FIRST_BEATMAP_ID + 7, type=BeatmapType.MAP, mods=""))
+            attributes = await osu_api.get_beatmap_attributes(FIRST_BEATMAP_ID + 7, mods=64)
+            await osu_chat_api.send_message(target_id=1, message="soak -> [Ranked] beatmap")
+
+        self.assertEqual(FIRST_BEATMAP_ID + 7, beatmap_info["id"])
+        self.assertEqual(beatmap_info["beatmapset_id"], beatmapset_info["id"])
+        self.assertIn(beatmap_info["id"], [beatmap["id"] for beatmap in beatmapset_info["beatmaps"]])
+        self.assertIn("star_rating", attributes["attributes"])
+        self.assertEqual(1, self.services.osu.counters["chat.new"])
+
+    async def test_osu_batched_beatmaps_lookup(self):
+        osu_api = self.create_osu_client(OsuApiV2)
+        beatmap_ids = [FIRST_BEATMAP_ID + i for i in (3, 11, 42)]
+
+        with mock.patch("ronnia.clients.osu.OSU_OAUTH_URL", self.env["OSU_OAUTH_URL"]):
+            beatmap_infos = await osu_api.get_beatmaps(beatmap_ids)
+
+        self.assertEqual(beatmap_ids, [beatmap_info["id"] for beatmap_info in beatmap_infos])
+        self.assertTrue(all("beatmapset" in beatmap_info for beatmap_info in beatmap_infos))
+        self.assertEqual(1, self.services.osu.counters["beatmaps.lookup"])
+
+    async def test_osu_rate_limit_is_retried(self):
+        self.services.osu.rate_limit_ratio = 0.5
+        # The first api request is rate limited, the retry is not
+        self.services.osu.random.random = iter([0.1, 0.9]).__next__
+        osu_api = self.create_osu_client(OsuApiV2)
+
+        with mock.patch("ronnia.clients.osu.OSU_OAUTH_URL", self.env["OSU_OAUTH_URL"]):
+            beatmap_info, _ = await osu_api.get_beatmap(Beatmap(id=FIRST_BEATMAP_ID, type=BeatmapType.MAP, mods=""))
+
+        self.assertEqual(FIRST_BEATMAP_ID, beatmap_info["id"])
+        self.assertEqual(1, self.services.osu.counters["rate_limited"])
+
+
+class TestReplayTwitch(unittest.IsolatedAsyncioTestCase):
+
+    async def test_replays_capture_faster(self):
+        records = [{"t": 100.0 + i * 0.5, "c": f"channel_{i % 2}", "u": f"chatter_{i}", "tags": {"mod": "1"},
+                    "x": f"https://osu.ppy.sh/b/{i}"} for i in range(4)]
+        twitch = ReplayTwitch(records, speed=10)
+        services = FakeServices(twitch, FakeOsu(latency_ms=0, rate_limit_ratio=0))
+        await services.start()
+        try:
+            async with ClientSession() as session, session.ws_connect(services.irc_url) as ws:
+                await ws.send_str("NICK soak_bot\r\nJOIN #channel_0,#channel_1")
+                await ws.receive()
+                await ws.receive()
+
+                started = time.monotonic()
+                twitch.start_replay.set()
+                privmsgs = []
+                while len(privmsgs) < 4:
+                    privmsgs += [line for line in (await ws.receive()).data.split("\r\n") if "PRIVMSG" in line]
+                elapsed = time.monotonic() - started
+        finally:
+            await services.stop()
+
+        # 1.5s of captured traffic at 10x
+        self.assertLess(elapsed, 1.0)
+        self.assertTrue(all(";mod=1;" in privmsg for privmsg in privmsgs))
+        self.assertIn(f"room-id={twitch.channel_ids['channel_1']}", privmsgs[1])
+        self.assertTrue(privmsgs[3].endswith("PRIVMSG #channel_1 :https://osu.ppy.sh/b/3"))
@@ -0,0 +1,93 @@
+import datetime
+import io
+import json
+import unittest
+
+from ronnia.clients.mongo import RonniaDatabase
+from ronnia.tools.import_beatmaps import BeatmapDumpImporter, parse_sql_values
+
+SQL_BEATMAPS_DUMP = b"""CREATE TABLE `osu_beatmaps` (
+  `beatmap_id` mediumint unsigned NOT NULL AUTO_INCREMENT,
+  `beatmapset_id` mediumint unsigned DEFAULT NULL,
+  `version` varchar(80) NOT NULL DEFAULT '',
+  `hit_length` mediumint unsigned NOT NULL DEFAULT '0',
+  `playmode` tinyint unsigned NOT NULL DEFAULT '0',
+  `approved` tinyint NOT NULL DEFAULT '0',
+  `difficultyrating` float NOT NULL DEFAULT '0',
+  `bpm` float NOT NULL DEFAULT '60',
+  PRIMARY KEY (`beatmap_id`)
+) ENGINE=InnoDB;
+INSERT INTO `osu_beatmaps` VALUES (1170505,552726,'Evolution',290,0,1,7.23,200),(75,1,'Nat\\'s Normal',142,0,-2,2.5,NULL);
+"""
+
+
+class TestParseSqlValues(unittest.TestCase):
+
+    def test_parse_sql_values_parses_every_row(self):
+        rows = list(parse_sql_values("(1,'a, (b)',NULL,-2.5),(2,'c\\\\d',3e2,4);"))
+
+        self.assertEqual([[1, "a, (b)", None, -2.5], [2, "c\\d", 300.0, 4]], rows)
+
+    def test_parse_sql_values_unescapes_quotes(self):
+        rows = list(parse_sql_values("(1,'Nat\\'s Normal')"))
+
+        self.assertEqual([[1, "Nat's Normal"]], rows)
+
+
+class TestBeatmapDumpImporter(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.importer = BeatmapDumpImporter.__new__(BeatmapDumpImporter)
+        self.importer.all_statuses = False
+        self.importer.imported_at = None
+
+    def test_read_sql_imports_only_ranked_beatmaps(self):
+        dump_file = io.BytesIO(SQL_BEATMAPS_DUMP)
+
+        statements = list(self.importer.read_sql(dump_file))
+
+        self.assertEqual(1, len(statements))
+        operations, offset = statements[0]
+        self.assertEqual(len(SQL_BEATMAPS_DUMP), offset)
+        self.assertEqual(1, len(operations))
+        beatmap_doc = operations[0]._doc["$set"]
+        self.assertEqual({"id": 1170505, "beatmapset_id": 552726, "version": "Evolution", "bpm": 200,
+                          "status": "ranked", "difficulty_rating": 7.23, "hit_length": 290, "mode": "osu",
+                          "ronnia_imported_at": None, "ronnia_updated_at": None}, beatmap_doc)
+
+    def test_read_sql_imports_all_statuses_when_enabled(self):
+        self.importer.all_statuses = True
+
+        operations, _ = next(self.importer.read_sql(io.BytesIO(SQL_BEATMAPS_DUMP)))
+
+        self.assertEqual(2, len(operations))
+        self.assertEqual("graveyard", operations[1]._doc["$set"]["status"])
+
+    def test_imported_beatmaps_age_from_the_import(self):
+        self.importer.all_statuses = True
+        self.importer.imported_at = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(days=2)
+
+        operations, _ = next(self.importer.read_sql(io.BytesIO(SQL_BEATMAPS_DUMP)))
+
+        for operation in operations:
+            beatmap_doc = operation._doc["$set"]
+            self.assertEqual(self.importer.imported_at, beatmap_doc["ronnia_updated_at"])
+            self.assertAlmostEqual(2 * 24 * 60 * 60, RonniaDatabase.get_beatmap_age(beatmap_doc), delta=5)
+
+    def test_read_sql_resumes_with_columns_from_header(self):
+        dump_file = io.BytesIO(SQL_BEATMAPS_DUMP)
+        table_columns = self.importer.read_sql_columns(dump_file)
+        dump_file.seek(SQL_BEATMAPS_DUMP.index(b"INSERT"))
+
+        operations, _ = next(self.importer.read_sql(dump_file, table_columns))
+
+        self.assertEqual(1170505, operations[0]._doc["$set"]["id"])
+
+    def test_read_jsonl_marks_the_default_difficulty_of_beatmapsets(self):
+        beatmapset = {"id": 552726, "artist": "Camellia", "title": "Exit This Earth's Atomosphere", "beatmaps": [
+            {"id": beatmap_id, "beatmapset_id": 552726, "status": "ranked"} for beatmap_id in (1170505, 1170506)
+        ]}
+
+        operations, _ = next(self.importer.read_jsonl(io.BytesIO(json.dumps(beatmapset).encode() + b"\n")))
+
+        self.assertEqual([True, False], [operation._doc["$set"]["beatmapset_default"] for operation in operations])
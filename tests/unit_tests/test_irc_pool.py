@@ -0,0 +1,125 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from ronnia.bots.irc_pool import IrcConnectionPool
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.joined = []
+        self.parted = []
+        self._init = True
+        self._cache = {}
+        self._initial_channels = []
+        self.is_alive = True
+
+    async def join_channels(self, *channels: str):
+        self.joined += channels
+
+    async def part_channels(self, *channels: str):
+        self.parted += channels
+
+
+@patch("ronnia.bots.irc_pool.JOIN_WINDOW_SECONDS", 0)
+class TestIrcConnectionPool(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.primary = FakeConnection()
+        self.client = SimpleNamespace(_connection=self.primary, nick="ronnia_bot")
+        self.pool = IrcConnectionPool(self.client, channels_per_connection=10, max_connections=3)
+        self.pool._open_connection = AsyncMock(side_effect=self.open_connection)
+        self.pool._close_connection = AsyncMock()
+
+    async def open_connection(self):
+        connection = FakeConnection()
+        self.pool.connections.append(connection)
+        return connection
+
+    async def test_channels_are_spread_over_connections(self):
+        await self.pool.join_channels([f"channel_{i}" for i in range(25)])
+
+        self.assertEqual(3, len(self.pool.connections))
+        self.assertEqual([10, 10, 5], [len(connection.joined) for connection in self.pool.connections])
+        self.assertEqual(25, len(self.pool.channels))
+
+    async def test_channels_over_capacity_go_to_the_least_loaded_connection(self):
+        await self.pool.join_channels([f"channel_{i}" for i in range(35)])
+
+        self.assertEqual(3, len(self.pool.connections))
+        self.assertEqual([12, 12, 11], [len(connection.joined) for connection in self.pool.connections])
+
+    async def test_joined_channels_are_not_joined_again(self):
+        await self.pool.join_channels(["heyronii"])
+        await self.pool.join_channels(["HeyRonii", "other"])
+
+        self.assertEqual(["heyronii", "other"], self.primary.joined)
+
+    async def test_reconnect_rejoins_only_own_channels(self):
+        await self.pool.join_channels([f"channel_{i}" for i in range(15)])
+
+        primary, extra = self.pool.connections
+        self.assertEqual(sorted(primary.joined + ["ronnia_bot"]), sorted(primary._initial_channels))
+        self.assertEqual(sorted(extra.joined), sorted(extra._initial_channels))
+
+    async def test_parting_rebalances_new_joins_and_closes_empty_connections(self):
+        await self.pool.join_channels([f"channel_{i}" for i in range(15)])
+        extra = self.pool.connections[1]
+
+        await self.pool.part_channels([f"channel_{i}" for i in range(10, 15)])
+
+        self.assertEqual([self.primary], self.pool.connections)
+        self.pool._close_connection.assert_awaited_once_with(extra)
+
+        await self.pool.part_channels(["channel_0", "channel_1"])
+        await self.pool.join_channels(["new_channel"])
+        self.assertEqual("new_channel", self.primary.joined[-1])
+
+    async def test_forgotten_channel_can_be_joined_again(self):
+        await self.pool.join_channels(["heyronii"])
+        self.pool.forget("heyronii")
+        await self.pool.join_channels(["heyronii"])
+
+        self.assertEqual(["heyronii", "heyronii"], self.primary.joined)
+
+    async def test_parting_does_not_wait_for_the_join_rate_limit(self):
+        with patch("ronnia.bots.irc_pool.JOIN_WINDOW_SECONDS", 10):
+            join_task = asyncio.create_task(self.pool.join_channels([f"channel_{i}" for i in range(25)]))
+            await asyncio.sleep(0.01)
+
+            await asyncio.wait_for(self.pool.part_channels(["channel_0"]), timeout=1)
+            await asyncio.wait_for(self.pool.sync(), timeout=1)
+
+            self.assertFalse(join_task.done())
+            self.assertEqual(19, len(self.pool.channels))
+            join_task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await join_task
+
+    async def test_rebalance_moves_channels_off_loaded_connections(self):
+        await self.pool.join_channels([f"channel_{i}" for i in range(25)])
+        await self.pool.part_channels([f"channel_{i}" for i in range(8)])
+        primary, second, third = self.pool.connections
+
+        await self.pool.rebalance()
+
+        self.assertEqual([6, 6, 5], [self.pool.get_load(connection) for connection in self.pool.connections])
+        self.assertEqual(4, len(second.parted))
+        self.assertEqual(second.parted, primary.joined[-4:])
+        self.assertEqual(sorted(primary.joined[-4:] + ["channel_8", "channel_9", "ronnia_bot"]),
+                         sorted(primary._initial_channels))
+
+        await self.pool.rebalance()
+        self.assertEqual(4, len(second.parted))
+
+    async def test_rebalance_waits_for_the_join_rate_limit(self):
+        await self.pool.join_channels([f"channel_{i}" for i in range(25)])
+        await self.pool.part_channels([f"channel_{i}" for i in range(8)])
+
+        with patch("ronnia.bots.irc_pool.JOIN_WINDOW_SECONDS", 10):
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(self.pool.rebalance(), timeout=0.05)
+
+        self.assertEqual([2, 10, 5], [self.pool.get_load(connection) for connection in self.pool.connections])
@@ -0,0 +1,67 @@
+import asyncio
+import time
+import unittest
+
+from ronnia.utils.loop_monitor import MAX_OFFENDERS, EventLoopMonitor
+
+
+def block_the_loop():
+    time.sleep(0.3)
+
+
+class TestEventLoopMonitor(unittest.IsolatedAsyncioTestCase):
+
+    async def test_stall_is_attributed_to_the_blocking_code(self):
+        monitor = EventLoopMonitor(interval=0.01, stall_ms=100)
+        task = monitor.start()
+        await asyncio.sleep(0.05)
+
+        with self.assertLogs("ronnia.utils.loop_monitor", level="WARNING") as logs:
+            block_the_loop()
+            await asyncio.sleep(0.05)
+        task.cancel()
+
+        stalled = next(record for record in logs.records if record.msg == "Event loop stalled")
+        self.assertIn("block_the_loop", stalled.offender)
+        self.assertTrue(any("time.sleep" in line for line in stalled.stack))
+
+        metrics = monitor.metrics()
+        self.assertEqual(1, metrics["stalls"])
+        self.assertGreaterEqual(metrics["lag_ms"]["max"], 250)
+        self.assertIn("block_the_loop", metrics["worst_offenders"][0]["offender"])
+
+    async def test_no_stall_without_blocking(self):
+        monitor = EventLoopMonitor(interval=0.01, stall_ms=200)
+        task = monitor.start()
+        await asyncio.sleep(0.1)
+        task.cancel()
+
+        metrics = monitor.metrics()
+        self.assertEqual(0, metrics["stalls"])
+        self.assertGreater(metrics["lag_ms"]["count"], 0)
+        self.assertEqual([], metrics["worst_offenders"])
+
+    async def test_slow_callbacks_are_recorded(self):
+        monitor = EventLoopMonitor(interval=0.01, stall_ms=10_000, slow_callback_ms=50)
+        task = monitor.start()
+        asyncio.get_running_loop().call_soon(block_the_loop)
+        await asyncio.sleep(0.4)
+        task.cancel()
+        await asyncio.sleep(0)
+
+        self.assertTrue(any("block_the_loop" in offender["offender"]
+                            for offender in monitor.metrics()["worst_offenders"]))
+
+    def test_keeps_the_worst_offenders(self):
+        monitor = EventLoopMonitor()
+        for i in range(MAX_OFFENDERS):
+            monitor.record_offender(f"offender-{i}", 100 + i)
+        monitor.record_offender("mild", 1)
+        monitor.record_offender("worst", 1000)
+        monitor.record_offender("offender-5", 50)
+
+        self.assertEqual(MAX_OFFENDERS, len(monitor.offenders))
+        self.assertNotIn("mild", monitor.offenders)
+        self.assertNotIn("offender-0", monitor.offenders)
+        self.assertEqual([2, 105], monitor.offenders["offender-5"])
+        self.assertEqual("worst", monitor.metrics()["worst_offenders"][0]["offender"])
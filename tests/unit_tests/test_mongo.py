@@ -0,0 +1,70 @@
+import datetime
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from ronnia.clients.mongo import SETTINGS, RonniaDatabase
+
+
+class TestCompactBeatmap(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.beatmapset_info = {"id": 552726, "artist": "Camellia", "title": "Exit This Earth's Atomosphere",
+                                "covers": {"cover": "https://assets.ppy.sh/beatmaps/552726/covers/cover.jpg"},
+                                "description": {"description": "A very long description"}}
+        self.beatmap_info = {"id": 1170505, "beatmapset_id": 552726, "version": "Evolution", "bpm": 200,
+                             "status": "ranked", "difficulty_rating": 7.23, "hit_length": 290, "mode": "osu",
+                             "checksum": "4f2b6c", "failtimes": {"fail": [0] * 100},
+                             "beatmapset": self.beatmapset_info}
+
+    def test_compact_beatmap_keeps_only_cached_fields(self):
+        beatmap_doc = RonniaDatabase.compact_beatmap(self.beatmap_info, self.beatmapset_info)
+
+        self.assertEqual({"id", "beatmapset_id", "version", "bpm", "status", "difficulty_rating", "hit_length",
+                          "mode", "beatmapset", "ronnia_updated_at"}, set(beatmap_doc))
+        self.assertEqual({"id": 552726, "artist": "Camellia", "title": "Exit This Earth's Atomosphere"},
+                         beatmap_doc["beatmapset"])
+
+    def test_compact_beatmap_age_is_zero_after_compacting(self):
+        beatmap_doc = RonniaDatabase.compact_beatmap(self.beatmap_info, self.beatmapset_info)
+
+        self.assertLess(RonniaDatabase.get_beatmap_age(beatmap_doc), 1)
+
+    def test_get_beatmap_age_is_infinite_without_update_date(self):
+        self.assertEqual(float("inf"), RonniaDatabase.get_beatmap_age(self.beatmap_info))
+
+    def test_get_beatmap_age_is_infinite_for_imports_without_update_date(self):
+        imported_beatmap = self.beatmap_info | {"ronnia_imported_at": datetime.datetime.now(tz=datetime.timezone.utc)}
+
+        self.assertEqual(float("inf"), RonniaDatabase.get_beatmap_age(imported_beatmap))
+
+
+class TestInitialize(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.db_client = RonniaDatabase("mongodb://localhost:27017", connect=False)
+        self.db_client.meta_col = AsyncMock()
+        self.db_client.define_setting = AsyncMock()
+
+    async def asyncTearDown(self) -> None:
+        await self.db_client.close()
+
+    async def test_initialize_is_skipped_when_schema_matches(self):
+        self.db_client.meta_col.find_one.return_value = {"_id": "schema",
+                                                         "fingerprint": RonniaDatabase.get_schema_fingerprint()}
+
+        await self.db_client.initialize()
+
+        self.db_client.define_setting.assert_not_called()
+        self.db_client.meta_col.update_one.assert_not_called()
+
+    async def test_initialize_runs_when_schema_changed(self):
+        self.db_client.meta_col.find_one.return_value = {"_id": "schema", "fingerprint": "outdated"}
+
+        with patch("pymongo.asynchronous.collection.AsyncCollection.create_indexes", new=AsyncMock()), \
+                patch.object(self.db_client, "create_ttl_index", new=AsyncMock()):
+            await self.db_client.initialize()
+
+        self.assertEqual(len(SETTINGS), self.db_client.define_setting.await_count)
+        self.db_client.meta_col.update_one.assert_awaited_once()
+        self.assertEqual(RonniaDatabase.get_schema_fingerprint(),
+                         self.db_client.meta_col.update_one.await_args.args[1]["$set"]["fingerprint"])
@@ -0,0 +1,58 @@
+import unittest
+from types import SimpleNamespace
+
+from ronnia.clients.mongo_monitoring import MongoCommandMonitor, monitored, current_operation, get_filter_shape
+
+
+def command_event(request_id: int, command_name: str, command: dict = None, duration_ms: float = 0, reply=None):
+    return SimpleNamespace(connection_id=("localhost", 27017), request_id=request_id, command_name=command_name,
+                           command=command or {}, duration_micros=int(duration_ms * 1000), reply=reply)
+
+
+class TestMongoCommandMonitor(unittest.IsolatedAsyncioTestCase):
+
+    async def test_monitored_tags_commands_with_method_name(self):
+        monitor = MongoCommandMonitor(slow_query_ms=1000)
+
+        @monitored
+        async def get_user_from_twitch_username():
+            monitor.started(command_event(1, "find", {"find": "Users", "filter": {"twitchUsername": "a"}}))
+            return current_operation.get()
+
+        self.assertEqual("get_user_from_twitch_username", await get_user_from_twitch_username())
+        self.assertIsNone(current_operation.get())
+
+        monitor.succeeded(command_event(1, "find", duration_ms=3, reply={"cursor": {"firstBatch": [{}]}}))
+        stats = monitor.metrics()["get_user_from_twitch_username"]
+        self.assertEqual(1, stats["latency_ms"]["count"])
+        self.assertEqual(1, stats["documents"])
+
+    async def test_monitored_tags_async_generators(self):
+        @monitored
+        async def get_enabled_users():
+            for _ in range(2):
+                yield current_operation.get()
+
+        self.assertEqual(["get_enabled_users"] * 2, [operation async for operation in get_enabled_users()])
+
+    def test_untagged_commands_are_grouped_by_command_name(self):
+        monitor = MongoCommandMonitor()
+
+        monitor.started(command_event(2, "update", {"update": "Users", "updates": [{"q": {"isLive": True}}]}))
+        monitor.failed(command_event(2, "update"))
+
+        self.assertEqual(1, monitor.metrics()["untagged.update"]["failures"])
+
+    def test_slow_commands_are_logged_without_values(self):
+        monitor = MongoCommandMonitor(slow_query_ms=50)
+        command = {"find": "Users", "filter": {"twitchUsername": "heyronii", "twitchId": {"$nin": [1, 2]}}}
+
+        with self.assertLogs("ronnia.clients.mongo_monitoring", level="WARNING") as logs:
+            monitor.started(command_event(3, "find", command))
+            monitor.succeeded(command_event(3, "find", duration_ms=120, reply={"cursor": {"firstBatch": []}}))
+
+        self.assertEqual({"twitchUsername": "str", "twitchId": {"$nin": ["int"]}}, logs.records[0].filter_shape)
+        self.assertNotIn("heyronii", str(logs.records[0].__dict__))
+
+    def test_get_filter_shape_handles_empty_lists(self):
+        self.assertEqual({"a": []}, get_filter_shape({"a": []}))
@@ -0,0 +1,105 @@
+import datetime
+import unittest
+from unittest import mock
+
+from ronnia.clients.osu import OsuApiPool, OsuApiV2, OsuChatApiV2
+from ronnia.clients.transport import ResponseStatusError, TransportResponse
+from ronnia.utils.singleton import SingletonMeta
+
+
+class TestOsuApiPool(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        SingletonMeta._instances.clear()
+        self.pool = OsuApiPool(OsuApiV2, [("1", "secret-1"), ("2", "secret-2"), ("3", "secret-3")])
+
+    def test_pool_creates_a_client_per_credential(self):
+        self.assertEqual(3, len(set(map(id, self.pool.clients))))
+
+    def test_acquire_prefers_client_without_cooldown(self):
+        now = datetime.datetime.now()
+        self.pool.clients[0]._last_request_time = now
+        self.pool.clients[1]._last_request_time = now - datetime.timedelta(seconds=10)
+        self.pool.clients[2]._last_request_time = now - datetime.timedelta(milliseconds=500)
+
+        self.assertIs(self.pool.clients[1], self.pool.acquire())
+
+    def test_acquire_prefers_client_with_less_requests_in_flight(self):
+        self.pool.clients[0].in_flight = 2
+        self.pool.clients[1].in_flight = 1
+        self.pool.clients[2].in_flight = 3
+
+        self.assertIs(self.pool.clients[1], self.pool.acquire())
+
+    async def test_pool_routes_calls_to_acquired_client(self):
+        called_clients = []
+
+        async def fake_get_user_info(client, user_id):
+            called_clients.append(client)
+            return {"id": user_id}
+
+        for client in self.pool.clients:
+            client.get_user_info = fake_get_user_info.__get__(client)
+        self.pool.clients[0].in_flight = 1
+        self.pool.clients[2].in_flight = 1
+
+        result = await self.pool.get_user_info(user_id=2)
+
+        self.assertEqual({"id": 2}, result)
+        self.assertEqual([self.pool.clients[1]], called_clients)
+        self.assertEqual(0, self.pool.clients[1].in_flight)
+
+
+class TestOsuApiResponseStatus(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        SingletonMeta._instances.clear()
+        self.transport = mock.AsyncMock()
+
+    def create_client(self, client_cls):
+        client = client_cls("1", "secret-1")
+        client._transport = self.transport
+        client._cooldown_seconds = 0
+        client.ensure_authenticated = mock.AsyncMock()
+        return client
+
+    async def test_failed_get_raises_status_error(self):
+        # The transport gives up on 5xx and 429 after its retries without a body
+        self.transport.request.return_value = TransportResponse(status=503, data=None, headers={})
+        client = self.create_client(OsuApiV2)
+
+        with self.assertRaises(ResponseStatusError) as cm:
+            await client.get_beatmaps([10, 20])
+
+        self.assertEqual(503, cm.exception.status)
+
+    async def test_error_body_is_not_returned_as_data(self):
+        self.transport.request.return_value = TransportResponse(status=404, data={"error": None}, headers={})
+        client = self.create_client(OsuApiV2)
+
+        with self.assertRaises(ResponseStatusError) as cm:
+            await client.get_user_info(user_id=2)
+
+        self.assertEqual(404, cm.exception.status)
+
+    async def test_failed_chat_message_is_not_dropped(self):
+        self.transport.request.return_value = TransportResponse(status=403, data={"error": "forbidden"}, headers={})
+        client = self.create_client(OsuChatApiV2)
+
+        with self.assertRaises(ResponseStatusError):
+            await client.send_message(target_id=99, message="hello")
+
+    async def test_failed_authentication_raises_status_error(self):
+        self.transport.request.return_value = TransportResponse(status=401, data={"error": "invalid_client"},
+                                                                headers={})
+        client = self.create_client(OsuApiV2)
+
+        with self.assertRaises(ResponseStatusError):
+            await client._request_access_token()
+
+    async def test_successful_response_returns_data(self):
+        self.transport.request.return_value = TransportResponse(status=200, data={"beatmaps": [{"id": 10}]},
+                                                                headers={})
+        client = self.create_client(OsuApiV2)
+
+        self.assertEqual([{"id": 10}], await client.get_beatmaps([10]))
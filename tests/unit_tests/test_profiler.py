@@ -0,0 +1,100 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from ronnia.utils.profiler import ProfilerToggle, SamplingProfiler
+from ronnia.utils.sampling import AdaptiveSampler
+
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.stop = threading.Event()
+        self.worker = threading.Thread(target=busy_loop, args=(self.stop,), name="busy")
+        self.worker.start()
+
+    def tearDown(self):
+        self.stop.set()
+        self.worker.join()
+
+    def test_samples_other_threads(self):
+        profiler = SamplingProfiler(interval_ms=1)
+        profiler.start()
+        time.sleep(0.1)
+        profiler.stop()
+
+        busy_stacks = [stack for stack in profiler.samples if stack[0] == "busy"]
+        self.assertTrue(busy_stacks)
+        self.assertTrue(any("busy_loop" in stack[-1] for stack in busy_stacks))
+        self.assertFalse(any(stack[0] == "sampling-profiler" for stack in profiler.samples))
+
+    def test_output_formats(self):
+        profiler = SamplingProfiler(interval_ms=5)
+        profiler.samples.update({("MainThread", "main (a.py:1)", "work (a.py:5)"): 3,
+                                 ("busy", "busy_loop (b.py:1)"): 2})
+
+        self.assertEqual("MainThread;main (a.py:1);work (a.py:5) 3\nbusy;busy_loop (b.py:1) 2\n",
+                         profiler.to_collapsed())
+
+        speedscope = profiler.to_speedscope()
+        frames = [frame["name"] for frame in speedscope["shared"]["frames"]]
+        main_profile, busy_profile = speedscope["profiles"]
+        self.assertEqual(["main (a.py:1)", "work (a.py:5)", "busy_loop (b.py:1)"], frames)
+        self.assertEqual([[0, 1]], main_profile["samples"])
+        self.assertEqual([15], main_profile["weights"])
+        self.assertEqual(10, busy_profile["endValue"])
+
+
+class TestProfilerToggle(unittest.IsolatedAsyncioTestCase):
+
+    async def test_toggle_twice_stops_early_and_writes_profile(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            toggle = ProfilerToggle(seconds=60, output_dir=output_dir, interval_ms=1)
+            toggle.toggle()
+            await asyncio.sleep(0.05)
+            toggle.toggle()
+            path = await asyncio.wait_for(toggle.task, timeout=5)
+
+            self.assertTrue(path.endswith(".speedscope.json"))
+            with open(path) as f:
+                self.assertEqual("ronnia", json.load(f)["exporter"])
+            self.assertEqual([os.path.basename(path)], os.listdir(output_dir))
+
+
+class TestAdaptiveSampler(unittest.TestCase):
+
+    def test_rate_follows_traffic(self):
+        sampler = AdaptiveSampler(target_per_minute=60, max_rate=1.0, min_rate=0.01)
+        start = sampler._window_started
+
+        self.assertEqual(1.0, sampler({}, now=start))
+        for i in range(599):
+            sampler({}, now=start + i * 0.1)
+        # 600 transactions in the last minute, 60 of them should be sampled
+        self.assertAlmostEqual(0.1, sampler({}, now=start + 60), places=2)
+
+        # Nothing happened in the next window
+        self.assertEqual(1.0, sampler({}, now=start + 121))
+
+    def test_rate_is_bounded(self):
+        sampler = AdaptiveSampler(target_per_minute=1, max_rate=0.5, min_rate=0.01)
+        start = sampler._window_started
+        for i in range(10_000):
+            sampler({}, now=start)
+
+        self.assertEqual(0.01, sampler({}, now=start + 60))
+
+    def test_parent_decision_is_kept(self):
+        sampler = AdaptiveSampler(target_per_minute=1, max_rate=0.5)
+
+        self.assertEqual(1.0, sampler({"parent_sampled": True}))
+        self.assertEqual(0.0, sampler({"parent_sampled": False}))
@@ -0,0 +1,70 @@
+import asyncio
+import unittest
+
+from ronnia.utils.scheduler import FairScheduler, parse_weights
+
+
+class TestFairScheduler(unittest.IsolatedAsyncioTestCase):
+
+    @staticmethod
+    def drain(scheduler: FairScheduler) -> list:
+        order = []
+        while len(scheduler):
+            key, _, item = scheduler._next()
+            order.append(item)
+        return order
+
+    async def test_burst_does_not_delay_other_keys(self):
+        scheduler = FairScheduler(handler=None)
+        for i in range(100):
+            scheduler.submit("raid", f"raid-{i}")
+        scheduler.submit("small_a", "a-0")
+        scheduler.submit("small_b", "b-0")
+
+        order = self.drain(scheduler)
+
+        self.assertEqual(["raid-0", "a-0", "b-0", "raid-1"], order[:4])
+
+    async def test_weights_share_rounds(self):
+        scheduler = FairScheduler(handler=None, weights={"heavy": 2, "light": 0.5})
+        for i in range(8):
+            scheduler.submit("heavy", "heavy")
+            scheduler.submit("light", "light")
+            scheduler.submit("normal", "normal")
+
+        order = self.drain(scheduler)[:14]
+
+        self.assertEqual(8, order.count("heavy"))
+        self.assertEqual(4, order.count("normal"))
+        self.assertEqual(2, order.count("light"))
+
+    async def test_full_queue_drops_items(self):
+        scheduler = FairScheduler(handler=None, max_queue_size=2)
+
+        self.assertTrue(scheduler.submit("raid", 1))
+        self.assertTrue(scheduler.submit("raid", 2))
+        self.assertFalse(scheduler.submit("raid", 3))
+        self.assertTrue(scheduler.submit("small", 1))
+        self.assertEqual(1, scheduler.dropped)
+
+    async def test_run_processes_items_and_survives_errors(self):
+        processed = []
+
+        async def handler(item):
+            if item == "bad":
+                raise ValueError(item)
+            processed.append(item)
+
+        scheduler = FairScheduler(handler=handler, workers=2)
+        task = asyncio.create_task(scheduler.run())
+        for item in ("first", "bad", "second"):
+            scheduler.submit("channel", item)
+        await asyncio.sleep(0.01)
+        task.cancel()
+
+        self.assertEqual(["first", "second"], processed)
+        self.assertEqual(3, scheduler.wait_ms.count)
+
+    def test_parse_weights(self):
+        self.assertEqual({"heyronii": 2.0, "other": 0.5}, parse_weights("heyronii:2, other:0.5"))
+        self.assertEqual({}, parse_weights(None))
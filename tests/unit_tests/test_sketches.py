@@ -0,0 +1,81 @@
+import random
+import unittest
+
+from ronnia.utils.sketches import HyperLogLog, SpaceSaving
+
+
+class TestHyperLogLog(unittest.TestCase):
+
+    def test_count_is_close_to_cardinality(self):
+        hll = HyperLogLog()
+        for requester_id in range(50_000):
+            hll.add(requester_id)
+            hll.add(requester_id)
+
+        self.assertAlmostEqual(50_000, hll.count(), delta=50_000 * 0.05)
+
+    def test_count_is_exact_enough_for_small_cardinalities(self):
+        hll = HyperLogLog()
+        for requester_id in range(10):
+            hll.add(requester_id)
+
+        self.assertEqual(10, hll.count())
+
+    def test_merge_counts_union(self):
+        first, second = HyperLogLog(), HyperLogLog()
+        for requester_id in range(0, 3000):
+            first.add(requester_id)
+        for requester_id in range(2000, 5000):
+            second.add(requester_id)
+
+        first.merge(HyperLogLog.from_bytes(second.to_bytes()))
+
+        self.assertAlmostEqual(5000, first.count(), delta=5000 * 0.05)
+
+
+class TestSpaceSaving(unittest.TestCase):
+
+    def setUp(self) -> None:
+        rng = random.Random(42)
+        # Beatmap 1 is requested the most, then 2 and 3, then a long tail
+        self.requests = [1] * 500 + [2] * 300 + [3] * 200 + [rng.randint(100, 10_000) for _ in range(3000)]
+        rng.shuffle(self.requests)
+
+    def test_top_keeps_heavy_hitters(self):
+        summary = SpaceSaving(capacity=50)
+        for beatmap_id in self.requests:
+            summary.add(beatmap_id)
+
+        self.assertEqual([1, 2, 3], [beatmap_id for beatmap_id, _ in summary.top(3)])
+        self.assertEqual(50, len(summary))
+
+    def test_merge_of_split_streams_keeps_heavy_hitters(self):
+        first, second = SpaceSaving(capacity=50), SpaceSaving(capacity=50)
+        for i, beatmap_id in enumerate(self.requests):
+            (first if i % 2 else second).add(beatmap_id)
+
+        first.merge(SpaceSaving.from_bytes(second.to_bytes()))
+
+        top = first.top(3)
+        self.assertEqual([1, 2, 3], [beatmap_id for beatmap_id, _ in top])
+        self.assertGreaterEqual(top[0][1], 500)
+
+    def test_evicts_the_least_counted_item(self):
+        # Reference summary that scans every counter for the minimum
+        expected: dict[int, list[int]] = {}
+        summary = SpaceSaving(capacity=20)
+        for beatmap_id in self.requests:
+            summary.add(beatmap_id)
+            if beatmap_id in expected:
+                expected[beatmap_id][0] += 1
+            elif len(expected) < 20:
+                expected[beatmap_id] = [1, 0]
+            else:
+                min_count = min(count for count, _ in expected.values())
+                # Any of the least counted items may be evicted, use the one the summary kept out
+                min_item = next(item for item, (count, _) in expected.items()
+                                if count == min_count and item not in summary.counters)
+                del expected[min_item]
+                expected[beatmap_id] = [min_count + 1, min_count]
+
+            self.assertEqual(expected, summary.counters)
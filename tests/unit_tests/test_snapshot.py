@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from ronnia.utils.snapshot import (SnapshotEntry, SnapshotFormatError, decode_snapshot, encode_snapshot,
+                                   read_snapshot, write_snapshot)
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "ronnia.snapshot")
+        self.sections = {
+            "channels": [SnapshotEntry("heyronii", 1000.0), SnapshotEntry("ünicode", 1000.0)],
+            "beatmap_attributes": [SnapshotEntry("2167576:64", 1000.0, b'{"star_rating": 7.5}')],
+            "empty": [],
+        }
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_encode_decode_round_trip(self):
+        created_at, sections = decode_snapshot(encode_snapshot(self.sections, created_at=1000.0))
+
+        self.assertEqual(1000.0, created_at)
+        self.assertEqual(self.sections, sections)
+
+    def test_truncated_snapshot_is_rejected(self):
+        data = encode_snapshot(self.sections)
+
+        with self.assertRaises(SnapshotFormatError):
+            decode_snapshot(data[:-5])
+
+    def test_read_drops_stale_entries(self):
+        self.sections["cooldowns"] = [SnapshotEntry("fresh", 990.0), SnapshotEntry("stale", 100.0)]
+        with open(self.path, "wb") as f:
+            f.write(encode_snapshot(self.sections, created_at=1000.0))
+
+        sections = read_snapshot(self.path, max_age_seconds=60, now=1010.0)
+
+        self.assertEqual([SnapshotEntry("fresh", 990.0)], sections["cooldowns"])
+        self.assertEqual(self.sections["channels"], sections["channels"])
+
+    def test_read_ignores_old_snapshot(self):
+        with open(self.path, "wb") as f:
+            f.write(encode_snapshot(self.sections, created_at=1000.0))
+
+        self.assertEqual({}, read_snapshot(self.path, max_age_seconds=60, now=2000.0))
+
+    def test_read_missing_or_corrupted_snapshot(self):
+        self.assertEqual({}, read_snapshot(self.path, max_age_seconds=60))
+
+        with open(self.path, "wb") as f:
+            f.write(b"not a snapshot")
+        self.assertEqual({}, read_snapshot(self.path, max_age_seconds=60))
+
+    def test_write_snapshot_replaces_file(self):
+        write_snapshot(self.path, {"channels": [SnapshotEntry("old", 0.0)]})
+        write_snapshot(self.path, self.sections)
+
+        self.assertEqual(self.sections, decode_snapshot(open(self.path, "rb").read())[1])
+        self.assertFalse(os.path.exists(f"{self.path}.tmp"))
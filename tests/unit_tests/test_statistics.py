@@ -0,0 +1,123 @@
+import datetime
+import unittest
+from unittest import mock
+
+from pymongo.errors import OperationFailure
+
+from ronnia.clients.mongo import RonniaDatabase
+from ronnia.clients.statistics import StatisticsRollupBuffer
+from ronnia.models.database import DBRequest
+from ronnia.tools.migrate_statistics import LEGACY_INDEX_NAME, StatisticsMigrator
+from ronnia.utils.cache import AsyncLRUCache
+
+
+class FakeCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self.operations = []
+
+    async def bulk_write(self, operations, ordered=True):
+        self.operations.extend(operations)
+
+
+class TestStatisticsRollupBuffer(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.channel_daily_col = FakeCollection("StatisticsChannelDaily")
+        self.beatmap_daily_col = FakeCollection("StatisticsBeatmapDaily")
+        self.channel_hourly_col = FakeCollection("StatisticsChannelHourly")
+        self.buffer = StatisticsRollupBuffer(self.channel_daily_col, self.beatmap_daily_col,
+                                             self.channel_hourly_col, max_pending_keys=5)
+        self.timestamp = datetime.datetime(2024, 5, 4, 13, 37, 12, tzinfo=datetime.timezone.utc)
+
+    async def test_flush_merges_requests_into_one_increment_per_bucket(self):
+        for _ in range(3):
+            self.buffer.add(12345, 1170505, self.timestamp)
+        await self.buffer.flush()
+
+        self.assertEqual(1, len(self.beatmap_daily_col.operations))
+        operation = self.beatmap_daily_col.operations[0]
+        self.assertEqual({"beatmap_id": 1170505, "day": datetime.datetime(2024, 5, 4, tzinfo=datetime.timezone.utc)},
+                         operation._filter)
+        self.assertEqual({"$inc": {"count": 3}}, operation._doc)
+        self.assertEqual({"channel": 12345, "hour": self.timestamp.replace(minute=0, second=0)},
+                         self.channel_hourly_col.operations[0]._filter)
+        self.assertEqual(0, len(self.buffer))
+
+    def test_add_asks_for_flush_when_buffer_is_full(self):
+        self.assertFalse(self.buffer.add(12345, 1, self.timestamp))
+        self.assertTrue(self.buffer.add(12345, 2, self.timestamp + datetime.timedelta(hours=1)))
+
+
+class TestStatisticsMigration(unittest.TestCase):
+
+    def test_migrate_document_uses_compact_schema(self):
+        migrator = StatisticsMigrator.__new__(StatisticsMigrator)
+        migrator.twitch_ids = AsyncLRUCache()
+        migrator.twitch_ids.set("heyronii", 12345)
+        migrator.twitch_ids.set("deleted_user", None)
+        legacy_doc = {"requester_channel_name": "deleted_user", "requested_beatmap_id": 1170505,
+                      "requested_channel_name": "heyronii", "mods": "+HDDT",
+                      "timestamp": datetime.datetime(2024, 5, 4, 13, 37)}
+
+        request_doc = migrator.migrate_document(legacy_doc).model_dump(by_alias=True, exclude_none=True)
+
+        self.assertEqual({"b": 1170505, "c": 12345, "m": 72, "rn": "deleted_user",
+                          "t": datetime.datetime(2024, 5, 4, 13, 37, tzinfo=datetime.timezone.utc)}, request_doc)
+
+    def test_decode_request_returns_readable_request(self):
+        request = DBRequest.model_validate({"b": 1170505, "c": 12345, "r": 678, "m": 72,
+                                            "t": datetime.datetime(2024, 5, 4, 13, 37)})
+
+        decoded = RonniaDatabase.decode_request(request)
+
+        self.assertEqual("+HDDT", decoded["mods"])
+        self.assertEqual(12345, decoded["requested_channel_id"])
+        self.assertEqual(678, decoded["requester_twitch_id"])
+
+
+class TestStatisticsMigrator(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.db_client = mock.MagicMock()
+        self.db_client.bulk_write_operations = mock.AsyncMock()
+        self.db_client.rollup_buffer.flush = mock.AsyncMock()
+        self.db_client.statistics_col.count_documents = mock.AsyncMock(return_value=0)
+        self.db_client.statistics_col.drop_index = mock.AsyncMock()
+        self.legacy_docs = [{"_id": i, "requester_channel_name": "chatter", "requested_beatmap_id": 1170505,
+                             "requested_channel_name": "heyronii", "mods": "",
+                             "timestamp": datetime.datetime(2024, 5, 4, 13, 37)} for i in range(3)]
+
+    def create_migrator(self, **kwargs) -> StatisticsMigrator:
+        migrator = StatisticsMigrator(self.db_client, **kwargs)
+        migrator.twitch_ids.set("heyronii", 12345)
+        migrator.twitch_ids.set("chatter", 678)
+        return migrator
+
+    async def test_migrated_requests_are_not_counted_into_rollups_by_default(self):
+        await self.create_migrator().migrate_batch(self.legacy_docs)
+
+        self.assertEqual(3, len(self.db_client.bulk_write_operations.await_args.kwargs["operations"]))
+        self.db_client.rollup_buffer.add.assert_not_called()
+        self.db_client.rollup_buffer.flush.assert_not_awaited()
+
+    async def test_migrated_requests_are_counted_into_rollups_when_enabled(self):
+        await self.create_migrator(update_rollups=True).migrate_batch(self.legacy_docs)
+
+        self.assertEqual(3, self.db_client.rollup_buffer.add.call_count)
+        self.db_client.rollup_buffer.flush.assert_awaited_once()
+
+    async def test_legacy_index_is_kept_while_legacy_documents_are_left(self):
+        self.db_client.statistics_col.count_documents.return_value = 1
+
+        self.assertFalse(await self.create_migrator().drop_legacy_index())
+        self.db_client.statistics_col.drop_index.assert_not_awaited()
+
+    async def test_legacy_index_is_dropped_once_migrated(self):
+        self.assertTrue(await self.create_migrator().drop_legacy_index())
+        self.db_client.statistics_col.drop_index.assert_awaited_once_with(LEGACY_INDEX_NAME)
+
+    async def test_missing_legacy_index_counts_as_dropped(self):
+        self.db_client.statistics_col.drop_index.side_effect = OperationFailure("index not found", code=27)
+
+        self.assertTrue(await self.create_migrator().drop_legacy_index())
@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from ronnia.clients.transport import HttpTransport, CircuitOpenError, CircuitBreaker
+
+
+class TestHttpTransport(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.responses = []
+        self.requests = 0
+
+        async def handler(request: web.Request):
+            self.requests += 1
+            status, delay = self.responses.pop(0) if self.responses else (200, 0)
+            await asyncio.sleep(delay)
+            return web.json_response({"requests": self.requests}, status=status)
+
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        self.transport = HttpTransport(retry_attempts=3, retry_max_wait=0.01, circuit_failure_threshold=3,
+                                       circuit_reset_seconds=60, metrics_name=None,
+                                       endpoint_timeouts={"slow": aiohttp.ClientTimeout(total=0.1)})
+
+    async def asyncTearDown(self) -> None:
+        await self.transport.close()
+        await self.server.close()
+
+    def url(self, path: str = "/") -> str:
+        return str(self.server.make_url(path))
+
+    async def test_request_returns_json(self):
+        response = await self.transport.request("GET", self.url())
+
+        self.assertEqual(200, response.status)
+        self.assertEqual({"requests": 1}, response.data)
+
+    async def test_request_retries_retryable_statuses(self):
+        self.responses = [(503, 0), (502, 0)]
+
+        response = await self.transport.request("GET", self.url())
+
+        self.assertEqual(200, response.status)
+        self.assertEqual(3, self.requests)
+
+    async def test_non_idempotent_request_is_not_retried_after_server_error(self):
+        self.responses = [(503, 0)]
+
+        response = await self.transport.request("POST", self.url("/chat/new"))
+
+        self.assertEqual(503, response.status)
+        self.assertEqual(1, self.requests)
+
+    async def test_request_times_out_with_endpoint_timeout(self):
+        self.responses = [(200, 1), (200, 1), (200, 1)]
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.transport.request("GET", self.url(), endpoint="slow")
+
+    async def test_circuit_opens_and_fails_fast(self):
+        self.responses = [(500, 0)] * 3
+
+        await self.transport.request("GET", self.url())
+        with self.assertRaises(CircuitOpenError):
+            await self.transport.request("GET", self.url())
+
+        self.assertEqual(3, self.requests)
+
+    async def test_cancelled_trial_request_does_not_block_the_circuit(self):
+        circuit_breaker = self.transport.get_circuit_breaker(self.server.host)
+        circuit_breaker.reset_seconds = 0
+        for _ in range(3):
+            circuit_breaker.record_failure()
+        self.responses = [(200, 1)]
+
+        trial = asyncio.create_task(self.transport.request("GET", self.url()))
+        while self.requests == 0:
+            await asyncio.sleep(0.01)
+        trial.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await trial
+
+        response = await self.transport.request("GET", self.url())
+        self.assertEqual(200, response.status)
+        self.assertEqual("closed", circuit_breaker.state)
+
+    async def test_rate_limited_trial_request_does_not_block_the_circuit(self):
+        circuit_breaker = self.transport.get_circuit_breaker(self.server.host)
+        circuit_breaker.reset_seconds = 0
+        for _ in range(3):
+            circuit_breaker.record_failure()
+        self.responses = [(429, 0)]
+
+        # The 429 is retried as a new trial
+        response = await self.transport.request("GET", self.url())
+
+        self.assertEqual(200, response.status)
+        self.assertEqual(2, self.requests)
+        self.assertEqual("closed", circuit_breaker.state)
+
+    async def test_metrics_count_reused_connections(self):
+        for _ in range(3):
+            await self.transport.request("GET", self.url())
+
+        host_metrics = self.transport.metrics()[self.server.host]
+        self.assertEqual(3, host_metrics["requests"])
+        self.assertEqual(1, host_metrics["new_connections"])
+        self.assertEqual(2, host_metrics["reused_connections"])
+        self.assertEqual("closed", host_metrics["circuit"])
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_half_open_circuit_lets_one_trial_request_through(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+        circuit_breaker.record_failure()
+
+        self.assertTrue(circuit_breaker.allow_request())
+        self.assertFalse(circuit_breaker.allow_request())
+
+        circuit_breaker.record_success()
+        self.assertEqual("closed", circuit_breaker.state)
@@ -0,0 +1,364 @@
+import asyncio
+import datetime
+import os
+import tempfile
+import unittest
+from collections import Counter
+from types import SimpleNamespace
+from unittest import mock
+
+from ronnia.bots.bot_manager import ChannelPresence
+from ronnia.bots.twitch_bot import DigestedRequest, TwitchBot
+from ronnia.clients.mongo import BEATMAP_EXPIRE_SECONDS, BEATMAP_MAX_STALE_SECONDS, RonniaDatabase
+from ronnia.models.beatmap import Beatmap, BeatmapType
+from ronnia.utils.beatmap import BeatmapParser
+from ronnia.utils.cache import AsyncLRUCache
+from ronnia.utils.digest import DigestBuffer
+from ronnia.utils.scheduler import FairScheduler
+from ronnia.utils.snapshot import SnapshotEntry, encode_snapshot, read_snapshot
+
+
+def make_beatmap_info(beatmap_id: int, difficulty_rating: float = 5.0, age_seconds: float = 0) -> dict:
+    updated_at = datetime.datetime.now(tz=datetime.timezone.utc) - datetime.timedelta(seconds=age_seconds)
+    beatmapset = {"id": beatmap_id // 10, "artist": f"Artist {beatmap_id}", "title": f"Title {beatmap_id}"}
+    return {"id": beatmap_id, "beatmapset_id": beatmap_id // 10, "version": "Insane", "bpm": 180,
+            "status": "ranked", "difficulty_rating": difficulty_rating, "hit_length": 90,
+            "beatmapset": beatmapset, "ronnia_updated_at": updated_at}
+
+
+def make_message(content: str) -> mock.MagicMock:
+    message = mock.MagicMock()
+    message.content = content
+    message.channel.name = "heyronii"
+    message.channel.send = mock.AsyncMock()
+    message.author.name = "chatter"
+    message.author.id = "42"
+    message.author.is_mod = False
+    message.author.is_subscriber = False
+    message.author.badges = {}
+    message.tags = {"room-id": "7"}
+    return message
+
+
+class TestTwitchBotRequests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.bot = TwitchBot.__new__(TwitchBot)
+        self.bot.environment = None
+        self.bot._beatmap_refresh_tasks = {}
+        self.bot.beatmap_attributes_cache = AsyncLRUCache()
+        self.bot.ronnia_db = mock.AsyncMock()
+        self.bot.ronnia_db.get_beatmap_age = RonniaDatabase.get_beatmap_age
+        self.bot.ronnia_db.get_test_status.return_value = False
+        self.bot.ronnia_db.get_echo_status.return_value = True
+        self.settings = {"sr": [0, 6], "digest": False}
+        self.bot.ronnia_db.get_setting.side_effect = (
+            lambda setting_key, twitch_username_or_id: self.settings[setting_key]
+        )
+        self.bot.ronnia_db.get_user_from_twitch_username.return_value = mock.MagicMock(osuId=99)
+        self.bot.osu_api = mock.AsyncMock()
+        self.bot.osu_chat_api = mock.AsyncMock()
+        self.bot.check_requester_criteria = mock.AsyncMock()
+        self.bot.request_digest = DigestBuffer(self.bot._send_digest_to_in_game, rate_per_minute=3,
+                                               window_seconds=30)
+
+    async def test_stale_beatmap_is_served_and_refreshed_in_background(self):
+        stale = make_beatmap_info(10, age_seconds=BEATMAP_EXPIRE_SECONDS + 1)
+        self.bot.ronnia_db.get_beatmap.return_value = stale
+        refreshed = make_beatmap_info(10, difficulty_rating=5.5)
+        release = asyncio.Event()
+
+        async def get_beatmap(beatmap):
+            await release.wait()
+            return refreshed, refreshed["beatmapset"]
+
+        self.bot.osu_api.get_beatmap.side_effect = get_beatmap
+        beatmap = Beatmap(id=10, type=BeatmapType.MAP, mods="")
+
+        first = await self.bot.get_beatmap(beatmap)
+        second = await self.bot.get_beatmap(beatmap)
+
+        self.assertEqual((stale, stale["beatmapset"]), first)
+        self.assertEqual((stale, stale["beatmapset"]), second)
+        # The second stale read finds the refresh in flight and doesn't start another one
+        self.assertEqual([10], list(self.bot._beatmap_refresh_tasks))
+        release.set()
+        await self.bot._beatmap_refresh_tasks[10]
+        await asyncio.sleep(0)
+
+        self.bot.osu_api.get_beatmap.assert_awaited_once()
+        self.bot.ronnia_db.add_beatmap.assert_awaited_once_with(refreshed, refreshed["beatmapset"])
+        self.assertEqual({}, self.bot._beatmap_refresh_tasks)
+
+    async def test_too_old_beatmap_is_fetched_before_serving(self):
+        self.bot.ronnia_db.get_beatmap.return_value = make_beatmap_info(10, age_seconds=BEATMAP_MAX_STALE_SECONDS + 1)
+        fresh = make_beatmap_info(10, difficulty_rating=5.5)
+        self.bot.osu_api.get_beatmap.return_value = (fresh, fresh["beatmapset"])
+
+        beatmap_info, beatmapset_info = await self.bot.get_beatmap(Beatmap(id=10, type=BeatmapType.MAP, mods=""))
+
+        self.assertIs(fresh, beatmap_info)
+        self.bot.osu_api.get_beatmap.assert_awaited_once()
+        self.assertEqual({}, self.bot._beatmap_refresh_tasks)
+
+    async def test_failed_background_refresh_keeps_cached_beatmap(self):
+        stale = make_beatmap_info(10, age_seconds=BEATMAP_EXPIRE_SECONDS + 1)
+        self.bot.ronnia_db.get_beatmap.return_value = stale
+        self.bot.osu_api.get_beatmap.side_effect = ConnectionError("osu! api is down")
+        beatmap = Beatmap(id=10, type=BeatmapType.MAP, mods="")
+
+        with self.assertLogs("ronnia", level="WARNING"):
+            await self.bot.get_beatmap(beatmap)
+            await asyncio.gather(*self.bot._beatmap_refresh_tasks.values(), return_exceptions=True)
+            await asyncio.sleep(0)
+
+        self.bot.ronnia_db.add_beatmap.assert_not_awaited()
+        self.assertEqual({}, self.bot._beatmap_refresh_tasks)
+        # The next request is served from the cache again and retries the refresh
+        self.assertEqual((stale, stale["beatmapset"]), await self.bot.get_beatmap(beatmap))
+        self.assertEqual([10], list(self.bot._beatmap_refresh_tasks))
+        await asyncio.gather(*self.bot._beatmap_refresh_tasks.values(), return_exceptions=True)
+
+    async def test_double_time_request_uses_attributes_and_is_rejected(self):
+        self.bot.ronnia_db.get_beatmap_attributes.return_value = None
+        self.bot.osu_api.get_beatmap_attributes.return_value = {"attributes": {"star_rating": 7.2}}
+        message = make_message("https://osu.ppy.sh/b/10 +HDDT")
+
+        with self.assertRaisesRegex(AssertionError, "Your map is 7.2\\* with \\+HDDT"):
+            await self.bot.check_beatmap_star_rating(message, make_beatmap_info(10), given_mods="+HDDT")
+        await asyncio.sleep(0)
+
+        self.bot.osu_api.get_beatmap_attributes.assert_awaited_once_with(beatmap_id=10, mods=64)
+        self.bot.ronnia_db.add_beatmap_attributes.assert_awaited_once_with(10, 64, {"star_rating": 7.2})
+
+    async def test_nomod_star_rating_needs_no_attributes(self):
+        message = make_message("https://osu.ppy.sh/b/10 +HD")
+
+        await self.bot.check_beatmap_star_rating(message, make_beatmap_info(10), given_mods="+HD")
+
+        self.bot.ronnia_db.get_beatmap_attributes.assert_not_awaited()
+        self.bot.osu_api.get_beatmap_attributes.assert_not_awaited()
+
+    async def test_concurrent_star_rating_lookups_share_one_request(self):
+        self.bot.ronnia_db.get_beatmap_attributes.return_value = None
+
+        async def get_beatmap_attributes(beatmap_id, mods):
+            await asyncio.sleep(0.01)
+            return {"attributes": {"star_rating": 6.5}}
+
+        self.bot.osu_api.get_beatmap_attributes.side_effect = get_beatmap_attributes
+        beatmap_info = make_beatmap_info(10)
+
+        ratings = await asyncio.gather(*(self.bot.get_star_rating(beatmap_info, "+DT") for _ in range(5)),
+                                       self.bot.get_star_rating(beatmap_info, "+NC"))
+
+        self.assertEqual([6.5] * 6, ratings)
+        self.bot.osu_api.get_beatmap_attributes.assert_awaited_once()
+        self.bot.ronnia_db.get_beatmap_attributes.assert_awaited_once()
+
+    async def test_get_beatmaps_batches_database_and_api_lookups(self):
+        self.bot.ronnia_db.get_beatmaps.return_value = [
+            make_beatmap_info(10),
+            make_beatmap_info(30, age_seconds=BEATMAP_MAX_STALE_SECONDS + 1),
+        ]
+        self.bot.osu_api.get_beatmaps.return_value = [make_beatmap_info(20), make_beatmap_info(30)]
+        beatmaps = [Beatmap(id=beatmap_id, type=BeatmapType.MAP, mods="") for beatmap_id in (30, 10, 20, 40)]
+
+        requested = await self.bot.get_beatmaps(beatmaps)
+        await asyncio.sleep(0)
+
+        self.assertEqual([30, 10, 20], [beatmap_info["id"] for _, beatmap_info, _ in requested])
+        self.bot.ronnia_db.get_beatmaps.assert_awaited_once()
+        self.bot.osu_api.get_beatmaps.assert_awaited_once_with([30, 20, 40])
+        self.bot.ronnia_db.add_beatmaps.assert_awaited_once()
+
+    async def test_get_beatmaps_picks_the_default_difficulty_of_beatmapsets(self):
+        self.bot.ronnia_db.get_beatmaps.return_value = [
+            make_beatmap_info(11) | {"beatmapset_default": False},
+            make_beatmap_info(12) | {"beatmapset_default": True},
+        ]
+
+        requested = await self.bot.get_beatmaps([Beatmap(id=1, type=BeatmapType.MAPSET, mods="")])
+
+        self.assertEqual([12], [beatmap_info["id"] for _, beatmap_info, _ in requested])
+        self.bot.osu_api.get_beatmaps.assert_not_awaited()
+
+    async def test_multi_request_is_checked_once_and_sent_grouped(self):
+        self.bot.ronnia_db.get_beatmaps.return_value = [make_beatmap_info(beatmap_id) for beatmap_id in (10, 20, 30)]
+        message = make_message("https://osu.ppy.sh/b/10 +HD https://osu.ppy.sh/b/20 https://osu.ppy.sh/b/30")
+
+        await self.bot.handle_multi_request(message, BeatmapParser.parse_beatmap_links(message.content, limit=5))
+
+        self.bot.check_requester_criteria.assert_awaited_once_with(message)
+        self.bot.osu_chat_api.send_message.assert_awaited_once()
+        irc_message = self.bot.osu_chat_api.send_message.await_args.kwargs["message"]
+        self.assertEqual(3, irc_message.count("https://osu.ppy.sh/b/"))
+        self.assertTrue(irc_message.startswith("chatter -> [Ranked] [https://osu.ppy.sh/b/10 "))
+        message.channel.send.assert_awaited_once()
+        self.bot.ronnia_db.add_requests.assert_awaited_once_with(
+            requester_twitch_id=42, requested_channel_id=7, beatmaps=[(10, 8), (20, 0), (30, 0)])
+
+    async def test_multi_request_skips_beatmaps_out_of_star_range(self):
+        self.bot.ronnia_db.get_beatmaps.return_value = [make_beatmap_info(10, difficulty_rating=7.5),
+                                                        make_beatmap_info(20)]
+        message = make_message("https://osu.ppy.sh/b/10 https://osu.ppy.sh/b/20")
+
+        await self.bot.handle_multi_request(message, BeatmapParser.parse_beatmap_links(message.content, limit=5))
+
+        irc_message = self.bot.osu_chat_api.send_message.await_args.kwargs["message"]
+        self.assertNotIn("https://osu.ppy.sh/b/10 ", irc_message)
+        self.assertIn("Skipped 1 of your 2 maps", message.channel.send.await_args_list[0].args[0])
+        self.bot.ronnia_db.add_requests.assert_awaited_once_with(
+            requester_twitch_id=42, requested_channel_id=7, beatmaps=[(20, 0)])
+
+    @mock.patch("ronnia.bots.twitch_bot.MULTI_LINK_REQUESTS", True)
+    async def test_links_are_parsed_once_and_passed_to_the_handler(self):
+        self.bot.request_scheduler = FairScheduler(self.bot.process_request)
+        self.bot.chat_capture = None
+        self.bot._first_message_logged = True
+        self.bot.handle_request = mock.AsyncMock()
+        message = make_message("https://osu.ppy.sh/b/10 +HD https://osu.ppy.sh/b/10")
+
+        with mock.patch.object(BeatmapParser, "parse_beatmap_links",
+                               wraps=BeatmapParser.parse_beatmap_links) as parse_beatmap_links:
+            await self.bot.event_message(message)
+            await self.bot.process_request(self.bot.request_scheduler._queues["heyronii"][0][1])
+
+        parse_beatmap_links.assert_called_once()
+        self.bot.handle_request.assert_awaited_once_with(message, Beatmap(id=10, type=BeatmapType.MAP,
+                                                                          mods="+HD", mods_bitmask=8))
+        self.bot.ronnia_db.get_beatmaps.assert_not_awaited()
+
+    async def test_grouped_irc_messages_are_split_when_too_long(self):
+        message = make_message("")
+        message.tags["custom-reward-id"] = "abc"
+        requested = [(Beatmap(id=beatmap_id, type=BeatmapType.MAP, mods=""), make_beatmap_info(beatmap_id),
+                      make_beatmap_info(beatmap_id)["beatmapset"]) for beatmap_id in (10, 20, 30)]
+
+        irc_messages = TwitchBot._prepare_grouped_irc_messages(message, requested, max_length=250)
+
+        self.assertEqual(2, len(irc_messages))
+        self.assertTrue(all(len(irc_message) <= 250 for irc_message in irc_messages))
+        self.assertTrue(all(irc_message.endswith(" + USED POINTS") for irc_message in irc_messages))
+
+    async def test_single_irc_message_format_is_unchanged(self):
+        beatmap_info = make_beatmap_info(10)
+
+        irc_message = await TwitchBot._prepare_irc_message(make_message(""), beatmap_info,
+                                                           beatmap_info["beatmapset"], "+HD")
+
+        self.assertEqual("chatter -> [Ranked] [https://osu.ppy.sh/b/10 Artist 10 - Title 10 [Insane]] "
+                         "(180 BPM, 5.00*, 1:30) +HD ", irc_message)
+
+    async def test_busy_channel_with_digest_gets_one_summary(self):
+        self.settings["digest"] = True
+        requesters = ["alice", "bob", "carol", "dave", "erin"]
+        for i, requester in enumerate(requesters):
+            message = make_message("")
+            message.author.name = requester
+            message.author.is_mod = requester == "bob"
+            beatmap_info = make_beatmap_info(20 if i % 2 else 10)
+            await self.bot._deliver_in_game(message, [(Beatmap(id=beatmap_info["id"], type=BeatmapType.MAP,
+                                                                mods="+HD" if requester == "erin" else ""),
+                                                        beatmap_info, beatmap_info["beatmapset"])])
+
+        # The first two requests are below the digest rate and delivered right away
+        self.assertEqual(2, self.bot.osu_chat_api.send_message.await_count)
+        self.assertEqual(3, len(self.bot.request_digest))
+
+        await self.bot.request_digest.flush_due(now=float("inf"))
+
+        self.assertEqual(3, self.bot.osu_chat_api.send_message.await_count)
+        digest = self.bot.osu_chat_api.send_message.await_args.kwargs["message"]
+        self.assertTrue(digest.startswith("Digest of 3 requests -> [Ranked] [https://osu.ppy.sh/b/10 "))
+        self.assertIn("x2: carol, erin +HD | [Ranked] [https://osu.ppy.sh/b/20 ", digest)
+        self.assertTrue(digest.endswith("x1: dave"))
+
+    async def test_busy_channel_without_digest_is_not_buffered(self):
+        for _ in range(5):
+            beatmap_info = make_beatmap_info(10)
+            await self.bot._deliver_in_game(make_message(""), [(Beatmap(id=10, type=BeatmapType.MAP, mods=""),
+                                                                beatmap_info, beatmap_info["beatmapset"])])
+
+        self.assertEqual(5, self.bot.osu_chat_api.send_message.await_count)
+        self.assertEqual(0, len(self.bot.request_digest))
+        self.assertNotIn("heyronii", self.bot.request_digest._arrivals)
+
+    async def test_multi_request_counts_each_beatmap_towards_the_digest_rate(self):
+        self.settings["digest"] = True
+        requested = [(Beatmap(id=beatmap_id, type=BeatmapType.MAP, mods=""), make_beatmap_info(beatmap_id),
+                      make_beatmap_info(beatmap_id)["beatmapset"]) for beatmap_id in (10, 20, 30)]
+
+        await self.bot._deliver_in_game(make_message(""), requested)
+
+        self.assertEqual(3, len(self.bot.request_digest))
+
+    def test_digest_lists_top_maps_with_annotations(self):
+        digested = []
+        for beatmap_id, requesters in [(10, 1), (20, 3), (30, 2), (40, 1)]:
+            beatmap_info = make_beatmap_info(beatmap_id)
+            for i in range(requesters):
+                digested.append(DigestedRequest("[SUB] " if i == 0 else "", f"chatter_{i}",
+                                                "+ USED POINTS" if i == 1 else "", "", beatmap_info,
+                                                beatmap_info["beatmapset"]))
+        # The same chatter requesting a map twice counts once
+        digested.append(digested[-1])
+
+        irc_messages = TwitchBot._prepare_digest_irc_messages(digested, max_maps=2, max_length=1000)
+
+        self.assertEqual(1, len(irc_messages))
+        self.assertTrue(irc_messages[0].startswith("Digest of 8 requests -> [Ranked] [https://osu.ppy.sh/b/20 "))
+        self.assertIn("x3: [SUB] chatter_0, chatter_1 + USED POINTS, chatter_2 | "
+                      "[Ranked] [https://osu.ppy.sh/b/30 ", irc_messages[0])
+        self.assertTrue(irc_messages[0].endswith("x2: [SUB] chatter_0, chatter_1 + USED POINTS | and 2 more maps"))
+
+
+class TestTwitchBotSnapshot(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.bot = TwitchBot.__new__(TwitchBot)
+        self.bot.irc_pool = SimpleNamespace(channels=set(), forget=mock.MagicMock())
+        self.bot.user_last_request = {}
+        self.bot.join_fail_channels = Counter()
+        self.bot.join_fail_times = {}
+        self.bot.beatmap_attributes_cache = AsyncLRUCache()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "ronnia.snapshot")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def test_entries_keep_their_own_time_across_restarts(self):
+        now = 10_000.0
+        self.bot.restore_state({
+            "join_failures": [SnapshotEntry("old_failure", now - 3600, b"2"), SnapshotEntry("failure", now - 30, b"1")],
+            "beatmap_attributes": [SnapshotEntry("10:64", now - 3600, b'{"star_rating": 7.2}'),
+                                   SnapshotEntry("20:64", now - 30, b'{"star_rating": 6.1}')],
+        })
+        self.bot.irc_pool.channels = {"old_stream", "live_stream"}
+        channel_last_seen = {"old_stream": now - 3600, "live_stream": now - 30}
+
+        # Saving again doesn't make the restored entries look fresh
+        with open(self.path, "wb") as f:
+            f.write(encode_snapshot(self.bot.snapshot_state(channel_last_seen), created_at=now))
+        snapshot = read_snapshot(self.path, max_age_seconds=600, now=now)
+
+        self.assertEqual([SnapshotEntry("live_stream", now - 30)], snapshot["channels"])
+        self.assertEqual([SnapshotEntry("failure", now - 30, b"1")], snapshot["join_failures"])
+        self.assertEqual(["20:64"], [entry.key for entry in snapshot["beatmap_attributes"]])
+
+    async def test_entries_are_stamped_when_they_change(self):
+        await self.bot.event_channel_join_failure("failure")
+        self.bot.beatmap_attributes_cache.set((10, 64), {"star_rating": 7.2}, inserted_at=1000.0)
+        self.bot.irc_pool.channels = {"live_stream", "offline_stream"}
+        presence = ChannelPresence(part_after_missed_polls=2, grace_seconds=0)
+        presence.update({"live_stream", "offline_stream"}, set(), now=1000.0)
+        # The offline stream stays joined for another poll, but it was last seen in the first one
+        presence.update({"live_stream"}, set(), now=2000.0)
+
+        snapshot = self.bot.snapshot_state(presence.last_seen)
+
+        self.assertEqual({SnapshotEntry("live_stream", 2000.0), SnapshotEntry("offline_stream", 1000.0)},
+                         set(snapshot["channels"]))
+        self.assertEqual(self.bot.join_fail_times["failure"], snapshot["join_failures"][0].timestamp)
+        self.assertEqual(1000.0, snapshot["beatmap_attributes"][0].timestamp)